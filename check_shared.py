@@ -0,0 +1,36 @@
+"""
+Modules shared by the apps. login_sdk and pandora_connect import their modules flat and are frozen
+separately, so each keeps its own copy of a shared module; the copies must stay equal.
+The build scripts of both apps run check() first.
+
+Usage: python check_shared.py - exit 1 when the copies differ.
+"""
+
+import filecmp
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APPS = ('login_sdk', 'pandora_connect')
+SHARED = ('spans.py',)
+
+
+def differing():
+    """Shared modules whose copies differ"""
+    found = []
+    for file_name in SHARED:
+        first, *others = [os.path.join(ROOT, app, file_name) for app in APPS]
+        if not all(filecmp.cmp(first, other, shallow=False) for other in others):
+            found.append(file_name)
+    return found
+
+
+def check():
+    found = differing()
+    if found:
+        sys.exit(f'Copies in {", ".join(APPS)} differ: {", ".join(found)}')
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,108 @@
+"""
+Correctness check of the desktop link index (link_index.LinkIndex): answers and resolver calls with a stub resolver.
+
+Cases (the expected answer):
+    hit   - the link to the target is indexed and unchanged (its path, no link resolved)
+    miss  - no link points to the target (no path, only new or changed links resolved)
+    stale - the indexed link was changed to another target since it was indexed (no path, that link resolved again)
+    gone  - the indexed link was deleted (no path, no link resolved)
+Every run starts from an index saved by an earlier launch and loaded from its file.
+Links are text files holding their target, the stub resolver reads them and counts the calls.
+
+Usage: python bench_link_index.py [-n RUNS] [-l LINKS]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import link_index
+
+
+CASES = ('hit', 'miss', 'stale', 'gone')
+TARGET = r'C:\Program Files\Pandora\rdp_login.exe'
+OTHER = r'C:\Program Files\Other\other.exe'
+LINK = 'Pandora.lnk'
+MTIME = 1700000000
+
+
+class StubResolver:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, link_path):
+        self.calls += 1
+        with open(link_path, 'r') as file:
+            return file.read()
+
+
+def write_link(desktop, file_name, target, mtime):
+    path = os.path.join(desktop, file_name)
+    with open(path, 'w') as file:
+        file.write(target)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def prepare(work_dir, links):
+    """A desktop with the pandora link and links - 1 others, indexed and saved like at the last launch"""
+    desktop = os.path.join(work_dir, 'desktop')
+    os.makedirs(desktop)
+    for number in range(links - 1):
+        write_link(desktop, f'app{number}.lnk', f'C:\\apps\\app{number}.exe', MTIME)
+    write_link(desktop, LINK, TARGET, MTIME)
+    with open(os.path.join(desktop, 'notes.txt'), 'w') as file:
+        file.write('not a link')
+
+    index = link_index.LinkIndex(os.path.join(work_dir, 'links.json'))
+    index.find(desktop, TARGET, StubResolver())
+    index.save()
+    return desktop, index.index_file
+
+
+def check(case, links):
+    """Return the list of broken expectations of one run"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        desktop, index_file = prepare(work_dir, links)
+        expected = ''
+        target = TARGET
+        if case == 'hit':
+            expected = os.path.join(desktop, LINK)
+        elif case == 'miss':
+            target = OTHER
+        elif case == 'stale':
+            write_link(desktop, LINK, OTHER, MTIME + 10)
+        elif case == 'gone':
+            os.remove(os.path.join(desktop, LINK))
+        expected_calls = 1 if case == 'stale' else 0
+
+        index = link_index.LinkIndex(index_file)
+        index.load()
+        resolver = StubResolver()
+        answer = index.find(desktop, target, resolver)
+        errors = []
+        if answer != expected:
+            errors.append(f'answer {answer!r}, expected {expected!r}')
+        if resolver.calls != expected_calls:
+            errors.append(f'{resolver.calls} links resolved, expected {expected_calls}')
+        return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Desktop link index check')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=5, help='Runs per case')
+    parser.add_argument('-l', action='store', dest='links', type=int, default=50, help='Links on the desktop')
+    args = parser.parse_args()
+
+    failed = False
+    for case in CASES:
+        broken = [errors for errors in (check(case, args.links) for _ in range(args.runs)) if errors]
+        print(f'{case:8}{args.runs - len(broken):>4}/{args.runs}  {"; ".join(broken[0]) if broken else ""}')
+        failed = failed or bool(broken)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
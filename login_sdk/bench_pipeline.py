@@ -0,0 +1,158 @@
+"""
+Correctness check of pipeline.Pipeline on the step graph of the rdp connect: order, failure handling and
+log contents; commands are a stub executable sleeping and exiting with a given code.
+
+Scenarios (the expected outcome):
+    ok       - every step succeeds (rdp after map_folder, add_pass and rdp_file; those three run together;
+               cleanup steps after rdp)
+    optional - map_folder fails (rdp still runs, cleanup steps run)
+    critical - rdp_file raises (rdp skipped, cleanup steps run)
+    secret   - add_pass fails (rdp still runs, its command line with the password is not in the log)
+    raises   - rdp raises (cleanup steps still run)
+
+Usage: python bench_pipeline.py [-n RUNS] [--delay SEC]
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import pipeline
+
+
+SCENARIOS = ('ok', 'optional', 'critical', 'secret', 'raises')
+SECRET = 'pass:S3cret-Pa55'
+STUB = '''
+import sys, time
+name, code, delay, events = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+with open(events, 'a') as file:
+    file.write(f'{name} start {time.time()}\\n')
+time.sleep(delay)
+with open(events, 'a') as file:
+    file.write(f'{name} end {time.time()}\\n')
+sys.exit(code)
+'''
+# step: steps that must have ended before it starts
+AFTER = {
+    'rdp': ('map_folder', 'add_pass', 'rdp_file'),
+    'del_pass': ('rdp',),
+    'unmap_folder': ('rdp',),
+}
+CLEANUP = ('del_pass', 'unmap_folder')
+
+
+class Run:
+    """One pipeline run, every step records its start and end in the events file"""
+
+    def __init__(self, work_dir, scenario, delay):
+        self.scenario = scenario
+        self.delay = delay
+        self.stub = os.path.join(work_dir, 'stub.py')
+        self.events_file = os.path.join(work_dir, 'events.txt')
+        with open(self.stub, 'w') as file:
+            file.write(STUB)
+        open(self.events_file, 'w').close()
+
+    def command(self, name, code=0):
+        return [sys.executable, self.stub, name, str(code), str(self.delay), self.events_file]
+
+    def event(self, name, kind):
+        with open(self.events_file, 'a') as file:
+            file.write(f'{name} {kind} {time.time()}\n')
+
+    def function(self, name, raises):
+        def run():
+            self.event(name, 'start')
+            time.sleep(self.delay)
+            self.event(name, 'end')
+            if raises:
+                raise RuntimeError(f'{name} failed')
+            return name
+        return run
+
+    def add_pass_command(self):
+        return self.command('add_pass', 1 if self.scenario == 'secret' else 0) + ['/generic:TERMSRV/vm', SECRET]
+
+    def steps(self):
+        return [
+            pipeline.Step('map_folder', self.command('map_folder', 1 if self.scenario == 'optional' else 0)),
+            pipeline.Step('add_pass', self.add_pass_command, secret=True),
+            pipeline.Step('rdp_file', function=self.function('rdp_file', self.scenario == 'critical'), critical=True),
+            pipeline.Step('rdp', function=self.function('rdp', self.scenario == 'raises'),
+                          requires=('map_folder', 'add_pass', 'rdp_file')),
+            pipeline.Step('del_pass', self.command('del_pass'), cleanup=True),
+            pipeline.Step('unmap_folder', self.command('unmap_folder'), cleanup=True),
+        ]
+
+    def events(self):
+        events = {}
+        with open(self.events_file, 'r') as file:
+            for line in file:
+                name, kind, moment = line.split()
+                events.setdefault(name, {})[kind] = float(moment)
+        return events
+
+    def check(self, results, events, log):
+        """Return the list of broken expectations"""
+        errors = []
+        skipped = self.scenario == 'critical'
+        if results['rdp'].skipped != skipped or ('rdp' in events) == skipped:
+            errors.append('rdp ' + ('not skipped' if skipped else 'skipped'))
+        for name, before in AFTER.items():
+            if name not in events:
+                continue
+            for other in before:
+                if other in events and events[other]['end'] > events[name]['start']:
+                    errors.append(f'{name} started before {other} ended')
+        for name in CLEANUP:
+            if name not in events or not results[name].ok:
+                errors.append(f'cleanup {name} did not run')
+        starts = [events[name]['start'] for name in AFTER['rdp'] if name in events]
+        ends = [events[name]['end'] for name in AFTER['rdp'] if name in events]
+        if starts and max(starts) > min(ends):
+            errors.append('independent steps did not run together')
+        failed = {'optional': 'map_folder', 'critical': 'rdp_file', 'secret': 'add_pass', 'raises': 'rdp'}
+        if self.scenario in failed and results[failed[self.scenario]].ok:
+            errors.append(f'{failed[self.scenario]} did not fail')
+        if SECRET in log:
+            errors.append('secret in the log')
+        return errors
+
+
+def check(scenario, delay):
+    """Return the list of broken expectations of one run"""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    logging.getLogger().addHandler(handler)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            run = Run(work_dir, scenario, delay)
+            results = pipeline.Pipeline(run.steps()).run()
+            return run.check(results, run.events(), stream.getvalue())
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline order and failure handling check')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=3, help='Runs per scenario')
+    parser.add_argument('--delay', action='store', dest='delay', type=float, default=0.2, help='Step duration, sec')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=io.StringIO())     # steps log at info, keep the output clean
+
+    failed = False
+    for scenario in SCENARIOS:
+        errors = [check(scenario, args.delay) for _ in range(args.runs)]
+        broken = [run_errors for run_errors in errors if run_errors]
+        print(f'{scenario:10}{args.runs - len(broken):>4}/{args.runs}  {"; ".join(broken[0]) if broken else ""}')
+        failed = failed or bool(broken)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
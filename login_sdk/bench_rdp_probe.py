@@ -0,0 +1,199 @@
+"""
+Correctness check of the rdp port probe (rdp_probe.RdpProber) against local listeners.
+
+Cases (the expected answer):
+    open         - the port listens (its address, at once)
+    silent_first - the first address does not answer, the next one listens (the next one, after the head start)
+    late         - the port starts listening while the client keeps probing it like RdpConnect does
+                   (None before, its address from the first probe after)
+    reset        - the listener resets every connection it accepts (its address: the handshake completed)
+    closed       - nothing listens on the port (None, at once)
+    silent       - the connection is never accepted (None after the probe timeout)
+The host is not resolved: the prober gets the listener addresses as the resolved ones.
+
+Usage: python bench_rdp_probe.py [-n RUNS] [--timeout SEC]
+"""
+
+import argparse
+import socket
+import struct
+import sys
+import threading
+import time
+
+import rdp_probe
+
+
+CASES = ('open', 'silent_first', 'late', 'reset', 'closed', 'silent')
+HOST = 'rdp.test'
+FAST = rdp_probe.STAGGER_DELAY      # an answer that needs no waiting comes before the head start ends, sec
+LATE_DELAY = 0.3                    # the late listener starts listening after, sec
+PROBE_DELAY = 0.05                  # between probes of the late listener, sec
+
+
+class StubProber(rdp_probe.RdpProber):
+    """RdpProber with fixed addresses instead of the resolver"""
+
+    def __init__(self, addresses, timeout):
+        rdp_probe.RdpProber.__init__(self, timeout=timeout)
+        self.addresses = addresses
+
+    def resolve(self, host):
+        return [(socket.AF_INET, address) for address in self.addresses]
+
+
+class Listeners:
+    """Local sockets for the cases: open, resetting, closed and silent (full backlog, syns are dropped)"""
+
+    def __init__(self):
+        self.sockets = []
+        self.open = self.listen(64)
+        self.reset = self.listen(64)
+        self.silent = self.listen(0)
+        self.closed = self.free_port()
+        self.fill(self.silent)
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.accept, args=(self.open, False), daemon=True),
+            threading.Thread(target=self.accept, args=(self.reset, True), daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def listen(self, backlog):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(backlog)
+        self.sockets.append(sock)
+        return sock.getsockname()
+
+    def fill(self, address):
+        """Take the whole backlog of the listener: later connects get no answer"""
+        for _ in range(4):
+            sock = socket.socket()
+            sock.setblocking(False)
+            sock.connect_ex(address)
+            self.sockets.append(sock)
+        time.sleep(0.1)
+
+    def accept(self, address, reset):
+        """Accept and close connections, so the backlog never fills; reset - close with a RST"""
+        listener = next(sock for sock in self.sockets if sock.getsockname() == address)
+        listener.settimeout(0.1)
+        while self.running:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                continue
+            if reset:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            connection.close()
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()
+
+    def close(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        for sock in self.sockets:
+            sock.close()
+
+
+def probe(addresses, timeout):
+    """(answer, elapsed) of one probe"""
+    start = time.perf_counter()
+    answer = StubProber(addresses, timeout).probe(HOST)
+    return answer, time.perf_counter() - start
+
+
+def check_probe(addresses, expected, timeout, max_time=None, min_time=None):
+    answer, elapsed = probe(addresses, timeout)
+    errors = []
+    if answer != expected:
+        errors.append(f'answer {answer}, expected {expected}')
+    if max_time is not None and elapsed >= max_time:
+        errors.append(f'{elapsed:.3f} s, expected under {max_time:.3f} s')
+    if min_time is not None and elapsed < min_time:
+        errors.append(f'{elapsed:.3f} s, expected at least {min_time:.3f} s')
+    return errors
+
+
+def check_late(timeout):
+    """Probe a bound port until it starts listening LATE_DELAY later"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    address = sock.getsockname()
+    opened = []
+
+    def open_late():
+        time.sleep(LATE_DELAY)
+        sock.listen(64)
+        opened.append(time.perf_counter())
+
+    thread = threading.Thread(target=open_late)
+    thread.start()
+    errors = []
+    found = False
+    try:
+        deadline = time.perf_counter() + LATE_DELAY + timeout + 1
+        while not found and time.perf_counter() < deadline:
+            start = time.perf_counter()
+            answer, _ = probe([address], timeout)
+            listening = bool(opened) and opened[0] < start
+            if answer and not opened:
+                errors.append(f'answer {answer} before the port listened')
+            if listening and answer != address:
+                errors.append(f'answer {answer} from a listening port')
+            found = answer == address
+            time.sleep(PROBE_DELAY)
+    finally:
+        thread.join()
+        sock.close()
+    if not found:
+        errors.append('the port was never found listening')
+    return errors
+
+
+def check(listeners, case, timeout):
+    """Return the list of broken expectations of one run"""
+    if case == 'open':
+        return check_probe([listeners.open], listeners.open, timeout, max_time=FAST)
+    if case == 'silent_first':
+        return check_probe([listeners.silent, listeners.open], listeners.open, timeout,
+                           min_time=rdp_probe.STAGGER_DELAY)
+    if case == 'late':
+        return check_late(timeout)
+    if case == 'reset':
+        return check_probe([listeners.reset], listeners.reset, timeout, max_time=FAST)
+    if case == 'closed':
+        return check_probe([listeners.closed], None, timeout, max_time=FAST)
+    return check_probe([listeners.silent], None, timeout, min_time=timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rdp port probe check')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=20, help='Runs per case')
+    parser.add_argument('--timeout', action='store', dest='timeout', type=float, default=rdp_probe.PROBE_TIMEOUT,
+                        help='Probe timeout, sec')
+    args = parser.parse_args()
+
+    listeners = Listeners()
+    failed = False
+    try:
+        for case in CASES:
+            errors = [check(listeners, case, args.timeout) for _ in range(args.runs)]
+            broken = [run_errors for run_errors in errors if run_errors]
+            print(f'{case:14}{args.runs - len(broken):>4}/{args.runs}  {"; ".join(broken[0]) if broken else ""}')
+            failed = failed or bool(broken)
+    finally:
+        listeners.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Time-to-desktop benchmark of RdpConnect.connect against fake_engine.
+
+Scenarios:
+    cold - no cached token or session, the vm has to be allocated and booted
+    warm - cached token and session, the vm is already up
+    reassigned - cached token and session, but the last vm was given to another user of the pool:
+                 the client must not take it and allocates a new one
+
+Usage: python benchmark.py [-n RUNS] [-s cold,warm] [--boot SEC] [--alloc-delay SEC] [--latency SEC]
+       [--endpoints SEC,SEC] [--pools SEC,SEC] [--pool-hedge SEC] [--json FILE]
+Prints p50/p95 time until connect() reports RDP ready, engine requests and the most allocatevm calls per connect;
+--json saves the same numbers to compare runs. More than one allocatevm per pool and connect fails the run:
+with a slow allocation job (--alloc-delay) the client must wait for it instead of allocating again.
+--endpoints puts engine front ends with these extra latencies into the config, in this order.
+--pools adds pools with these boot times after the main one, the client races all of them,
+--pool-hedge is the delay before the next pool joins the race.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import fake_engine
+
+
+SCENARIOS = ('cold', 'warm', 'reassigned')
+ALLOCATE = 'vmpools/{id}/allocatevm'
+OTHER_USER = 'other'
+USERNAME = 'user'
+PASSWORD = 'password'
+
+
+def prepare(work_dir, engine, pool_names, urls=None, pool_hedge=None):
+    """Lay out res/config.json and user folders like an installed client and move into it"""
+    res_folder = os.path.join(work_dir, 'res')
+    for folder in (res_folder, os.path.join(work_dir, 'home'), os.path.join(work_dir, 'appdata')):
+        os.makedirs(folder, exist_ok=True)
+
+    config = {
+        'main_config': {
+            'pool_name': pool_names,
+            'pandora_api_address': urls or engine.url,
+            'domain': '',
+            'ca_file': 'ca.pem',
+            'icon': 'favicon.ico',
+            'icon_downloads': 'downloads.ico',
+            'rdp_source_file': 'source.rdp',
+            'user_data_folder': 'pandora',
+            'rdp_destination_file': 'pandora.rdp',
+            'user_data': 'user.dat',
+            'shared_disk': 'P:',
+            'shared_folder': 'pandora',
+            'downloads': 'downloads',
+            'profile': 'profile',
+            'link_name': 'downloads',
+            'max_time_launch_vm': 300,
+        },
+        'qt_config': {},
+    }
+    if pool_hedge is not None:
+        config['main_config']['pool_hedge'] = pool_hedge
+    with open(os.path.join(res_folder, 'config.json'), 'w') as file:
+        json.dump(config, file)
+    with open(os.path.join(res_folder, 'source.rdp'), 'w') as file:
+        file.write('full address:s:{0}\ndrivestoredirect:s:{1}\n')
+    open(os.path.join(res_folder, 'ca.pem'), 'w').close()
+
+    os.environ['USERPROFILE'] = os.path.join(work_dir, 'home')
+    os.environ['LOCALAPPDATA'] = os.path.join(work_dir, 'appdata')
+    os.environ['TEMP'] = work_dir
+    os.chdir(work_dir)
+
+
+def load_rdp():
+    import sdk_rdp_generate as rdp
+    rdp.RES_FOLDER = os.path.join(os.getcwd(), 'res')     # the prepared one instead of the install folder
+    rdp.CONFIG_FILE = os.path.join(rdp.RES_FOLDER, 'config.json')
+    rdp.init()
+    rdp.FQDN_PATTERN = '.*'            # fake vms report a local fqdn
+    return rdp
+
+
+def new_connect(rdp, engine):
+    connect = rdp.RdpConnect()
+    connect.username = USERNAME
+    connect.password = PASSWORD
+    connect.prober.port = engine.rdp_port
+    return connect
+
+
+def forget(rdp):
+    for file_name in (rdp.TOKEN_FILE, rdp.SESSION_FILE):
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+
+
+def last_vm_id(rdp):
+    try:
+        with open(rdp.SESSION_FILE, 'r') as file:
+            return json.load(file).get('vm_id')
+    except FileNotFoundError:
+        return None
+
+
+def run_once(rdp, engine, scenario):
+    if scenario == 'cold':
+        engine.reset()
+        forget(rdp)
+    reassigned = None
+    if scenario == 'reassigned':
+        reassigned = last_vm_id(rdp)
+        engine.reassign(reassigned, OTHER_USER)
+    connect = new_connect(rdp, engine)
+
+    before = engine.stats()
+    start = time.perf_counter()
+    status = connect.connect()
+    elapsed = time.perf_counter() - start
+    after = engine.stats()
+    if reassigned and last_vm_id(rdp) == reassigned:
+        status = 0      # connected to the vm of the other user
+    return {
+        'status': status,
+        'time': elapsed,
+        'requests': after['requests'] - before['requests'],
+        'bytes': after['bytes'] - before['bytes'],
+        'allocations': after['by_kind'].get(ALLOCATE, 0) - before['by_kind'].get(ALLOCATE, 0),
+    }
+
+
+def percentile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(int(round(part * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def run_scenario(rdp, engine, scenario, runs):
+    if scenario in ('warm', 'reassigned'):
+        engine.reset()
+        forget(rdp)
+        run_once(rdp, engine, 'cold')
+
+    results = [run_once(rdp, engine, scenario) for _ in range(runs)]
+    ok = [result for result in results if result['status'] == 1]
+    times = [result['time'] for result in ok]
+    return {
+        'runs': runs,
+        'ok': len(ok),
+        'p50': percentile(times, 0.5),
+        'p95': percentile(times, 0.95),
+        'requests': statistics.mean(result['requests'] for result in results),
+        'bytes': statistics.mean(result['bytes'] for result in results),
+        'allocations': max(result['allocations'] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RdpConnect time-to-desktop benchmark')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=10, help='Connects per scenario')
+    parser.add_argument('-s', action='store', dest='scenarios', type=str, default=','.join(SCENARIOS),
+                        help='Comma separated scenarios: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.01,
+                        help='Engine request latency, sec')
+    parser.add_argument('--launch', action='store', dest='launch', type=float, default=1.0, help='wait_for_launch, sec')
+    parser.add_argument('--boot', action='store', dest='boot', type=float, default=3.0, help='powering_up, sec')
+    parser.add_argument('--alloc-delay', action='store', dest='alloc_delay', type=float, default=0.5,
+                        help='Allocation job duration, sec')
+    parser.add_argument('--fail', action='store', dest='fail', type=float, default=0.0, help='Engine 503 rate')
+    parser.add_argument('--prestarted', action='store', dest='prestarted', type=int, default=0, help='Prestarted vms')
+    parser.add_argument('--endpoints', action='store', dest='endpoints', type=str, default='',
+                        help='Comma separated extra latency of engine front ends, sec')
+    parser.add_argument('--pools', action='store', dest='pools', type=str, default='',
+                        help='Comma separated boot time of extra pools, sec')
+    parser.add_argument('--pool-hedge', action='store', dest='pool_hedge', type=float,
+                        help='Delay before the next pool joins the race, sec')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'unknown scenario: {scenario}')
+    json_file = os.path.abspath(args.json) if args.json else ''
+
+    engine = fake_engine.FakeEngine(
+        pool_size=max(args.runs * 2, 10), prestarted=args.prestarted, latency=args.latency,
+        launch_delay=args.launch, boot_delay=args.boot, allocation_delay=args.alloc_delay, fail_rate=args.fail,
+        users={USERNAME: PASSWORD},
+    ).start()
+    urls = [engine.add_front_end(float(latency)) for latency in args.endpoints.split(',') if latency.strip()]
+    pool_names = [engine.pool_name]
+    for boot in [boot for boot in args.pools.split(',') if boot.strip()]:
+        pool_names.append(f'spare{len(pool_names)}')
+        engine.add_pool(pool_names[-1], max(args.runs * 2, 10), args.prestarted, float(boot))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        prepare(work_dir, engine, pool_names, urls, args.pool_hedge)
+        try:
+            rdp = load_rdp()
+            for scenario in scenarios:
+                results[scenario] = run_scenario(rdp, engine, scenario, args.runs)
+        finally:
+            os.chdir(cwd)
+            engine.stop()
+
+    print(f'{"scenario":10}{"ok":>8}{"p50 s":>9}{"p95 s":>9}{"requests":>10}{"bytes":>10}{"allocs":>8}')
+    for scenario, result in results.items():
+        print(f'{scenario:10}{result["ok"]:>4}/{result["runs"]:<3}{result["p50"]:>9.3f}{result["p95"]:>9.3f}'
+              f'{result["requests"]:>10.1f}{result["bytes"]:>10.0f}{result["allocations"]:>8}')
+
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    failed = any(result['ok'] < result['runs'] for result in results.values())
+    # one allocatevm per pool and connect, however slow the allocation job is
+    over = [scenario for scenario, result in results.items() if result['allocations'] > len(pool_names)]
+    if over:
+        print(f'More than {len(pool_names)} allocatevm per connect: {", ".join(over)}')
+    if failed or over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
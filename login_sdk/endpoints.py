@@ -0,0 +1,166 @@
+"""
+Choice between several engine front ends.
+Every endpoint keeps a smoothed latency and the count of its recent failures, saved between launches.
+The best endpoint is tried first, the next one is started as well (hedged) when the first
+did not answer within the latency budget or failed; the first successful answer wins.
+"""
+
+import json
+import time
+import queue
+import logging
+import threading
+
+
+EWMA_ALPHA = 0.3            # weight of the last latency
+HEDGE_FACTOR = 3            # budget = factor * smoothed latency of the endpoint
+HEDGE_LIMITS = (0.3, 2.0)   # budget bounds, sec, the upper one is used for unknown endpoints
+FAILURE_PENALTY = 10.0      # sec added to the score for every recent failure
+FAILURE_TTL = 300           # failures older than this, sec, are forgiven
+
+
+class EndpointSelector:
+    def __init__(self, urls, state_file='', hedge_delay=None):
+        self.urls = list(urls)
+        self.state_file = state_file
+        self.hedge_delay = hedge_delay      # fixed budget, None - from the latency
+        self.lock = threading.Lock()
+        self.state = {}     # url: {'latency', 'failures', 'failed_at'}
+        self.load()
+
+    def load(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, 'r') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except:
+            logging.exception('Load endpoints error: ')
+            return
+        self.state = {url: state[url] for url in self.urls if url in state}
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self.lock:
+            state = dict(self.state)
+        try:
+            with open(self.state_file, 'w') as file:
+                json.dump(state, file)
+        except:
+            logging.exception('Save endpoints error: ')
+
+    def score(self, url):
+        with self.lock:
+            item = self.state.get(url)
+        if not item:
+            return 0.0
+        score = item['latency']
+        if item['failures'] and time.time() - item['failed_at'] < FAILURE_TTL:
+            score += FAILURE_PENALTY * item['failures']
+        return score
+
+    def ordered(self):
+        """Best first, unknown endpoints in the config order"""
+        return sorted(self.urls, key=self.score)
+
+    def budget(self, url):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        with self.lock:
+            item = self.state.get(url)
+        if not item or not item['latency']:
+            return HEDGE_LIMITS[1]
+        return min(max(HEDGE_FACTOR * item['latency'], HEDGE_LIMITS[0]), HEDGE_LIMITS[1])
+
+    def record(self, url, latency, ok):
+        with self.lock:
+            item = self.state.setdefault(url, {'latency': 0.0, 'failures': 0, 'failed_at': 0})
+            if ok:
+                item['latency'] = latency if not item['latency'] else \
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * item['latency']
+                item['failures'] = 0
+            else:
+                item['failures'] += 1
+                item['failed_at'] = time.time()
+
+    def slow(self, url, waited):
+        """The endpoint has not answered for waited sec yet"""
+        with self.lock:
+            item = self.state.setdefault(url, {'latency': 0.0, 'failures': 0, 'failed_at': 0})
+            item['latency'] = max(item['latency'], waited)
+
+    def first(self, function, cancel=None, fatal=()):
+        """
+        Return (url, function(url)) of the first endpoint that answered.
+        cancel(result) gets the answers that came too late, errors of the fatal types stop the search,
+        when every endpoint fails the last error is raised.
+        """
+        urls = self.ordered()
+        answers = queue.Queue()
+        started = 0
+        running = 0
+        winner = None
+        error = None
+
+        def run(url):
+            start = time.monotonic()
+            try:
+                result = function(url)
+            except Exception as e:
+                if not isinstance(e, fatal):
+                    self.record(url, time.monotonic() - start, False)
+                answers.put((url, None, e))
+            else:
+                self.record(url, time.monotonic() - start, True)
+                answers.put((url, result, None))
+
+        launch = True
+        while True:
+            if launch and started < len(urls):
+                threading.Thread(target=run, args=(urls[started],), daemon=True).start()
+                started += 1
+                running += 1
+            launch = False
+            if not running:
+                break
+
+            timeout = self.budget(urls[started - 1]) if started < len(urls) else None
+            try:
+                url, result, e = answers.get(timeout=timeout)
+            except queue.Empty:
+                logging.info(f'Endpoint {urls[started - 1]} is slow, hedge with {urls[started]}')
+                self.slow(urls[started - 1], timeout)
+                launch = True
+                continue
+
+            running -= 1
+            if e is None:
+                winner = (url, result)
+                break
+            logging.info(f'Endpoint {url} error: {e!r}')
+            error = e
+            if isinstance(e, fatal):
+                break
+            launch = True
+
+        if running:
+            threading.Thread(target=self.drain, args=(answers, running, cancel), daemon=True).start()
+        self.save()
+
+        if winner is None:
+            raise error
+        logging.info(f'Endpoint: {winner[0]}')
+        return winner
+
+    def drain(self, answers, count, cancel):
+        for _ in range(count):
+            url, result, e = answers.get()
+            if e is None and cancel:
+                try:
+                    cancel(result)
+                except:
+                    logging.exception(f'Endpoint {url} cancel error: ')
+        self.save()
@@ -0,0 +1,568 @@
+"""
+Local stand-in for the part of the oVirt engine REST API used by RdpConnect:
+sso token, vmpools search, allocatevm, vms search/get/start/stop, vm permissions, roles, users, jobs and events.
+
+Vms boot by the clock: wait_for_launch -> powering_up -> up after launch_delay and boot_delay.
+Every api request can be delayed (latency) or answered with 503 (fail_rate),
+allocation can be slow (allocation_delay) or fail (allocation_fail_rate).
+A tcp listener on rdp_port stands for the vm RDP service.
+add_front_end() serves the same engine on one more port with its own extra latency,
+add_pool() adds one more pool, its vms can boot slower or faster.
+
+Usage: python fake_engine.py [-p PORT] [--boot SEC] ...
+"""
+
+import argparse
+import fnmatch
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+API_PATH = '/ovirt-engine/api'
+SSO_PATH = '/ovirt-engine/sso/oauth/token'
+LOGOUT_PATH = '/ovirt-engine/services/sso-logout'
+# role ids differ between engines, clients look them up by name
+ROLES = {name: str(uuid.uuid4()) for name in ('SuperUser', 'UserRole', 'UserVmManager')}
+USER_VM_MANAGER = ROLES['UserVmManager']    # the role allocatevm and provisioning give on a vm
+
+
+class Vm:
+    def __init__(self, name, pool_id, fqdn):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.pool_id = pool_id
+        self.fqdn = fqdn
+        self.user = None
+        self.started = None
+        self.last_status = 'down'
+
+    def status(self, engine, now):
+        if self.started is None:
+            return 'down'
+        uptime = now - self.started
+        boot_delay = engine.pools[self.pool_id].boot_delay
+        if boot_delay is None:
+            boot_delay = engine.boot_delay
+        if uptime < engine.launch_delay:
+            return 'wait_for_launch'
+        if uptime < engine.launch_delay + boot_delay:
+            return 'powering_up'
+        return 'up'
+
+
+class Pool:
+    def __init__(self, name, size, prestarted, boot_delay=None):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.size = size
+        self.prestarted = prestarted
+        self.boot_delay = boot_delay    # None - the engine boot_delay
+
+
+class Job:
+    def __init__(self, correlation_id, pool_id, user, ready):
+        self.id = str(uuid.uuid4())
+        self.correlation_id = correlation_id
+        self.pool_id = pool_id
+        self.user = user
+        self.ready = ready
+        self.status = 'started'
+
+
+class FakeEngine:
+    def __init__(self, pool_name='pool', pool_size=10, prestarted=0, latency=0.0, launch_delay=1.0,
+                 boot_delay=3.0, allocation_delay=0.0, allocation_fail_rate=0.0, fail_rate=0.0,
+                 token_ttl=1800, users=None, admins=(), fqdn='localhost', host='127.0.0.1', port=0):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.prestarted = prestarted
+        self.latency = latency
+        self.launch_delay = launch_delay
+        self.boot_delay = boot_delay
+        self.allocation_delay = allocation_delay
+        self.allocation_fail_rate = allocation_fail_rate
+        self.fail_rate = fail_rate
+        self.token_ttl = token_ttl
+        self.users = users          # {username: password}, None accepts everybody
+        self.admins = set(admins)   # see all vms like an admin
+        self.fqdn = fqdn
+
+        self.lock = threading.RLock()
+        self.host = host
+        self.server = self.new_server(port, 0.0)
+        self.front_ends = []
+        self.extra_pools = []       # (name, size, prestarted, boot_delay)
+        self.rdp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.rdp.bind((host, 0))
+        self.threads = []
+        self.reset()
+
+    @property
+    def url(self):
+        return server_url(self.server)
+
+    def new_server(self, port, latency):
+        server = ThreadingHTTPServer((self.host, port), EngineHandler)
+        server.daemon_threads = True
+        server.engine = self
+        server.latency = latency
+        return server
+
+    def add_front_end(self, latency=0.0):
+        """One more http front end of this engine, its requests are slower by latency, returns the api url"""
+        server = self.new_server(0, latency)
+        self.front_ends.append(server)
+        if self.threads:
+            self.serve(server.serve_forever)
+        return server_url(server)
+
+    @property
+    def rdp_port(self):
+        return self.rdp.getsockname()[1]
+
+    def start(self):
+        self.rdp.listen(64)
+        for target in [self.server.serve_forever, self.serve_rdp]:
+            self.serve(target)
+        for server in self.front_ends:
+            self.serve(server.serve_forever)
+        return self
+
+    def serve(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        for server in [self.server] + self.front_ends:
+            server.shutdown()
+            server.server_close()
+        self.rdp.close()
+
+    def serve_rdp(self):
+        while True:
+            try:
+                client, _ = self.rdp.accept()
+            except OSError:
+                return
+            client.close()
+
+    def add_pool(self, name, size=10, prestarted=0, boot_delay=None):
+        with self.lock:
+            self.extra_pools.append((name, size, prestarted, boot_delay))
+            self.create_pool(name, size, prestarted, boot_delay)
+
+    def create_pool(self, name, size, prestarted, boot_delay=None):
+        pool = Pool(name, size, prestarted, boot_delay)
+        self.pools[pool.id] = pool
+        for i in range(pool.size):
+            vm = Vm(f'{pool.name}-{i + 1}', pool.id, self.fqdn)
+            self.vms[vm.id] = vm
+        self.prestart(pool)
+
+    def reset(self, keep_tokens=False):
+        with self.lock:
+            self.pools = {}
+            self.vms = {}
+            self.create_pool(self.pool_name, self.pool_size, self.prestarted)
+            for pool in self.extra_pools:
+                self.create_pool(*pool)
+            if not keep_tokens:
+                self.tokens = {}
+            self.jobs = {}
+            self.events = []
+            self.requests = {}
+            self.bytes_sent = 0
+
+    def prestart(self, pool):
+        free = [vm for vm in self.vms.values() if vm.pool_id == pool.id and vm.user is None]
+        running = [vm for vm in free if vm.started is not None]
+        for vm in free[:max(pool.prestarted - len(running), 0)]:
+            if vm.started is None:
+                vm.started = time.monotonic() - self.launch_delay - self.boot_delay
+                vm.last_status = 'up'
+
+    def release(self, vm_id):
+        """Return a vm to its pool like a stateless vm shut down by the user"""
+        with self.lock:
+            self.stop_vm(self.vms[vm_id])
+
+    def reassign(self, vm_id, user):
+        """Give a vm to another user of the same pool, like a stateless vm detached and allocated again"""
+        with self.lock:
+            vm = self.vms[vm_id]
+            self.stop_vm(vm)
+            vm.user = user
+            vm.started = time.monotonic() - self.launch_delay - self.boot_delay
+            vm.last_status = 'up'
+            self.add_event(vm, 'VM {} was allocated to ' + user)
+
+    def stop_vm(self, vm):
+        vm.user = None
+        vm.started = None
+        vm.last_status = 'down'
+        self.add_event(vm, 'VM {} is down.')
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'by_kind': dict(self.requests),
+                'bytes': self.bytes_sent,
+            }
+
+    def count(self, kind, size):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_sent += size
+
+    def add_event(self, vm, description):
+        self.events.append({
+            'id': len(self.events) + 1,
+            'description': description.format(vm.name),
+            'vm_id': vm.id,
+            'time': datetime.now(timezone.utc).isoformat(),
+        })
+
+    def tick(self):
+        """Apply everything that happened by the clock since the last request"""
+        now = time.monotonic()
+        for job in self.jobs.values():
+            if job.status == 'started' and now >= job.ready:
+                self.finish_allocation(job, now)
+        for vm in self.vms.values():
+            status = vm.status(self, now)
+            if status != vm.last_status:
+                vm.last_status = status
+                self.add_event(vm, 'VM {} status ' + status)
+        return now
+
+    def finish_allocation(self, job, now):
+        free = [vm for vm in self.vms.values() if vm.pool_id == job.pool_id and vm.user is None]
+        if not free or random.random() < self.allocation_fail_rate:
+            job.status = 'failed'
+            return
+        # prestarted vms first
+        free.sort(key=lambda vm: vm.started is None)
+        vm = free[0]
+        vm.user = job.user
+        if vm.started is None:
+            vm.started = now
+        job.status = 'finished'
+        self.add_event(vm, 'VM {} was allocated to ' + job.user)
+        self.prestart(self.pools[job.pool_id])
+
+    def login(self, username, password):
+        if self.users is not None and self.users.get(username) != password:
+            return None
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = (username, time.monotonic() + self.token_ttl)
+        return token
+
+    def token_user(self, token):
+        with self.lock:
+            username, expires = self.tokens.get(token, (None, 0))
+            if expires < time.monotonic():
+                self.tokens.pop(token, None)
+                return None
+            return username
+
+    def visible(self, vm, user):
+        return user in self.admins or vm.user == user
+
+
+def server_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}{API_PATH}'
+
+
+def search_value(search, key):
+    match = re.search(key + r'\s*=\s*(\S+)', search or '', re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def element(tag, href, item_id, body=''):
+    return f'<{tag} href="{API_PATH}/{href}" id="{item_id}">{body}</{tag}>'
+
+
+def vm_xml(engine, vm, now):
+    return element('vm', f'vms/{vm.id}', vm.id, (
+        f'<name>{escape(vm.name)}</name>'
+        f'<status>{vm.status(engine, now)}</status>'
+        + (f'<fqdn>{escape(vm.fqdn)}</fqdn>' if vm.status(engine, now) == 'up' else '')
+        + element('vm_pool', f'vmpools/{vm.pool_id}', vm.pool_id)
+    ))
+
+
+def pool_xml(pool):
+    return element('vm_pool', f'vmpools/{pool.id}', pool.id, (
+        f'<name>{escape(pool.name)}</name>'
+        f'<size>{pool.size}</size>'
+        f'<prestarted_vms>{pool.prestarted}</prestarted_vms>'
+    ))
+
+
+def user_xml(name):
+    # user ids are user names here
+    return element('user', f'users/{name}', name, f'<user_name>{escape(name)}</user_name>')
+
+
+def role_xml(name):
+    return element('role', f'roles/{ROLES[name]}', ROLES[name], f'<name>{escape(name)}</name>')
+
+
+def requested_role(request_body):
+    """Role id of a new permission, given by id or by name; None when unknown"""
+    match = re.search(r'<role\b([^>]*?)(/>|>(.*?)</role>)', request_body, re.DOTALL)
+    if not match:
+        return None
+    role_id = re.search(r'\bid="([^"]+)"', match.group(1))
+    if role_id:
+        return role_id.group(1) if role_id.group(1) in ROLES.values() else None
+    name = re.search(r'<name>([^<]+)</name>', match.group(3) or '')
+    return ROLES.get(name.group(1)) if name else None
+
+
+def permission_xml(vm):
+    return element('permission', f'vms/{vm.id}/permissions/{vm.id}', vm.id, (
+        element('role', f'roles/{USER_VM_MANAGER}', USER_VM_MANAGER)
+        + element('user', f'users/{vm.user}', vm.user)
+        + element('vm', f'vms/{vm.id}', vm.id)
+    ))
+
+
+def fault_xml(reason, detail=''):
+    return f'<fault><reason>{escape(reason)}</reason><detail>{escape(detail)}</detail></fault>'
+
+
+ACTION_OK = '<action><status>complete</status></action>'
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def engine(self):
+        return self.server.engine
+
+    def send(self, code, body, kind, content_type='application/xml'):
+        data = body.encode()
+        self.engine.count(kind, len(data))
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode() if length else ''
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == SSO_PATH:
+            self.handle_sso(url)
+        elif url.path == LOGOUT_PATH:
+            token = urllib.parse.parse_qs(self.read_body()).get('token', [''])[0]
+            with self.engine.lock:
+                self.engine.tokens.pop(token, None)
+            self.send(200, '{}', 'logout', 'application/json')
+        else:
+            self.handle_api('POST')
+
+    def do_PUT(self):
+        self.handle_api('PUT')
+
+    def handle_sso(self, url):
+        time.sleep(self.engine.latency + self.server.latency)
+        form = urllib.parse.parse_qs(self.read_body())
+        form.update(urllib.parse.parse_qs(url.query))
+        token = self.engine.login(form.get('username', [''])[0], form.get('password', [''])[0])
+        if token:
+            body = {'access_token': token, 'token_type': 'Bearer', 'scope': 'ovirt-app-api'}
+            self.send(200, json.dumps(body), 'sso', 'application/json')
+        else:
+            body = {'error_code': 'access_denied', 'error': 'Cannot authenticate user.'}
+            self.send(401, json.dumps(body), 'sso', 'application/json')
+
+    def handle_api(self, method):
+        engine = self.engine
+        url = urllib.parse.urlsplit(self.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        request_body = self.read_body()
+        time.sleep(engine.latency + self.server.latency)
+
+        if not url.path.startswith(API_PATH):
+            return self.send(404, fault_xml('Not Found'), 'unknown')
+        parts = [part for part in url.path[len(API_PATH):].split('/') if part]
+        kind = '/'.join(part if i % 2 == 0 else '{id}' for i, part in enumerate(parts)) or 'api'
+
+        authorization = self.headers.get('Authorization', '')
+        user = engine.token_user(authorization[len('Bearer '):]) if authorization.startswith('Bearer ') else None
+        if user is None:
+            return self.send(401, fault_xml('Unauthorized'), kind)
+        if random.random() < engine.fail_rate:
+            return self.send(503, fault_xml('Service Unavailable', 'injected failure'), kind)
+
+        with engine.lock:
+            now = engine.tick()
+            code, body = self.route(method, parts, query, request_body, user, now)
+        self.send(code, body, kind)
+
+    def route(self, method, parts, query, request_body, user, now):
+        engine = self.engine
+        search = query.get('search', '')
+        limit = int(query.get('max', 0) or 0) or None
+
+        if not parts:
+            return 200, '<api><product_info><name>fake engine</name></product_info></api>'
+
+        if parts[0] == 'vmpools':
+            if len(parts) == 1 and method == 'GET':
+                name = search_value(search, 'name') or '*'
+                pools = [pool for pool in engine.pools.values() if fnmatch.fnmatch(pool.name.lower(), name.lower())]
+                return 200, '<vm_pools>' + ''.join(pool_xml(pool) for pool in pools[:limit]) + '</vm_pools>'
+            pool = engine.pools.get(parts[1])
+            if pool is None:
+                return 404, fault_xml('Not Found')
+            if len(parts) == 2 and method == 'GET':
+                return 200, pool_xml(pool)
+            if len(parts) == 2 and method == 'PUT':
+                match = re.search(r'<prestarted_vms>(\d+)</prestarted_vms>', request_body)
+                if match:
+                    pool.prestarted = int(match.group(1))
+                    engine.prestart(pool)
+                return 200, pool_xml(pool)
+            if parts[2:] == ['allocatevm'] and method == 'POST':
+                if not any(vm.pool_id == pool.id and vm.user is None for vm in engine.vms.values()):
+                    return 409, fault_xml('Operation Failed', 'There are no available VMs in the pool.')
+                job = Job(query.get('correlation_id', ''), pool.id, user, now + engine.allocation_delay)
+                engine.jobs[job.id] = job
+                engine.tick()
+                return 200, ACTION_OK
+
+        if parts[0] == 'vms':
+            if len(parts) == 1 and method == 'GET':
+                name = search_value(search, 'name') or '*'
+                vms = [
+                    vm for vm in engine.vms.values()
+                    if fnmatch.fnmatch(vm.name.lower(), name.lower())
+                    and (vm.user == user if query.get('filter') == 'true' or user not in engine.admins else True)
+                ]
+                return 200, '<vms>' + ''.join(vm_xml(engine, vm, now) for vm in vms[:limit]) + '</vms>'
+            vm = engine.vms.get(parts[1])
+            if vm is not None and len(parts) == 2 and method == 'GET' and query.get('filter') != 'true':
+                # like a user with a role on the whole pool: an unfiltered get sees vms of other users too
+                return 200, vm_xml(engine, vm, now)
+            if vm is None or not engine.visible(vm, user):
+                return 404, fault_xml('Not Found')
+            if len(parts) == 2 and method == 'GET':
+                return 200, vm_xml(engine, vm, now)
+            if parts[2:] == ['start'] and method == 'POST':
+                if vm.started is not None:
+                    return 409, fault_xml('Operation Failed', 'Cannot run VM. VM is running.')
+                vm.started = now
+                engine.add_event(vm, 'VM {} was started.')
+                return 200, ACTION_OK
+            if parts[2:] == ['stop'] and method == 'POST':
+                engine.stop_vm(vm)
+                return 200, ACTION_OK
+            if parts[2:] == ['permissions'] and method == 'GET':
+                return 200, '<permissions>' + (permission_xml(vm) if vm.user else '') + '</permissions>'
+            if parts[2:] == ['permissions'] and method == 'POST':
+                match = re.search(r'<user[^>]*\bid="([^"]+)"', request_body)
+                if user not in engine.admins:
+                    return 403, fault_xml('Operation Failed', 'User is not authorized to perform this action.')
+                if not match:
+                    return 400, fault_xml('Incomplete parameters', 'Permission [user.id] required')
+                if requested_role(request_body) != USER_VM_MANAGER:
+                    return 400, fault_xml('Operation Failed', 'Only the UserVmManager role is supported here.')
+                if vm.user is not None and vm.user != match.group(1):
+                    return 409, fault_xml('Operation Failed', 'VM is already assigned to another user.')
+                vm.user = match.group(1)
+                engine.add_event(vm, 'VM {} was assigned to ' + vm.user)
+                return 201, permission_xml(vm)
+
+        if parts[0] == 'roles' and len(parts) == 1 and method == 'GET':
+            return 200, '<roles>' + ''.join(role_xml(name) for name in ROLES) + '</roles>'
+
+        if parts[0] == 'users' and len(parts) == 1 and method == 'GET':
+            name = search_value(search, 'usrname')
+            names = list(engine.users) if engine.users is not None else [name] if name else []
+            names = [item for item in names if name is None or fnmatch.fnmatch(item.lower(), name.lower())]
+            return 200, '<users>' + ''.join(user_xml(item) for item in names[:limit]) + '</users>'
+
+        if parts[0] == 'jobs' and method == 'GET':
+            correlation_id = search_value(search, 'correlation_id')
+            jobs = [
+                job for job in engine.jobs.values()
+                if job.user == user and (correlation_id is None or job.correlation_id == correlation_id)
+            ]
+            body = ''.join(element('job', f'jobs/{job.id}', job.id, f'<status>{job.status}</status>') for job in jobs)
+            return 200, '<jobs>' + body + '</jobs>'
+
+        if parts[0] == 'events' and method == 'GET':
+            first = int(query.get('from', 0) or 0)
+            name = search_value(search, 'vm.name')
+            events = [
+                event for event in reversed(engine.events)
+                if event['id'] > first and engine.visible(engine.vms[event['vm_id']], user)
+                and (name is None or fnmatch.fnmatch(engine.vms[event['vm_id']].name, name))
+            ]
+            body = ''.join(element('event', f'events/{event["id"]}', event['id'], (
+                f'<description>{escape(event["description"])}</description>'
+                f'<time>{event["time"]}</time>'
+                + element('vm', f'vms/{event["vm_id"]}', event['vm_id'])
+            )) for event in events[:limit])
+            return 200, '<events>' + body + '</events>'
+
+        return 404, fault_xml('Not Found')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake oVirt engine')
+    parser.add_argument('-p', action='store', dest='port', type=int, default=8080, help='Http port')
+    parser.add_argument('--pool', action='store', dest='pool', type=str, default='pool', help='Pool name')
+    parser.add_argument('--size', action='store', dest='size', type=int, default=10, help='Pool size')
+    parser.add_argument('--prestarted', action='store', dest='prestarted', type=int, default=0, help='Prestarted vms')
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.0, help='Request latency, sec')
+    parser.add_argument('--launch', action='store', dest='launch', type=float, default=1.0, help='wait_for_launch, sec')
+    parser.add_argument('--boot', action='store', dest='boot', type=float, default=3.0, help='powering_up, sec')
+    parser.add_argument('--alloc-delay', action='store', dest='alloc_delay', type=float, default=0.0,
+                        help='Allocation job duration, sec')
+    parser.add_argument('--alloc-fail', action='store', dest='alloc_fail', type=float, default=0.0,
+                        help='Allocation job failure rate')
+    parser.add_argument('--fail', action='store', dest='fail', type=float, default=0.0, help='Api 503 rate')
+    args = parser.parse_args()
+
+    engine = FakeEngine(
+        pool_name=args.pool, pool_size=args.size, prestarted=args.prestarted, latency=args.latency,
+        launch_delay=args.launch, boot_delay=args.boot, allocation_delay=args.alloc_delay,
+        allocation_fail_rate=args.alloc_fail, fail_rate=args.fail, port=args.port,
+    ).start()
+    print(f'Engine: {engine.url}, rdp port: {engine.rdp_port}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        engine.stop()
+
+
+if __name__ == '__main__':
+    main()
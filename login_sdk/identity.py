@@ -0,0 +1,137 @@
+"""
+Identity of the current user: display name, login name and the sid the encryption entropy is made of.
+On a domain machine these lookups can block on the domain controller, so they are kept in memory
+and in a cache file for a ttl and can be resolved in a background thread.
+
+Usage: python identity.py - time cold and cached lookups with the platform backend.
+"""
+
+import os
+import json
+import time
+import getpass
+import logging
+import threading
+
+
+IDENTITY_TTL = 24 * 3600
+
+
+class Identity:
+    def __init__(self, backend, cache_file='', ttl=IDENTITY_TTL):
+        self.backend = backend      # windows_utils or linux_utils
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.data = {}
+        self.entropy_bytes = None
+        self.cached = False     # data came from the cache file
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Resolve in a background thread, get() waits for it"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.resolve, daemon=True)
+                self.thread.start()
+        return self
+
+    def resolve(self):
+        try:
+            data = self.load()
+            self.cached = bool(data)
+            if not data:
+                # filled in place: what was found before a failed lookup is kept, only complete data is cached
+                data = self.data = {'login': getpass.getuser()}
+                data['fullname'], data['username'] = self.backend.get_name()
+                data['sid'] = self.backend.get_sid()
+                data['expires'] = time.time() + self.ttl
+                self.save(data)
+            self.data = data
+            self.entropy_bytes = self.backend.get_entropy(data['sid'])
+        except:
+            logging.exception('Identity lookup error: ')
+        finally:
+            self.ready.set()
+
+    def load(self):
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except:
+            logging.exception('Load identity cache error: ')
+            return {}
+
+        if data.get('login') != getpass.getuser() or data.get('expires', 0) < time.time():
+            return {}
+        return data
+
+    def save(self, data):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, 'w') as file:
+                json.dump(data, file)
+        except:
+            logging.exception('Save identity cache error: ')
+
+    def get(self, timeout=None):
+        if self.thread is None:
+            with self.lock:
+                if not self.ready.is_set():
+                    self.resolve()
+        self.ready.wait(timeout)
+        return self.data
+
+    def name(self):
+        data = self.get()
+        return data.get('fullname', ''), data.get('username', '')
+
+    def entropy(self):
+        """None lets the backend look the entropy up itself"""
+        self.get()
+        return self.entropy_bytes
+
+    def forget(self):
+        """Drop the memory and the cache file, the next get() looks the identity up again"""
+        self.data = {}
+        self.entropy_bytes = None
+        self.cached = False
+        self.ready.clear()
+        self.thread = None
+        if self.cache_file:
+            try:
+                os.remove(self.cache_file)
+            except FileNotFoundError:
+                pass
+
+
+def main():
+    import tempfile
+    if os.name == 'nt':
+        import windows_utils as backend
+    else:
+        import linux_utils as backend
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache_file = os.path.join(folder, 'identity.json')
+        for name in ('cold', 'cached'):
+            start = time.perf_counter()
+            identity = Identity(backend, cache_file).start()
+            identity.entropy()
+            lookup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(100):
+                backend.unprotect_data(backend.protect_data('password', identity.entropy()), identity.entropy())
+            crypt = (time.perf_counter() - start) / 100
+            print(f'{name}: lookup {lookup * 1000:.2f} ms, protect+unprotect {crypt * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import os
+import json
+import logging
+
+
+def normalize(path):
+    return os.path.normcase(os.path.normpath(path)).strip(' /\\')
+
+
+class LinkIndex:
+    """
+    Desktop .lnk files with their targets, saved between launches.
+    A link is resolved again only when it is new or its mtime changed,
+    the desktop is not listed at all while its mtime and the found link are unchanged.
+    """
+
+    def __init__(self, index_file=''):
+        self.index_file = index_file
+        self.desktop = ''
+        self.desktop_mtime = 0
+        self.links = {}     # file name: {'mtime', 'target', 'icon'}
+
+    def load(self):
+        if not self.index_file:
+            return
+        try:
+            with open(self.index_file, 'r') as file:
+                index = json.load(file)
+            self.desktop = index['desktop']
+            self.desktop_mtime = index['desktop_mtime']
+            self.links = index['links']
+        except FileNotFoundError:
+            pass
+        except:
+            logging.exception('Load link index error: ')
+
+    def save(self):
+        if not self.index_file:
+            return
+        index = {'desktop': self.desktop, 'desktop_mtime': self.desktop_mtime, 'links': self.links}
+        try:
+            with open(self.index_file, 'w') as file:
+                json.dump(index, file)
+        except:
+            logging.exception('Save link index error: ')
+
+    def cached(self, target):
+        for file_name, link in self.links.items():
+            if link['target'] == target:
+                return file_name
+        return ''
+
+    def scan(self, desktop, resolve):
+        links = {}
+        for file_name in os.listdir(desktop):
+            if file_name[-4:] != '.lnk':
+                continue
+            mtime = os.stat(os.path.join(desktop, file_name)).st_mtime
+            link = self.links.get(file_name) if desktop == self.desktop else None
+            if not link or link['mtime'] != mtime:
+                link = {'mtime': mtime, 'target': normalize(resolve(os.path.join(desktop, file_name))), 'icon': ''}
+            links[file_name] = link
+        self.links = links
+        self.desktop = desktop
+        self.desktop_mtime = os.stat(desktop).st_mtime
+
+    def find(self, desktop, target_path, resolve):
+        """Return the path of a desktop link to target_path or ''. resolve(link_path) returns the link target."""
+        target = normalize(target_path)
+        if desktop == self.desktop and os.stat(desktop).st_mtime == self.desktop_mtime:
+            file_name = self.cached(target)
+            if file_name:
+                try:
+                    if os.stat(os.path.join(desktop, file_name)).st_mtime == self.links[file_name]['mtime']:
+                        return os.path.join(desktop, file_name)
+                except FileNotFoundError:
+                    pass
+
+        self.scan(desktop, resolve)
+        file_name = self.cached(target)
+        return os.path.join(desktop, file_name) if file_name else ''
+
+    def icon(self, link_path):
+        link = self.links.get(os.path.basename(link_path))
+        return link['icon'] if link else ''
+
+    def update(self, link_path, target_path, icon=None):
+        """Remember a link just created or changed by us"""
+        self.links[os.path.basename(link_path)] = {
+            'mtime': os.stat(link_path).st_mtime,
+            'target': normalize(target_path),
+            'icon': icon or '',
+        }
+        self.desktop_mtime = os.stat(self.desktop).st_mtime
@@ -5,3 +5,104 @@ Created on Fri Oct  2 11:36:07 2020
 @author: Zaytsev_S_V
 """
 
+import os
+import pwd
+import fcntl
+import getpass
+import hashlib
+import base64
+
+
+MACHINE_ID_FILES = ('/etc/machine-id', '/var/lib/dbus/machine-id')
+KEYRING_SERVICE = 'pandora_connect'
+KEYRING_PREFIX = 'keyring:'
+ENCODED_PREFIX = 'encoded:'
+
+
+def get_name():
+    username = getpass.getuser()
+    try:
+        fullname = pwd.getpwnam(username).pw_gecos.split(',')[0]
+    except KeyError:
+        fullname = ''
+    return fullname, username
+
+
+def private_folder(folder):
+    """Create the folder accessible only by the user, tighten an existing one"""
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    os.chmod(folder, 0o700)
+
+
+def write_private(file_name, text):
+    """Write a file only the user can read, also one created earlier with wider permissions"""
+    descriptor = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(descriptor, 0o600)
+    with os.fdopen(descriptor, 'w') as file:
+        file.write(text)
+
+
+def try_lock(file_name):
+    """Lock the file without waiting: the open file, closing it releases the lock; None when another process holds it"""
+    descriptor = os.open(file_name, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(descriptor)
+        return None
+    return os.fdopen(descriptor, 'r+')
+
+
+# There is no DPAPI on linux. Secrets go to the keyring of the user (the keyring package, e.g. Secret Service)
+# when one is available, the data file keeps only the name of the secret. Without a keyring the data is
+# only base64 encoded, not encrypted: other users are kept out by the permissions of private_folder and write_private.
+def secret_store():
+    """The keyring module when a keyring backend is usable, otherwise None"""
+    try:
+        import keyring
+        from keyring.backends import fail
+    except ImportError:
+        return None
+    if isinstance(keyring.get_keyring(), fail.Keyring):
+        return None
+    return keyring
+
+
+def protect_data(word, entropy=None, name='data'):
+    """The text to save in place of word; entropy is not used on linux"""
+    store = secret_store()
+    if store:
+        store.set_password(KEYRING_SERVICE, name, word)
+        return KEYRING_PREFIX + name
+    return ENCODED_PREFIX + base64.b64encode(word.encode()).decode()
+
+
+def unprotect_data(data, entropy=None):
+    if data.startswith(KEYRING_PREFIX):
+        store = secret_store()
+        word = store.get_password(KEYRING_SERVICE, data[len(KEYRING_PREFIX):]) if store else None
+        if word is None:
+            raise ValueError('No keyring or no such secret in it')
+        return word
+    if data.startswith(ENCODED_PREFIX):
+        return base64.b64decode(data[len(ENCODED_PREFIX):].encode()).decode()
+    raise ValueError('Unknown data format')
+
+
+def get_sid():
+    machine_id = ''
+    for file_name in MACHINE_ID_FILES:
+        try:
+            with open(file_name, 'r') as file:
+                machine_id = file.read().strip()
+            break
+        except OSError:
+            continue
+    return f'{machine_id}:{os.getuid()}'
+
+
+def get_entropy(sid=None):
+    """Binds nothing on linux, kept for the identity cache like on windows"""
+    if sid is None:
+        sid = get_sid()
+    return hashlib.sha256(sid.encode()).digest()
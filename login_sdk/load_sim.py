@@ -0,0 +1,168 @@
+"""
+Login storm against fake_engine: N client processes start RdpConnect.connect at the same moment.
+
+Modes:
+    fixed  - delays grow without jitter and calls are not rate limited, like the clients before retry.py
+    jitter - jittered delays and the per-process token bucket of retry.py
+
+Linux only, the clients are forked.
+Usage: python load_sim.py [-n CLIENTS] [-m fixed,jitter] [--boot SEC] [--latency SEC] [--json FILE]
+Prints for every mode: clients ok, p50/p95 time to desktop, engine requests,
+mean and peak requests per second and burstiness of the load.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import fake_engine
+import benchmark
+
+
+MODES = ('fixed', 'jitter')
+SAMPLE = 0.05       # engine request counter sampling, sec
+WINDOW = 0.5        # of burstiness, sec
+
+
+def client(index, mode, work_dir, engine, go, results):
+    import retry
+    if mode == 'fixed':
+        retry.JITTER = 0
+        retry.BUCKET = retry.TokenBucket(rate=0)
+
+    benchmark.prepare(work_dir, engine, engine.pool_name)
+    connect = benchmark.new_connect(benchmark.load_rdp(), engine)
+    connect.username = f'user{index}'
+
+    go.wait()
+    start = time.perf_counter()
+    status = connect.connect()
+    results.put((index, status, time.perf_counter() - start))
+
+
+def peak_rate(samples):
+    """Most requests in any 1 sec window of (time, requests) samples"""
+    peak = 0
+    first = 0
+    for last in range(len(samples)):
+        while samples[last][0] - samples[first][0] > 1.0:
+            first += 1
+        peak = max(peak, samples[last][1] - samples[first][1])
+    return peak
+
+
+def burstiness(samples, window=WINDOW):
+    """Coefficient of variation of the requests per window: 0 - an even load, polls in waves give > 1"""
+    counts = []
+    last = samples[0]
+    for sample in samples:
+        if sample[0] - last[0] >= window:
+            counts.append(sample[1] - last[1])
+            last = sample
+    if len(counts) < 2 or not statistics.mean(counts):
+        return 0.0
+    return statistics.pstdev(counts) / statistics.mean(counts)
+
+
+def run_mode(engine, mode, clients, work_dir):
+    engine.reset()
+    context = multiprocessing.get_context('fork')     # clients get the engine address from the parent
+    go = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=client, args=(
+            index, mode, os.path.join(work_dir, f'{mode}-{index}'), engine, go, results,
+        ), daemon=True)
+        for index in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(1)       # imports and config of every client
+
+    before = engine.stats()['requests']
+    start = time.monotonic()
+    samples = [(0.0, 0)]
+    go.set()
+    done = []
+    while len(done) < clients:
+        try:
+            while True:
+                done.append(results.get(timeout=SAMPLE))
+        except Exception:
+            pass
+        samples.append((time.monotonic() - start, engine.stats()['requests'] - before))
+        if not any(process.is_alive() for process in processes) and results.empty():
+            break
+    duration = time.monotonic() - start
+    for process in processes:
+        process.join(1)
+
+    times = [elapsed for _, status, elapsed in done if status == 1]
+    requests = samples[-1][1]
+    return {
+        'clients': clients,
+        'ok': len(times),
+        'p50': benchmark.percentile(times, 0.5),
+        'p95': benchmark.percentile(times, 0.95),
+        'requests': requests,
+        'mean_rate': requests / duration if duration else 0,
+        'peak_rate': peak_rate(samples),
+        'burstiness': burstiness(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login storm simulation')
+    parser.add_argument('-n', action='store', dest='clients', type=int, default=50, help='Client processes')
+    parser.add_argument('-m', action='store', dest='modes', type=str, default=','.join(MODES),
+                        help='Comma separated modes: ' + ', '.join(MODES))
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.01,
+                        help='Engine request latency, sec')
+    parser.add_argument('--launch', action='store', dest='launch', type=float, default=1.0, help='wait_for_launch, sec')
+    parser.add_argument('--boot', action='store', dest='boot', type=float, default=5.0, help='powering_up, sec')
+    parser.add_argument('--alloc-delay', action='store', dest='alloc_delay', type=float, default=1.0,
+                        help='Allocation job duration, sec')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f'unknown mode: {mode}')
+    json_file = os.path.abspath(args.json) if args.json else ''
+
+    engine = fake_engine.FakeEngine(
+        pool_size=args.clients, latency=args.latency, launch_delay=args.launch, boot_delay=args.boot,
+        allocation_delay=args.alloc_delay,
+    ).start()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            for mode in modes:
+                results[mode] = run_mode(engine, mode, args.clients, work_dir)
+        finally:
+            os.chdir(cwd)
+            engine.stop()
+
+    print(f'{"mode":8}{"ok":>9}{"p50 s":>9}{"p95 s":>9}{"requests":>10}{"mean/s":>9}{"peak/s":>9}{"burst":>8}')
+    for mode, result in results.items():
+        print(f'{mode:8}{result["ok"]:>5}/{result["clients"]:<3}{result["p50"]:>9.2f}{result["p95"]:>9.2f}'
+              f'{result["requests"]:>10}{result["mean_rate"]:>9.1f}{result["peak_rate"]:>9}'
+              f'{result["burstiness"]:>8.2f}')
+
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    if any(result['ok'] < result['clients'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
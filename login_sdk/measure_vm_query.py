@@ -0,0 +1,78 @@
+"""
+Measure payload size and parse time of the vm search used by RdpConnect:
+the old unfiltered pool search against the filtered one with a small page.
+
+Usage: python measure_vm_query.py [-n RUNS]
+Uses config.json and the saved user credentials like rdp_login.py.
+"""
+
+import argparse
+import ssl
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+import ovirtsdk4 as sdk
+from ovirtsdk4 import readers
+from ovirtsdk4 import xml
+
+import sdk_rdp_generate as rdp
+
+
+def vm_queries():
+    return {
+        'before': {'search': f'name={rdp.POOL_NAME}*'},
+        'after': {'search': f'name={rdp.POOL_NAME}*', 'filter': 'true', 'max': str(rdp.VM_PAGE_SIZE)},
+    }
+
+
+def fetch(token, query, context):
+    url = rdp.PANDORA_API_URL + '/vms?' + urllib.parse.urlencode(query)
+    request = urllib.request.Request(url, headers={
+        'Authorization': f'Bearer {token}',
+        'Accept': 'application/xml',
+        'Version': '4',
+    })
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, context=context) as response:
+        body = response.read()
+    fetch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vms = readers.VmReader.read_many(xml.XmlReader(body))
+    parse_time = time.perf_counter() - start
+    return len(body), len(vms), fetch_time, parse_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure vm search payload')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=10, help='Requests per query')
+    args = parser.parse_args()
+
+    rdp.init()
+    connect = rdp.RdpConnect()
+    connect.load_data()
+    connection = sdk.Connection(
+        url=rdp.PANDORA_API_URL,
+        username=connect.username,
+        password=connect.password,
+        ca_file=rdp.CA_FILE,
+    )
+    token = connection.authenticate()
+    context = ssl.create_default_context(cafile=rdp.CA_FILE)
+
+    try:
+        for name, query in vm_queries().items():
+            results = [fetch(token, query, context) for _ in range(args.runs)]
+            size, count = results[0][:2]
+            fetch_time = statistics.median(result[2] for result in results)
+            parse_time = statistics.median(result[3] for result in results)
+            print(f'{name}: {count} vms, {size} bytes, '
+                  f'fetch {fetch_time * 1000:.1f} ms, parse {parse_time * 1000:.1f} ms (median of {args.runs})')
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
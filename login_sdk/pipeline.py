@@ -0,0 +1,118 @@
+import time
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import spans
+
+
+class Step:
+    """
+    A command or a python function run by Pipeline, command can be a function returning it at run time.
+    requires - names of steps that must finish first,
+    critical - dependents are skipped when this step fails,
+    cleanup - runs after all other steps, even when they failed or raised,
+    secret - the command line is not logged, failures are logged without it: name and return code only.
+    """
+
+    def __init__(self, name, command=None, function=None, requires=(), critical=False, cleanup=False, secret=False):
+        self.name = name
+        self.command = command
+        self.function = function
+        self.requires = tuple(requires)
+        self.critical = critical
+        self.cleanup = cleanup
+        self.secret = secret
+
+
+class StepResult:
+    def __init__(self, ok, output=None, duration=0.0, skipped=False):
+        self.ok = ok
+        self.output = output
+        self.duration = duration
+        self.skipped = skipped
+
+
+class Pipeline:
+    """Run independent steps concurrently and dependent ones in order, log the time of every step"""
+
+    def __init__(self, steps, workers=4):
+        self.steps = list(steps)
+        self.workers = workers
+        self.results = {}
+
+        names = [step.name for step in self.steps]
+        for step in self.steps:
+            for name in step.requires:
+                if name not in names:
+                    raise ValueError(f'Step {step.name} requires unknown step {name}')
+
+    def run(self):
+        try:
+            self.run_steps([step for step in self.steps if not step.cleanup])
+        finally:
+            self.run_steps([step for step in self.steps if step.cleanup])
+        return self.results
+
+    def run_steps(self, steps):
+        pending = list(steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                for step in list(pending):
+                    if not all(name in self.results for name in step.requires):
+                        continue
+                    pending.remove(step)
+                    failed = [name for name in step.requires if self.failed(name)]
+                    if failed:
+                        logging.info(f'{step.name} skipped, failed: {", ".join(failed)}')
+                        self.results[step.name] = StepResult(False, skipped=True)
+                    else:
+                        running[executor.submit(self.run_step, step)] = step
+
+                if not running:
+                    if pending:
+                        raise ValueError('Steps wait for each other: ' + ', '.join(step.name for step in pending))
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    self.results[step.name] = future.result()
+
+    def failed(self, name):
+        step = next(step for step in self.steps if step.name == name)
+        result = self.results[name]
+        return step.critical and not result.ok
+
+    def run_step(self, step):
+        command = step.command() if callable(step.command) else step.command
+        if not step.secret and command:
+            logging.info(f'{step.name}: {command}')
+        start = time.perf_counter()
+        ok = True
+        output = None
+        with spans.span(step.name):
+            try:
+                if command:
+                    output = subprocess.check_output(command)
+                if step.function:
+                    output = step.function()
+            except (subprocess.CalledProcessError, OSError) as e:
+                self.log_error(step, e, 'error')
+                ok = False
+            except Exception as e:
+                self.log_error(step, e, 'unexpected error')
+                ok = False
+        duration = time.perf_counter() - start
+        logging.info(f'{step.name} answer: {output}, {duration:.3f} s')
+        return StepResult(ok, output, duration)
+
+    def log_error(self, step, error, kind):
+        if not step.secret:
+            logging.exception(f'{step.name} {kind}:')
+            return
+        # exception texts and tracebacks of a secret step can hold its command line
+        code = getattr(error, 'returncode', None)
+        reason = f'return code {code}' if code is not None else error.__class__.__name__
+        logging.error(f'{step.name} {kind}: {reason}')
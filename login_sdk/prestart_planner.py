@@ -0,0 +1,221 @@
+"""
+Prestarted vm count of a pool from the login history.
+Client sessions logs (sessions.log lines: start time, user, status, mode, connect=time-to-desktop) are binned
+into time-of-day slots, separately for workdays and weekends. The prestarted count for a moment is a quantile,
+over the days of the history, of the logins in the following horizon: the vms booted ahead cover the logins
+until the pool catches up. The pool is changed for now + lead, so vms are up before the peak.
+
+Usage:
+    python prestart_planner.py POOL LOG [LOG ...] --schedule [--date DAY]    - the day plan, no engine needed
+    python prestart_planner.py POOL LOG [LOG ...] [--apply] [--url URL]      - plan for now + lead, --apply sets it
+    python prestart_planner.py --synthetic FILE [--days N]                  - write a synthetic login history
+The plan is only printed without --apply. Run it from cron every few minutes with --apply.
+"""
+
+import argparse
+import datetime
+import glob
+import logging
+import math
+import random
+import sys
+
+
+SLOT = 15           # min
+HORIZON = 30        # logins covered by prestarted vms, min
+LEAD = 15           # plan this far ahead of now, min
+QUANTILE = 0.9      # of the day totals
+WAIT_TIME = 30      # time-to-desktop longer than this is a boot wait, sec
+
+
+def day_type(moment):
+    return 'weekend' if moment.weekday() >= 5 else 'workday'
+
+
+def parse_line(line):
+    """(start datetime, fields) of a sessions log line or None"""
+    started, _, fields = line.strip().partition(' ')
+    try:
+        moment = datetime.datetime.strptime(started, '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+    return moment, dict(field.split('=', 1) for field in fields.split() if '=' in field)
+
+
+def read_logins(patterns):
+    """Login attempts of all users: (start, time-to-desktop or None), prewarms and reconnects are left out"""
+    logins = []
+    for pattern in patterns:
+        for file_name in glob.glob(pattern) or [pattern]:
+            try:
+                with open(file_name, 'r') as file:
+                    lines = file.readlines()
+            except OSError:
+                logging.exception(f'Read {file_name} error: ')
+                continue
+            for line in lines:
+                session = parse_line(line)
+                if not session:
+                    continue
+                moment, fields = session
+                if fields.get('mode', 'login') != 'login' or fields.get('status') == '2':
+                    continue
+                connect = float(fields['connect']) if fields.get('status') == '1' and 'connect' in fields else None
+                logins.append((moment, connect))
+    return logins
+
+
+def quantile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(math.ceil(part * (len(values) - 1))), len(values) - 1)]
+
+
+class DemandModel:
+    """Logins per time-of-day slot for every day of the history"""
+
+    def __init__(self, slot=SLOT, horizon=HORIZON, part=QUANTILE):
+        self.slot = slot
+        self.horizon = horizon
+        self.part = part
+        self.days = {}      # day type: set of dates
+        self.counts = {}    # (date, slot): logins
+        self.times = {}     # (day type, slot): times to desktop
+
+    def slot_of(self, moment):
+        return (moment.hour * 60 + moment.minute) // self.slot
+
+    def fit(self, logins):
+        if logins:
+            first = min(moment for moment, _ in logins).date()
+            last = max(moment for moment, _ in logins).date()
+            # days without logins count as zero demand
+            for offset in range((last - first).days + 1):
+                date = first + datetime.timedelta(days=offset)
+                self.days.setdefault(day_type(date), set()).add(date)
+        for moment, connect in logins:
+            key = (moment.date(), self.slot_of(moment))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if connect is not None:
+                self.times.setdefault((day_type(moment), self.slot_of(moment)), []).append(connect)
+        return self
+
+    def demand(self, moment):
+        """Logins expected in [moment, moment + horizon)"""
+        kind = day_type(moment)
+        first = self.slot_of(moment)
+        slots = [(first + i) % (24 * 60 // self.slot) for i in range(max(self.horizon // self.slot, 1))]
+        totals = [sum(self.counts.get((date, slot), 0) for slot in slots) for date in self.days.get(kind, ())]
+        return quantile(totals, self.part)
+
+    def waits(self, moment, wait_time=WAIT_TIME):
+        """(logins with time to desktop, of them boot waits) in the slot of moment"""
+        times = self.times.get((day_type(moment), self.slot_of(moment)), [])
+        return len(times), len([connect for connect in times if connect > wait_time])
+
+
+def target(demand, current, minimum, maximum, step):
+    count = min(max(demand, minimum), maximum)
+    if step:
+        count = min(max(count, current - step), current + step)
+    return count
+
+
+def schedule(model, day, minimum, maximum):
+    print(f'{day_type(day)} {"time":>6}{"demand":>8}{"target":>8}{"logins":>8}{"waits":>7}')
+    moment = datetime.datetime.combine(day, datetime.time())
+    while moment.date() == day:
+        demand = model.demand(moment)
+        logins, waits = model.waits(moment)
+        if demand or logins:
+            print(f'{"":8}{moment:%H:%M}{demand:>8}{target(demand, 0, minimum, maximum, 0):>8}{logins:>8}{waits:>7}')
+        moment += datetime.timedelta(minutes=model.slot)
+
+
+def apply(args, model):
+    import ovirtsdk4.types as types
+    import provision
+
+    now = datetime.datetime.strptime(args.at, '%Y-%m-%dT%H:%M') if args.at else datetime.datetime.now()
+    moment = now + datetime.timedelta(minutes=args.lead)
+    demand = model.demand(moment)
+    url, ca_file = provision.engine_address(args.url, args.ca_file)
+    connection = provision.admin_connection(url, ca_file, args.admin)
+    try:
+        pools_service = connection.system_service().vm_pools_service()
+        pools = pools_service.list(search=f'name={args.pool}', max=1)
+        if not pools:
+            print(f'Pool {args.pool} not found')
+            return 1
+        pool = pools[0]
+        count = target(demand, pool.prestarted_vms or 0, args.min, min(args.max, pool.size or args.max), args.step)
+        print(f'{args.pool}: demand {demand} at {moment:%H:%M}, prestarted {pool.prestarted_vms} -> {count}'
+              + ('' if args.apply else ' (dry run)'))
+        if args.apply and count != pool.prestarted_vms:
+            pools_service.pool_service(pool.id).update(types.VmPool(prestarted_vms=count))
+            logging.info(f'Pool {args.pool} prestarted vms: {pool.prestarted_vms} -> {count}')
+    finally:
+        connection.close()
+    return 0
+
+
+def synthetic(file_name, days, users=200, seed=1):
+    """Workdays with a shift start peak at 8:00 and a smaller one at 14:00, few weekend logins"""
+    rng = random.Random(seed)
+    start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days), datetime.time())
+    with open(file_name, 'w') as file:
+        for day in range(days):
+            date = start + datetime.timedelta(days=day)
+            peaks = [(8, 0.7), (14, 0.2)] if day_type(date) == 'workday' else [(10, 0.05)]
+            for user in range(users):
+                for hour, share in peaks:
+                    if rng.random() >= share:
+                        continue
+                    moment = date + datetime.timedelta(hours=hour, minutes=rng.gauss(0, 12))
+                    connect = rng.uniform(1, 4) if rng.random() < 0.6 else rng.uniform(40, 90)
+                    file.write(f'{moment:%Y-%m-%dT%H:%M:%S} user=u{user} status=1 mode=login connect={connect:.3f}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prestarted vm count of a pool from the login history')
+    parser.add_argument('pool', action='store', type=str, nargs='?', help='Pool name')
+    parser.add_argument('logs', action='store', type=str, nargs='*', help='Sessions logs, wildcards allowed')
+    parser.add_argument('--schedule', action='store_true', dest='schedule', help='Print the plan of a day')
+    parser.add_argument('--date', action='store', dest='date', type=str, help='Day of --schedule, YYYY-MM-DD')
+    parser.add_argument('--at', action='store', dest='at', type=str, help='Plan as at YYYY-MM-DDTHH:MM, not now')
+    parser.add_argument('--apply', action='store_true', dest='apply', help='Change the pool, dry run without it')
+    parser.add_argument('--slot', action='store', dest='slot', type=int, default=SLOT, help='Slot, min')
+    parser.add_argument('--horizon', action='store', dest='horizon', type=int, default=HORIZON,
+                        help='Logins the prestarted vms cover, min')
+    parser.add_argument('--lead', action='store', dest='lead', type=int, default=LEAD, help='Plan ahead, min')
+    parser.add_argument('--quantile', action='store', dest='quantile', type=float, default=QUANTILE,
+                        help='Quantile of the daily logins')
+    parser.add_argument('--min', action='store', dest='min', type=int, default=0, help='Least prestarted vms')
+    parser.add_argument('--max', action='store', dest='max', type=int, default=50, help='Most prestarted vms')
+    parser.add_argument('--step', action='store', dest='step', type=int, default=0,
+                        help='Largest change per run, 0 - any')
+    parser.add_argument('-u', action='store', dest='admin', type=str, default='admin@internal', help='Admin user')
+    parser.add_argument('--url', action='store', dest='url', type=str, help='Engine api url')
+    parser.add_argument('--ca', action='store', dest='ca_file', type=str, help='Engine ca file')
+    parser.add_argument('--synthetic', action='store', dest='synthetic', type=str,
+                        help='Write a synthetic sessions log to this file and exit')
+    parser.add_argument('--days', action='store', dest='days', type=int, default=28, help='Synthetic history days')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        synthetic(args.synthetic, args.days)
+        return
+    if not args.pool or not args.logs:
+        parser.error('pool and sessions logs are required')
+
+    model = DemandModel(args.slot, args.horizon, args.quantile).fit(read_logins(args.logs))
+    if args.schedule:
+        day = datetime.date.fromisoformat(args.date) if args.date else datetime.date.today()
+        schedule(model, day, args.min, args.max)
+        return
+    sys.exit(apply(args, model))
+
+
+if __name__ == '__main__':
+    main()
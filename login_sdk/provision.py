@@ -0,0 +1,227 @@
+"""
+Pre-provisioning of pool vms before a shift starts.
+Every user of the list gets a free vm of the pool with the UserVmManager permission, like allocatevm
+gives it to the user, then the vm is started and waited for up: at login the client finds it ready.
+A user who already has a vm of the pool gets that vm started.
+Engine calls go through a bounded worker pool and a token bucket shared by all workers.
+
+Usage: python provision.py POOL USERS_FILE [-u ADMIN] [-w WORKERS] [--rate OPS] [--url URL] [--json FILE]
+USERS_FILE has one user name per line, the admin password is taken from PANDORA_PASSWORD or asked.
+Without --url the engine and ca file come from the client config.
+"""
+
+import argparse
+import getpass
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ovirtsdk4 as sdk
+import ovirtsdk4.types as types
+
+import retry
+import vm_waiter
+
+
+WORKERS = 8
+RATE = 5.0              # engine calls per second, all workers together
+TIMEOUT = 600           # wait for all vms up, sec
+USER_VM_MANAGER = 'UserVmManager'     # the role allocatevm gives on a vm, its id is looked up by name
+
+
+class Provisioner:
+    def __init__(self, url, token, ca_file, pool_name, workers=WORKERS, rate=RATE, timeout=TIMEOUT):
+        self.url = url
+        self.token = token
+        self.ca_file = ca_file
+        self.pool_name = pool_name
+        self.workers = workers
+        self.bucket = retry.TokenBucket(rate, burst=1)
+        self.policy = retry.RetryPolicy(time.monotonic() + timeout, bucket=self.bucket)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.free = []          # vm ids, running ones first
+        self.owned = {}         # user id: vm id
+        self.role_id = None     # of USER_VM_MANAGER
+
+    def connection(self):
+        """One connection per worker thread, sdk connections are not thread safe"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sdk.Connection(url=self.url, token=self.token, ca_file=self.ca_file)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def vms_service(self):
+        return self.connection().system_service().vms_service()
+
+    def close(self):
+        for connection in self.connections:
+            connection.close(logout=False)
+
+    def find_role(self):
+        roles = self.policy.call(self.connection().system_service().roles_service().list)
+        for role in roles:
+            if role.name == USER_VM_MANAGER:
+                return role.id
+        raise sdk.Error(f'Role {USER_VM_MANAGER} not found')
+
+    def scan(self):
+        """Sort the pool vms into free ones and ones already assigned to a user"""
+        self.role_id = self.find_role()
+        vms = self.policy.call(self.vms_service().list, search=f'name={self.pool_name}*')
+        logging.info(f'Pool {self.pool_name}: {len(vms)} vms')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            owners = list(executor.map(self.owner, vms))
+        running = []
+        for vm, owner in zip(vms, owners):
+            if owner:
+                self.owned[owner] = vm.id
+            elif str(vm.status) == 'down':
+                self.free.append(vm.id)
+            else:
+                running.append(vm.id)
+        self.free = running + self.free
+        logging.info(f'Free vms: {len(self.free)}, running: {len(running)}, assigned: {len(self.owned)}')
+
+    def owner(self, vm):
+        permissions = self.policy.call(self.vms_service().vm_service(vm.id).permissions_service().list)
+        for permission in permissions:
+            if permission.user and permission.role and permission.role.id == self.role_id:
+                return permission.user.id
+        return None
+
+    def take_vm(self, user_id):
+        """Return (vm id, assigned now) or (None, False) when the pool is exhausted"""
+        with self.lock:
+            if user_id in self.owned:
+                return self.owned[user_id], False
+            if not self.free:
+                return None, False
+            vm_id = self.free.pop(0)
+            self.owned[user_id] = vm_id
+            return vm_id, True
+
+    def provision(self, username):
+        start = time.monotonic()
+        result = {'user': username, 'vm': '', 'status': 'failed', 'time': 0.0, 'error': ''}
+        try:
+            users_service = self.connection().system_service().users_service()
+            users = self.policy.call(users_service.list, search=f'usrname={username}')
+            if not users:
+                result['error'] = 'user not found'
+                return result
+
+            vm_id, assign = self.take_vm(users[0].id)
+            if not vm_id:
+                result['error'] = 'no free vm'
+                return result
+            vm_service = self.vms_service().vm_service(vm_id)
+            if assign:
+                self.policy.once(vm_service.permissions_service().add, types.Permission(
+                    role=types.Role(id=self.role_id),
+                    user=types.User(id=users[0].id),
+                ))
+
+            # the waiter starts the vm when it is down
+            vm = vm_waiter.VmWaiter(vm_service, self.policy).wait(lambda vm: True)
+            result['vm'] = vm.name if vm else vm_id
+            result['status'] = 'up' if vm else 'timeout'
+        except sdk.Error as e:
+            logging.exception(f'Provision {username} error: ')
+            result['error'] = str(e).splitlines()[0] if str(e) else e.__class__.__name__
+        result['time'] = time.monotonic() - start
+        logging.info(f'Provision {username}: {result["status"]} {result["time"]:.1f} s {result["error"]}')
+        return result
+
+    def run(self, usernames):
+        self.scan()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.provision, usernames))
+
+
+def engine_address(url, ca_file):
+    """Engine api url and ca file, what is not given comes from the client config"""
+    if url:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+        return url, ca_file
+    import sdk_rdp_generate as rdp     # logs go to the client log file
+    rdp.init()
+    return rdp.PANDORA_API_URL, ca_file or rdp.CA_FILE
+
+
+def admin_connection(url, ca_file, admin):
+    password = os.environ.get('PANDORA_PASSWORD') or getpass.getpass(f'{admin} password: ')
+    return sdk.Connection(url=url, username=admin, password=password, ca_file=ca_file)
+
+
+def read_users(file_name):
+    with open(file_name, 'r') as file:
+        lines = [line.split('#')[0].strip() for line in file]
+    return [line for line in lines if line]
+
+
+def percentile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(round(part * (len(values) - 1))), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Allocate and start pool vms for a list of users')
+    parser.add_argument('pool', action='store', type=str, help='Pool name')
+    parser.add_argument('users', action='store', type=str, help='File with one user name per line')
+    parser.add_argument('-u', action='store', dest='admin', type=str, default='admin@internal', help='Admin user')
+    parser.add_argument('-w', action='store', dest='workers', type=int, default=WORKERS, help='Concurrent workers')
+    parser.add_argument('--rate', action='store', dest='rate', type=float, default=RATE,
+                        help='Engine operations per second, 0 - no limit')
+    parser.add_argument('--timeout', action='store', dest='timeout', type=int, default=TIMEOUT,
+                        help='Wait for vms up, sec')
+    parser.add_argument('--url', action='store', dest='url', type=str, help='Engine api url')
+    parser.add_argument('--ca', action='store', dest='ca_file', type=str, help='Engine ca file')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    usernames = read_users(args.users)
+    url, ca_file = engine_address(args.url, args.ca_file)
+    connection = admin_connection(url, ca_file, args.admin)
+    try:
+        token = connection.authenticate()
+    except sdk.Error as e:
+        print(f'Login error: {e}')
+        sys.exit(2)
+
+    start = time.monotonic()
+    provisioner = Provisioner(url, token, ca_file, args.pool, args.workers, args.rate, args.timeout)
+    try:
+        results = provisioner.run(usernames)
+    finally:
+        provisioner.close()
+        connection.close()
+    total = time.monotonic() - start
+
+    print(f'{"user":24}{"vm":24}{"status":>9}{"time s":>9}  error')
+    for result in results:
+        print(f'{result["user"]:24}{result["vm"]:24}{result["status"]:>9}{result["time"]:>9.1f}  {result["error"]}')
+    times = [result['time'] for result in results if result['status'] == 'up']
+    print(f'up {len(times)}/{len(results)}, time to up p50 {percentile(times, 0.5):.1f} s, '
+          f'p95 {percentile(times, 0.95):.1f} s, total {total:.1f} s')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'total': total, 'results': results}, file, indent=2)
+    if len(times) < len(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,36 @@
+import time
+STARTUP = [('start', time.perf_counter())]
+
+import logging
+import threading
 from PyQt5 import QtCore, QtGui, QtWidgets
 from functools import partial
 
 import sdk_rdp_generate as rdp
+import single_instance
+
+
+LOCK_POLL = 500     # connect lock held by a prewarm, ms
+NOTICE_TIME = 5000  # the notice of a later launch closes itself, ms
+
 
+def startup_mark(name):
+    STARTUP.append((name, time.perf_counter()))
 
-CONNECTION_STATUS = {
-    0: rdp.QT_CONF['welcome_text'],
-    1: 'Connection success',
-    2: rdp.QT_CONF['wrong_credentials'],
-    3: rdp.QT_CONF['unknown_problem'],
-}
+
+def startup_report():
+    start = STARTUP[0][1]
+    marks = ' '.join(f'{name}={mark - start:.3f}' for name, mark in STARTUP[1:])
+    logging.info(f'Startup timings, sec: {marks}')
+
+
+def connection_status():
+    return {
+        0: rdp.QT_CONF['welcome_text'],
+        1: 'Connection success',
+        2: rdp.QT_CONF['wrong_credentials'],
+        3: rdp.QT_CONF['unknown_problem'],
+    }
 
 
 class Thread(QtCore.QThread):
@@ -29,7 +50,7 @@ class Thread(QtCore.QThread):
 
 
 class LoginWindow(QtWidgets.QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, connect_lock=None, parent=None):
         QtWidgets.QWidget.__init__(self, parent=parent)
         width = rdp.QT_CONF['width']
         height = rdp.QT_CONF['height']
@@ -46,11 +67,21 @@ class LoginWindow(QtWidgets.QWidget):
         self.button_size = QtCore.QSize(90, 40)
         self.setWindowTitle(rdp.QT_CONF['title'])
 
+        self.connection_status = connection_status()
         self.status_login = 0
+        self.painted = False
+        # without the connect lock a prewarm connects: connect after it, allow_connect() is called then
+        self.connect_lock = connect_lock
+        self.connect_allowed = connect_lock is not None
+        self.connect_pending = False
+        self.lock_timer = QtCore.QTimer(self)
+        self.lock_timer.timeout.connect(self.poll_connect_lock)
+        if not self.connect_allowed:
+            self.lock_timer.start(LOCK_POLL)
         
-        # init rdp connection class
+        # init rdp connection class, user data is loaded in the thread_load
         self.rdp_connect = rdp.RdpConnect()
-        self.fullname, self.username, self.password = self.rdp_connect.load_data()
+        self.fullname, self.username, self.password = '', '', ''
 
         # display login form or waiting box or info box
         self.main_stack = QtWidgets.QStackedLayout()
@@ -126,10 +157,6 @@ class LoginWindow(QtWidgets.QWidget):
         self.login_text.setAlignment(QtCore.Qt.AlignRight)
         self.login_entry = QtWidgets.QLineEdit()
         self.login_entry.setFont(self.text_font)
-        if self.fullname:
-            self.login_entry.setText(self.fullname)
-        else:
-            self.login_entry.setText(self.username)
         self.login_entry.setReadOnly(True)
         self.form.addRow(self.login_text, self.login_entry)
 
@@ -163,6 +190,22 @@ class LoginWindow(QtWidgets.QWidget):
         self.thread_login = Thread()
         self.thread_login.signal.connect(self.end_login)
 
+        # identity lookups can block on the domain controller: show the window first
+        self.thread_load = Thread(partial_function=self.load_user)
+        self.thread_load.signal.connect(self.end_load)
+        self.display_waiting()
+        self.thread_load.start()
+
+    def load_user(self):
+        self.fullname, self.username, self.password = self.rdp_connect.load_data()
+
+    @QtCore.pyqtSlot(int)
+    def end_load(self, signal):
+        if self.fullname:
+            self.login_entry.setText(self.fullname)
+        else:
+            self.login_entry.setText(self.username)
+
         # show window depending on the availability of user data
         if self.username:
             if self.password:
@@ -174,7 +217,7 @@ class LoginWindow(QtWidgets.QWidget):
             self.display_info()
 
     def display_login(self):
-        self.message_text.setText(CONNECTION_STATUS[self.status_login])
+        self.message_text.setText(self.connection_status[self.status_login])
         self.main_stack.setCurrentIndex(self.form_id)
 
     def display_waiting(self):
@@ -183,17 +226,33 @@ class LoginWindow(QtWidgets.QWidget):
         self.main_stack.setCurrentIndex(self.waiting_id)
 
     def display_info(self):
-        self.info_text.setText(CONNECTION_STATUS[self.status_login])
+        self.info_text.setText(self.connection_status[self.status_login])
         self.main_stack.setCurrentIndex(self.info_id)
 
     def rdp_login(self):
         self.display_waiting()
+        if not self.connect_allowed:
+            self.connect_pending = True
+            return
         login = partial(self.rdp_connect.connect)
         self.thread_login.partial_function = login
 
         if not self.thread_login.isRunning():
             self.thread_login.start()
 
+    def poll_connect_lock(self):
+        self.connect_lock = rdp.connect_lock()
+        if self.connect_lock:
+            self.lock_timer.stop()
+            self.allow_connect()
+
+    def allow_connect(self):
+        logging.info('Prewarm finished')
+        self.connect_allowed = True
+        if self.connect_pending:
+            self.connect_pending = False
+            self.rdp_login()
+
     def on_ok_clicked(self):
         self.password = self.password_entry.text()
         if self.password:
@@ -224,12 +283,36 @@ class LoginWindow(QtWidgets.QWidget):
             self.info_text.setText('Error. Status: {}'.format(self.status_login))
         self.status_login = 0
 
+    def progress(self):
+        """Text of the current page, sent to later launches"""
+        page = self.main_stack.currentIndex()
+        if page == self.waiting_id:
+            return self.waiting_text.text()
+        if page == self.info_id:
+            return self.info_text.text()
+        return self.message_text.text()
+
+    def bring_forward(self):
+        if self.isHidden():
+            return
+        self.setWindowState(self.windowState() & ~QtCore.Qt.WindowMinimized | QtCore.Qt.WindowActive)
+        self.raise_()
+        self.activateWindow()
+
     def kill_connect(self):
         if self.thread_login.isRunning():
             self.thread_login.yieldCurrentThread()
         self.on_cancel_clicked()
 
+    def first_paint(self):
+        startup_mark('first_paint')
+        startup_report()
+        threading.Thread(target=rdp.init_background, daemon=True).start()
+
     def event(self, e):
+        if e.type() == QtCore.QEvent.Paint and not self.painted:
+            QtCore.QTimer.singleShot(0, self.first_paint)
+            self.painted = True
         if e.type() == QtCore.QEvent.KeyPress:
             if e.key() in (QtCore.Qt.Key_Enter, 16777220, 16777221):
                 if self.main_stack.currentIndex() == self.form_id:
@@ -241,14 +324,53 @@ class LoginWindow(QtWidgets.QWidget):
         return QtWidgets.QWidget.event(self, e)
 
 
+def notify_running(progress):
+    """Tell the user of a later launch what the running instance does, the exit code"""
+    if progress is None:
+        logging.error('Another instance holds the lock but does not answer')
+        text = rdp.QT_CONF.get('no_answer', 'The login window is already open but does not answer, try again later')
+        QtWidgets.QMessageBox.warning(None, rdp.QT_CONF['title'], text)
+        return 1
+
+    logging.info(f'Another instance is running: {progress}')
+    text = rdp.QT_CONF.get('already_running', 'The login window is already open')
+    box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Information, rdp.QT_CONF['title'], f'{text}\n{progress}')
+    QtCore.QTimer.singleShot(NOTICE_TIME, box.accept)
+    box.exec_()
+    return 0
+
+
 def main():
     import sys
     args = sys.argv
 
+    startup_mark('imports')
     app = QtWidgets.QApplication([args[0]])
-    window = LoginWindow()
+
+    # repeated launches attach to the running connect instead of starting another one;
+    # init() truncates the log of the running instance, so it comes after the lock
+    instance = single_instance.SingleInstance()
+    if not instance.acquire():
+        progress = instance.attach()
+        rdp.init(log_mode='a')
+        sys.exit(notify_running(progress))
+    # a prewarm holding the connect lock appends to the log, so does the window waiting for it
+    connect_lock = rdp.connect_lock()
+    rdp.init(log_mode='w' if connect_lock else 'a')
+    startup_mark('init')
+    if not connect_lock:
+        logging.info('Prewarm is running, connect after it')
+
+    window = LoginWindow(connect_lock)
+    instance.show.connect(window.bring_forward)
+    instance.progress = window.progress
+    startup_mark('window')
     window.show()
-    sys.exit(app.exec_())
+    status = app.exec_()
+    if window.connect_lock:
+        window.connect_lock.close()
+    instance.release()
+    sys.exit(status)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+import errno
+import itertools
+import time
+import socket
+import selectors
+import logging
+
+import spans
+
+
+PROBE_TIMEOUT = 0.5     # wait for a connect on all addresses, sec
+STAGGER_DELAY = 0.05    # head start of an address before the next one is tried, sec
+RESOLVE_TTL = 60        # keep resolved addresses, sec
+
+IN_PROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, 'WSAEWOULDBLOCK', -1))
+# the handshake completed and the peer dropped the connection since: the port is open
+ACCEPTED = (0, errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED,
+            getattr(errno, 'WSAECONNRESET', -1), getattr(errno, 'WSAECONNABORTED', -1))
+
+
+class RdpProber:
+    """
+    Check that a tcp port is open on any of the host addresses.
+    The host is resolved once and cached, connects to all A/AAAA addresses are raced
+    with a short head start for earlier ones (happy eyeballs), every attempt uses a fresh socket.
+    """
+
+    def __init__(self, port=3389, timeout=PROBE_TIMEOUT, resolve_ttl=RESOLVE_TTL):
+        self.port = port
+        self.timeout = timeout
+        self.resolve_ttl = resolve_ttl
+        self.cache = ('', [], 0)    # host, addresses, resolved; replaced at once, probes can run in threads
+
+    def resolve(self, host):
+        cached_host, addresses, resolved = self.cache
+        if host == cached_host and addresses and time.monotonic() - resolved < self.resolve_ttl:
+            return addresses
+
+        with spans.span('dns'):
+            infos = socket.getaddrinfo(host, self.port, type=socket.SOCK_STREAM)
+        # interleave address families in resolver order: a6, a4, a6, a4...
+        families = {}
+        for family, _, _, _, sockaddr in infos:
+            families.setdefault(family, []).append((family, sockaddr))
+        addresses = []
+        for group in itertools.zip_longest(*families.values()):
+            addresses.extend(address for address in group if address)
+
+        self.cache = (host, addresses, time.monotonic())
+        return addresses
+
+    def forget(self):
+        self.cache = ('', [], 0)
+
+    def probe(self, host):
+        """Return the first sockaddr accepting a connection or None"""
+        try:
+            pending = list(self.resolve(host))
+        except socket.gaierror:
+            logging.info(f'Can`t resolve {host}')
+            self.forget()
+            return None
+
+        with spans.span('rdp_probe'):
+            return self.race(pending)
+
+    def race(self, pending):
+        selector = selectors.DefaultSelector()
+        now = time.monotonic()
+        deadline = now + self.timeout
+        next_start = now
+        try:
+            while now < deadline and (pending or selector.get_map()):
+                if pending and (now >= next_start or not selector.get_map()):
+                    family, sockaddr = pending.pop(0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    code = sock.connect_ex(sockaddr)
+                    if code == 0:
+                        sock.close()
+                        return sockaddr
+                    if code in IN_PROGRESS:
+                        selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                    else:
+                        sock.close()
+                    next_start = now + STAGGER_DELAY
+                    now = time.monotonic()
+                    continue
+
+                wait = (min(deadline, next_start) if pending else deadline) - now
+                for key, _ in selector.select(max(wait, 0)):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    sock.close()
+                    if code in ACCEPTED:
+                        return key.data
+                    next_start = now    # failed fast, try next address at once
+                now = time.monotonic()
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+        return None
@@ -0,0 +1,116 @@
+"""
+Pacing of engine calls.
+RetryPolicy - delays with exponential backoff and jitter up to a deadline, retries of transient errors;
+TokenBucket - the rate of engine calls, BUCKET is shared by everything in the process.
+With jitter the polls of clients started together spread out instead of hitting the engine in waves.
+"""
+
+import time
+import random
+import logging
+import threading
+
+
+RATE = 10.0             # engine calls per sec of one process
+BURST = 10
+BASE_DELAY = 1.0        # sec
+MAX_DELAY = 5.0         # sec
+BACKOFF_FACTOR = 1.5
+RETRIES = 3             # of one call on transient errors
+TRANSIENT_CODES = (502, 503, 504)
+JITTER = 0.5            # delays are random within +-50%, 0 - no jitter
+
+
+class TokenBucket:
+    """rate calls per sec on average, up to burst at once; rate 0 - no limit"""
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Wait for a token, False when the deadline comes first"""
+        if not self.rate:
+            return True
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+BUCKET = TokenBucket()
+
+
+def transient(error):
+    """Network errors and answers of an overloaded engine, worth another try"""
+    import ovirtsdk4 as sdk     # loaded by the caller already, not at import time
+    if isinstance(error, (sdk.AuthError, sdk.NotFoundError)):
+        return False
+    return isinstance(error, sdk.ConnectionError) or getattr(error, 'code', None) in TRANSIENT_CODES
+
+
+class RetryPolicy:
+    """
+    Delays and retries of one job with a deadline, e.g. one connect.
+    delay(attempt) is min(cap, base * factor ** attempt) +-JITTER, random around it: the average delay
+    and the number of polls stay the same as without jitter,
+    call() takes a bucket token before every call and retries transient errors.
+    Sleeping ends at the deadline or when stop is set; waiting for a token does not: no call goes out unpaced.
+    """
+
+    def __init__(self, deadline, base=BASE_DELAY, cap=MAX_DELAY, factor=BACKOFF_FACTOR, retries=RETRIES,
+                 bucket=None, stop=None):
+        self.deadline = deadline
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.retries = retries
+        self.bucket = bucket or BUCKET
+        self.stop = stop or threading.Event()
+
+    def delay(self, attempt, base=None, cap=None):
+        base = self.base if base is None else base
+        cap = self.cap if cap is None else cap
+        delay = min(cap, base * self.factor ** attempt)
+        return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def sleep(self, delay):
+        """Sleep, no longer than up to the deadline; False when it has passed or stop is set"""
+        remaining = self.remaining()
+        if remaining <= 0 or self.stop.is_set():
+            return False
+        return not self.stop.wait(min(delay, remaining))
+
+    def once(self, function, *args, **kwargs):
+        """Paced call without retries, for calls that must not be repeated"""
+        self.bucket.acquire()
+        return function(*args, **kwargs)
+
+    def call(self, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not transient(e):
+                    raise
+                delay = self.delay(attempt)
+                attempt += 1
+                logging.info(f'Engine call error: {e!r}, retry {attempt} in {delay:.2f} s')
+                if not self.sleep(delay):
+                    raise
@@ -1,84 +1,188 @@
-import ovirtsdk4 as sdk
 import time
 import os
+import argparse
 import subprocess
 import json
 import logging
 import sys
 import re
-import socket
+import threading
 
 
-import windows_utils as utils
+import vm_waiter
+import rdp_probe
+import spans
+import identity
+import pipeline
+import endpoints
+import retry
 
-HOME_PATH = os.environ['USERPROFILE']
-APP_DATA = os.environ['LOCALAPPDATA']
-LOG_FOLDER = os.environ['TEMP']
+if os.name == 'nt':
+    import windows_utils as utils
+else:
+    import linux_utils as utils
+
+HOME_PATH = os.environ.get('USERPROFILE', os.path.expanduser('~'))
+APP_DATA = os.environ.get('LOCALAPPDATA', os.path.join(HOME_PATH, '.local', 'share'))
+LOG_FOLDER = os.environ.get('TEMP', '/tmp')
 
-CURRENT = os.getcwd()
+# the install folder, not the working directory: logon tasks and cron jobs start elsewhere
+CURRENT = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
 RES_FOLDER = os.path.join(CURRENT, 'res')
 CONFIG_FILE = os.path.join(RES_FOLDER, 'config.json')
 
 LOG_FILE = os.path.join(LOG_FOLDER, 'pandora_connection.log')
-logging.basicConfig(
-    level=logging.INFO,
-    filename=LOG_FILE,
-    filemode='w',
-    format='%(asctime)s | %(levelname)s | %(message)s',
-)
-
-try:
-    with open(CONFIG_FILE, 'r') as file:
-        CONFIG = json.load(file)
-except:
-    logging.exception('Load config file: ')
-    sys.exit(4)
-
-try:
-    MAIN_CONFIG = CONFIG['main_config']
-    QT_CONF = CONFIG['qt_config']
-
-    POOL_NAME = MAIN_CONFIG['pool_name']
-    PANDORA_API_URL = MAIN_CONFIG['pandora_api_address'].strip(' /\\')
-    DOMAIN = MAIN_CONFIG['domain']
-    CA_FILE = os.path.join(RES_FOLDER, MAIN_CONFIG['ca_file'].strip(' /\\'))
-    ICON = os.path.join(RES_FOLDER, MAIN_CONFIG['icon'].strip(' /\\'))
-    ICON_DOWNLOADS = os.path.join(RES_FOLDER, MAIN_CONFIG['icon_downloads'].strip(' /\\'))
-    RDP_SOURCE_FILE = os.path.join(RES_FOLDER, MAIN_CONFIG['rdp_source_file'].strip(' /\\'))
-    USER_DATA_FOLDER = os.path.join(APP_DATA, MAIN_CONFIG['user_data_folder'].strip(' /\\'))
-    RDP_DESTINATION_FILE = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG['rdp_destination_file'].strip(' /\\'))
-    USER_DATA = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG['user_data'].strip(' /\\'))
-    SHARED_DISK = MAIN_CONFIG['shared_disk'].strip(' /\\')
-    SHARED_FOLDER = os.path.join(HOME_PATH, MAIN_CONFIG['shared_folder'].strip(' /\\'))
-    DOWNLOADS = os.path.join(SHARED_FOLDER, MAIN_CONFIG['downloads'].strip(' /\\'))
-    PROFILE = os.path.join(SHARED_FOLDER, MAIN_CONFIG['profile'].strip(' /\\'))
-    LINK_NAME = MAIN_CONFIG['link_name'].strip(' /\\')
-    MAX_TIME_LAUNCH_VM = int(MAIN_CONFIG['max_time_launch_vm'])
-except:
-    logging.exception('Read config file: ')
-    sys.exit(4)
-
-
-def check_folder(folder):
+# held by the login window and the prewarm while they connect, known before init(): the prewarm checks it first
+CONNECT_LOCK = os.path.join(APP_DATA, 'pandora_connect.lock')
+
+# console programs, config 'commands' can replace them (e.g. with stubs off windows)
+DEFAULT_COMMANDS = {
+    'subst': 'subst',
+    'cmdkey': 'cmdkey',
+    'mstsc': 'mstsc',
+}
+
+# names and sid of the user, resolved in background by init()
+IDENTITY = identity.Identity(utils)
+
+# ovirtsdk4 (pycurl, libxml) and modules built on it, imported by load_sdk()
+sdk = None
+vm_allocator = None
+sdk_lock = threading.Lock()
+token_lock = threading.Lock()
+
+
+def init(log_mode='w'):
+    """
+    Configure logging, read the config and create user folders. Exit with code 4 on a bad config.
+    log_mode 'w' starts a new log: only the process holding the single instance lock may use it.
+    """
+    global CONFIG, MAIN_CONFIG, QT_CONF, POOL_NAMES, POOL_NAME, PANDORA_API_URLS, PANDORA_API_URL, DOMAIN, CA_FILE, \
+        ICON, ICON_DOWNLOADS, RDP_SOURCE_FILE, USER_DATA_FOLDER, RDP_DESTINATION_FILE, USER_DATA, TOKEN_FILE, \
+        TOKEN_TTL, SESSION_FILE, SHARED_DISK, SHARED_FOLDER, DOWNLOADS, PROFILE, LINK_NAME, LINK_INDEX, \
+        MAX_TIME_LAUNCH_VM, VM_PAGE_SIZE, TRACE, TRACE_FILE, SESSIONS_LOG, IDENTITY_FILE, IDENTITY_TTL, COMMANDS, \
+        RECONNECT, MAX_RECONNECTS, USER_EXIT_CODES, ENDPOINTS_FILE, HEDGE_DELAY, UNUSED_VM, POOL_HEDGE, PREWARM_DAYS, \
+        PREWARM_HOURS, FQDN_PATTERN, IDENTITY, ENDPOINTS
+
+    logging.basicConfig(
+        level=logging.INFO,
+        filename=LOG_FILE,
+        filemode=log_mode,
+        format='%(asctime)s | %(levelname)s | %(message)s',
+    )
+
     try:
-        if not os.path.isdir(folder):
-            os.mkdir(folder)
+        with open(CONFIG_FILE, 'r') as file:
+            CONFIG = json.load(file)
     except:
-        logging.exception('check folder: ')
+        logging.exception('Load config file: ')
+        sys.exit(4)
 
+    try:
+        MAIN_CONFIG = CONFIG['main_config']
+        QT_CONF = CONFIG['qt_config']
+
+        # one pool or an ordered list of equivalent pools raced for the first ready vm
+        POOL_NAMES = MAIN_CONFIG['pool_name']
+        if isinstance(POOL_NAMES, str):
+            POOL_NAMES = [POOL_NAMES]
+        POOL_NAME = POOL_NAMES[0]
+        # one engine url or a list of equivalent front ends
+        PANDORA_API_URLS = MAIN_CONFIG['pandora_api_address']
+        if isinstance(PANDORA_API_URLS, str):
+            PANDORA_API_URLS = [PANDORA_API_URLS]
+        PANDORA_API_URLS = [url.strip(' /\\') for url in PANDORA_API_URLS]
+        PANDORA_API_URL = PANDORA_API_URLS[0]
+        DOMAIN = MAIN_CONFIG['domain']
+        CA_FILE = os.path.join(RES_FOLDER, MAIN_CONFIG['ca_file'].strip(' /\\'))
+        ICON = os.path.join(RES_FOLDER, MAIN_CONFIG['icon'].strip(' /\\'))
+        ICON_DOWNLOADS = os.path.join(RES_FOLDER, MAIN_CONFIG['icon_downloads'].strip(' /\\'))
+        RDP_SOURCE_FILE = os.path.join(RES_FOLDER, MAIN_CONFIG['rdp_source_file'].strip(' /\\'))
+        USER_DATA_FOLDER = os.path.join(APP_DATA, MAIN_CONFIG['user_data_folder'].strip(' /\\'))
+        RDP_DESTINATION_FILE = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG['rdp_destination_file'].strip(' /\\'))
+        USER_DATA = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG['user_data'].strip(' /\\'))
+        TOKEN_FILE = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG.get('token_file', 'token.dat').strip(' /\\'))
+        TOKEN_TTL = int(MAIN_CONFIG.get('token_ttl', 1800))
+        SESSION_FILE = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG.get('session_file', 'session.json').strip(' /\\'))
+        SHARED_DISK = MAIN_CONFIG['shared_disk'].strip(' /\\')
+        SHARED_FOLDER = os.path.join(HOME_PATH, MAIN_CONFIG['shared_folder'].strip(' /\\'))
+        DOWNLOADS = os.path.join(SHARED_FOLDER, MAIN_CONFIG['downloads'].strip(' /\\'))
+        PROFILE = os.path.join(SHARED_FOLDER, MAIN_CONFIG['profile'].strip(' /\\'))
+        LINK_NAME = MAIN_CONFIG['link_name'].strip(' /\\')
+        LINK_INDEX = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG.get('link_index', 'links.json').strip(' /\\'))
+        MAX_TIME_LAUNCH_VM = int(MAIN_CONFIG['max_time_launch_vm'])
+        VM_PAGE_SIZE = int(MAIN_CONFIG.get('vm_page_size', 1))
+        TRACE = bool(MAIN_CONFIG.get('trace', True))
+        TRACE_FILE = os.path.join(LOG_FOLDER, 'pandora_trace.json')
+        SESSIONS_LOG = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG.get('sessions_log', 'sessions.log').strip(' /\\'))
+        IDENTITY_FILE = os.path.join(USER_DATA_FOLDER, MAIN_CONFIG.get('identity_file', 'identity.json').strip(' /\\'))
+        IDENTITY_TTL = int(MAIN_CONFIG.get('identity_ttl', identity.IDENTITY_TTL))
+        COMMANDS = dict(DEFAULT_COMMANDS, **MAIN_CONFIG.get('commands', {}))
+        RECONNECT = bool(MAIN_CONFIG.get('reconnect', True))
+        MAX_RECONNECTS = int(MAIN_CONFIG.get('max_reconnects', 3))
+        USER_EXIT_CODES = [int(code) for code in MAIN_CONFIG.get('user_exit_codes', [0])]
+        ENDPOINTS_FILE = os.path.join(
+            USER_DATA_FOLDER, MAIN_CONFIG.get('endpoints_file', 'endpoints.json').strip(' /\\'))
+        HEDGE_DELAY = MAIN_CONFIG.get('hedge_delay')    # sec, None - from the endpoint latency
+        UNUSED_VM = MAIN_CONFIG.get('unused_vm', 'stop')    # vms of the pools that lost the race: stop or keep
+        POOL_HEDGE = float(MAIN_CONFIG.get('pool_hedge', 20))   # sec before the next pool joins the race
+        PREWARM_DAYS = float(MAIN_CONFIG.get('prewarm_days', 14))   # prewarm only users who logged in lately
+        PREWARM_HOURS = MAIN_CONFIG.get('prewarm_hours', [0, 24])   # local hours [from, to) prewarm may run
+    except:
+        logging.exception('Read config file: ')
+        sys.exit(4)
 
-check_folder(USER_DATA_FOLDER)
-check_folder(SHARED_FOLDER)
-check_folder(DOWNLOADS)
-check_folder(PROFILE)
+    FQDN_PATTERN = 'int.*' + DOMAIN
+    spans.TRACER.enabled = TRACE
 
-if os.name == 'nt':
-    import win_link
-    
+    check_folder(USER_DATA_FOLDER, private=True)
+    check_folder(SHARED_FOLDER)
+    check_folder(DOWNLOADS)
+    check_folder(PROFILE)
+
+    IDENTITY = identity.Identity(utils, IDENTITY_FILE, IDENTITY_TTL).start()
+    ENDPOINTS = endpoints.EndpointSelector(PANDORA_API_URLS, ENDPOINTS_FILE, HEDGE_DELAY)
+
+
+def load_sdk():
+    global sdk, vm_allocator
+    with sdk_lock:
+        if sdk is None:
+            with spans.span('load_sdk'):
+                import ovirtsdk4
+                import vm_allocator as allocator
+            vm_allocator = allocator
+            sdk = ovirtsdk4
+
+
+def init_background():
+    """Work the login window does not wait for: heavy imports and the desktop shortcut"""
     try:
-        win_link.safely_create_link(LINK_NAME, DOWNLOADS, ICON_DOWNLOADS)
+        load_sdk()
     except:
-        logging.exception('win link error: ')
+        logging.exception('Load sdk error: ')
+
+    if os.name == 'nt':
+        try:
+            import win_link
+            win_link.safely_create_link(LINK_NAME, DOWNLOADS, ICON_DOWNLOADS, LINK_INDEX)
+        except:
+            logging.exception('win link error: ')
+
+
+def close_connection(connection):
+    connection.close(logout=False)
+
+
+def check_folder(folder, private=False):
+    """private - the folder of the password and token, only the user may access it"""
+    try:
+        if private:
+            utils.private_folder(folder)
+        elif not os.path.isdir(folder):
+            os.mkdir(folder)
+    except:
+        logging.exception('check folder: ')
 
 
 class RdpConnect:
@@ -90,14 +194,18 @@ class RdpConnect:
         self.fqdn = ''
         self.port = 3389
         self.address = (self.fqdn, self.port)
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(1)
+        self.prober = rdp_probe.RdpProber(self.port)
+        self.rdp_text = ''
+        self.url = ''           # engine endpoint of the last connection
+        self.pool_name = ''     # pool of the last vm
+        self.mode = 'login'
+        self.policy = retry.RetryPolicy(0)
     
     def load_data(self):
         logging.info('Load data')
         
         try:
-            self.fullname, self.username = utils.get_name()
+            self.fullname, self.username = IDENTITY.name()
         except:
             logging.exception('get name error: ')
          
@@ -109,117 +217,237 @@ class RdpConnect:
             encrypt_password = ''
         
         if encrypt_password:
-            try:
-                self.password = utils.decrypt_data(encrypt_password)
-            except:
-                logging.exception('Decrypt data: ')
-                self.password = ''
+            self.password = self.decrypt_password(encrypt_password)
             
         return self.fullname, self.username, self.password
 
+    def decrypt_password(self, encrypt_password):
+        try:
+            return utils.unprotect_data(encrypt_password, IDENTITY.entropy())
+        except:
+            logging.exception('Decrypt data: ')
+        if not IDENTITY.cached:
+            return ''
+
+        # the cached sid can be out of date: look the identity up again once
+        IDENTITY.forget()
+        try:
+            return utils.unprotect_data(encrypt_password, IDENTITY.entropy())
+        except:
+            logging.exception('Decrypt data with a new identity lookup: ')
+            return ''
+
     def save_data(self, password):
         logging.info('Save data')
         self.password = password
 
         try:
-            encrypt_password = utils.encrypt_data(self.password)
+            encrypt_password = utils.protect_data(self.password, IDENTITY.entropy(), name='password')
         except:
             logging.exception('Encrypt data: ')
             encrypt_password = ''
 
         try:
-            with open(USER_DATA, 'w') as file:
-                file.write(encrypt_password)
+            utils.write_private(USER_DATA, encrypt_password)
         except:
             logging.exception('Write data file: ')
-    
-    def connect(self):
-        logging.info('Connect to ovirt')
-        logging.info(f'username: {self.username}')
+
+        self.drop_token()
+
+    def load_tokens(self):
+        """{url: token data} of all engine endpoints"""
         try:
-            connection = sdk.Connection(
-                url=PANDORA_API_URL,
-                username=self.username,
-                password=self.password,
-                ca_file=CA_FILE,
-                # insecure=True,
-                # debug=True,
-            )
-        except sdk.Error:
-            logging.exception('Connection error: ')
-            return 3
+            with open(TOKEN_FILE, 'r') as file:
+                return json.loads(utils.unprotect_data(file.read(), IDENTITY.entropy()))
+        except FileNotFoundError:
+            return {}
         except:
-            logging.exception('Unexpected Connection error: ')
-            return 3
+            logging.exception('Load token error: ')
+            return {}
+
+    def load_token(self, url):
+        token_data = self.load_tokens().get(url)
+        if not token_data or token_data.get('username') != self.username:
+            return ''
+        if token_data.get('expires', 0) < time.time():
+            logging.info('Token expired')
+            return ''
+        return token_data.get('token', '')
+
+    def save_token(self, url, token):
+        with token_lock:
+            tokens = self.load_tokens()
+            tokens[url] = {
+                'username': self.username,
+                'token': token,
+                'expires': time.time() + TOKEN_TTL,
+            }
+            self.write_tokens(tokens)
+
+    def write_tokens(self, tokens):
+        try:
+            encrypt_token = utils.protect_data(json.dumps(tokens), IDENTITY.entropy(), name='tokens')
+            utils.write_private(TOKEN_FILE, encrypt_token)
+        except:
+            logging.exception('Save token error: ')
+
+    def drop_token(self, url=None):
+        """Forget the token of one endpoint or all of them"""
+        if url:
+            with token_lock:
+                tokens = self.load_tokens()
+                if tokens.pop(url, None):
+                    self.write_tokens(tokens)
+            return
+        try:
+            os.remove(TOKEN_FILE)
+        except FileNotFoundError:
+            pass
+        except:
+            logging.exception('Drop token error: ')
+
+    def open_connection(self):
+        """Connection to the first engine endpoint that answers"""
+        url, connection = ENDPOINTS.first(self.open_endpoint, cancel=close_connection, fatal=(sdk.AuthError,))
+        self.url = url
+        return connection
+
+    def open_endpoint(self, url):
+        token = self.load_token(url)
+        if token:
+            connection = sdk.Connection(url=url, token=token, ca_file=CA_FILE)
+            try:
+                with spans.span('token_check', url=url):
+                    self.policy.call(connection.test, raise_exception=True)
+            except sdk.AuthError:
+                logging.info('Cached token rejected')
+                connection.close(logout=False)
+                self.drop_token(url)
+            except:
+                connection.close(logout=False)
+                raise
+            else:
+                logging.info('Cached token accepted')
+                self.save_token(url, token)
+                return connection
+
+        connection = sdk.Connection(
+            url=url,
+            username=self.username,
+            password=self.password,
+            ca_file=CA_FILE,
+            # insecure=True,
+            # debug=True,
+        )
+        try:
+            with spans.span('sso', url=url):
+                token = self.policy.call(connection.authenticate)
+            self.save_token(url, token)
+        except:
+            connection.close(logout=False)
+            raise
+        return connection
+
+    def connect(self, mode='login'):
+        """mode goes to the sessions log: login, reconnect or prewarm"""
+        self.mode = mode
+        spans.TRACER.reset()
+        with spans.span('connect'):
+            try:
+                load_sdk()
+            except:
+                logging.exception('Load sdk error: ')
+                status = 3
+            else:
+                status = self.connect_vm()
+        self.finish_trace(status)
+        return status
 
-        system_service = connection.system_service()
-        pools_service = system_service.vm_pools_service()
+    def finish_trace(self, status):
+        if not spans.TRACER.enabled:
+            return
         try:
-            pool_service = pools_service.list(search='name={}'.format(POOL_NAME))[0]
+            spans.TRACER.write_trace(TRACE_FILE)
+            line = spans.TRACER.write_summary(SESSIONS_LOG, user=self.username, status=status, mode=self.mode)
+        except:
+            logging.exception('Write trace error: ')
+        else:
+            logging.info(f'Session timings: {line}')
+
+    def connect_vm(self):
+        logging.info('Connect to ovirt')
+        logging.info(f'username: {self.username}')
+        # pacing and the deadline of all engine calls of this connect
+        self.policy = retry.RetryPolicy(time.monotonic() + MAX_TIME_LAUNCH_VM)
+        try:
+            connection = self.open_connection()
         except sdk.AuthError:
             logging.exception('Bad credentials: ')
-            connection.close()
             return 2
-        except (sdk.ConnectionError, sdk.Error, IndexError):
+        except sdk.Error:
             logging.exception('Connection error: ')
-            connection.close()
             return 3
         except:
-            logging.exception('Unexpected connection error: ')
-            connection.close()
+            logging.exception('Unexpected Connection error: ')
             return 3
-        pool = pools_service.pool_service(pool_service.id)
-        logging.info(f'Pool id: {pool_service.id}')
 
+        system_service = connection.system_service()
         vms_service = system_service.vms_service()
-        for i in range(MAX_TIME_LAUNCH_VM):
-            vms = vms_service.list(search=f'name={POOL_NAME}*')
-            if len(vms):
-                vm = vms[0]
-                self.fqdn = vm.fqdn
-
-                vm_service = vms_service.vm_service(vm.id)
-                if vm.status == 'down':
-                    vm_service.start()
-
-                logging.info(f'VM id: {vm.id}, fqdn: {self.fqdn}')
-
-                if re.search('int.*' + DOMAIN, self.fqdn, re.IGNORECASE):
-                    self.address = (self.fqdn, self.port)
-                    try:
-                        self.socket.connect(self.address)
-                    except socket.timeout:
-                        logging.info('RDP closed')   # wait 1 sec if rdp is close (socket_timeout = 1 sec)
-                        continue
-                    except:
-                        logging.exception('Unexpected socket error: ')
-                        time.sleep(1)
-                        continue
-                    else:
-                        logging.info('RDP OK')
-                        break
+
+        ready_vm = None
+        vm = self.find_last_vm(vms_service)
+        if not vm:
+            try:
+                if len(POOL_NAMES) > 1:
+                    vm = ready_vm = self.race_pools()
                 else:
-                    logging.info('VM fqdn not valid')
-            else:
-                logging.info('Allocating vm...')
-                try:
-                    pool.allocate_vm()
-                except sdk.Error:
-                    logging.exception('Allocation error: ')
+                    self.pool_name = POOL_NAME
+                    vm = self.allocate_vm(system_service, self.policy, POOL_NAME)
+            except sdk.AuthError:
+                logging.exception('Bad credentials: ')
+                connection.close(logout=False)
+                self.drop_token(self.url)
+                return 2
+            except (sdk.ConnectionError, sdk.Error, IndexError):
+                logging.exception('Connection error: ')
+                connection.close(logout=False)
+                return 3
+            except:
+                logging.exception('Unexpected connection error: ')
+                connection.close(logout=False)
+                return 3
 
-            time.sleep(1)
-        else:
-            logging.error('Timeout vm preparation or Can`t find allocated VM')
-            connection.close()
+            if not vm:
+                logging.error('Timeout vm allocation')
+                connection.close(logout=False)
+                return 3
+
+        logging.info(f'VM id: {vm.id}')
+
+        if not ready_vm:
+            # poll vm status with backoff, probe rdp only when vm is up
+            waiter = vm_waiter.VmWaiter(vms_service.vm_service(vm.id), self.policy)
+            try:
+                with spans.span('boot'):
+                    ready_vm = waiter.wait(self.rdp_ready)
+            except sdk.Error:
+                logging.exception('VM status error: ')
+
+        if not ready_vm:
+            logging.error('Timeout vm preparation')
+            connection.close(logout=False)
             return 3
 
-        connection.close()
+        vm = ready_vm
+        self.fqdn = vm.fqdn
+        self.address = (self.fqdn, self.port)
+        self.save_session(vm)
+        connection.close(logout=False)
 
+        # the file is written by run_rdp_console together with other pre-launch steps
         try:
             with open(RDP_SOURCE_FILE, 'r') as file:
-                rdp_text = file.read().format(self.fqdn, SHARED_DISK)
-            with open(RDP_DESTINATION_FILE, 'w') as file:
-                file.write(rdp_text)
+                self.rdp_text = file.read().format(self.fqdn, SHARED_DISK)
         except:
             logging.exception('Load config file: ')
             return 3
@@ -227,61 +455,334 @@ class RdpConnect:
         logging.info('End connection')
         return 1
 
-    def run_rdp_console(self):
-        logging.info('Exec cmd programs')
-
-        cmd_map_folder = ['subst', SHARED_DISK, SHARED_FOLDER]
-        logging.info(f'Map folder: {cmd_map_folder}')
+    def load_session(self):
         try:
-            ans_map_folder = subprocess.check_output(cmd_map_folder)
-        except subprocess.CalledProcessError:
-            logging.exception('map folder error:')
-        else:
-            logging.info(f'Map folder answer: {ans_map_folder}')
-
-        cmd_add_pass = ['cmdkey', '/add:' + self.fqdn, '/user:' + self.username, '/pass:' + self.password]
-        logging.info(f'Add pass... FQDN: {self.fqdn}')
+            with open(SESSION_FILE, 'r') as file:
+                session = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except:
+            logging.exception('Load session error: ')
+            return {}
+
+        if session.get('username') != self.username or session.get('pool_name') not in POOL_NAMES:
+            return {}
+        return session
+
+    def save_session(self, vm):
+        session = {
+            'username': self.username,
+            'pool_name': self.pool_name,
+            'pool_id': vm.vm_pool.id if vm.vm_pool else '',
+            'vm_id': vm.id,
+            'fqdn': self.fqdn,
+            'time': time.time(),
+        }
         try:
-            ans_add_pass = subprocess.check_output(cmd_add_pass)
-        except subprocess.CalledProcessError:
-            logging.exception('add pass error:')
-        else:
-            logging.info(f'Add pass answer: {ans_add_pass}')
+            with open(SESSION_FILE, 'w') as file:
+                json.dump(session, file)
+        except:
+            logging.exception('Save session error: ')
+
+    def find_last_vm(self, vms_service):
+        session = self.load_session()
+        if not session:
+            return None
 
-        cmd_rdp = ['mstsc', RDP_DESTINATION_FILE]
-        logging.info(f'Rdp: {cmd_rdp}')
         try:
-            ans_rdp = subprocess.check_output(cmd_rdp)
-        except subprocess.CalledProcessError:
-            logging.exception('rdp error:')
-        else:
-            logging.info(f'RDP answer: {ans_rdp}')
+            with spans.span('last_vm'):
+                # filtered by the user's permissions: a vm given to somebody else is not found
+                vm = self.policy.call(vms_service.vm_service(session['vm_id']).get, filter=True)
+        except sdk.NotFoundError:
+            logging.info('Last vm is gone or was reassigned')
+            return None
+        except sdk.Error:
+            logging.exception('Last vm error: ')
+            return None
+
+        if not vm.vm_pool or vm.vm_pool.id != session['pool_id']:
+            logging.info('Last vm was reassigned')
+            return None
+        logging.info('Last vm found')
+        self.pool_name = session['pool_name']
+        return vm
+
+    def allocate_vm(self, system_service, policy, pool_name):
+        pools_service = system_service.vm_pools_service()
+        with spans.span('pool_search', pool=pool_name):
+            pool_service = policy.call(pools_service.list, search='name={}'.format(pool_name), max=1)[0]
+        pool = pools_service.pool_service(pool_service.id)
+        logging.info(f'Pool {pool_name} id: {pool_service.id}')
 
-        cmd_del_pass = ['cmdkey', '/delete:' + self.fqdn]
-        logging.info(f'Del pass: {cmd_del_pass}')
+        vms_service = system_service.vms_service()
+
+        def find_vm():
+            # only vms the user has permissions on, no more than the code reads
+            vms = vms_service.list(search=f'name={pool_name}*', filter=True, max=VM_PAGE_SIZE)
+            return vms[0] if len(vms) else None
+
+        allocator = vm_allocator.VmAllocator(pool, system_service.jobs_service(), find_vm, policy)
+        with spans.span('allocation', pool=pool_name):
+            return allocator.wait()
+
+    def race_pools(self):
+        """
+        Allocate and boot a vm in the pools, each on its own connection, return the first vm with RDP ready.
+        Pool n joins the race n * POOL_HEDGE sec late, at once when a pool ended without a vm: a login
+        takes one vm while the first pool is quick. Vms of the other pools are stopped or kept by UNUSED_VM.
+        """
+        stop = threading.Event()
+        policy = retry.RetryPolicy(self.policy.deadline, stop=stop)
+        finished = threading.Event()
+        lock = threading.Lock()
+        winner = {}
+        errors = []
+        remaining = [len(POOL_NAMES)]
+        advance = threading.Event()     # a pool ended: the waiting ones start at once
+
+        def acquire(pool_name, delay):
+            vm = ready_vm = None
+            connection = None
+            try:
+                if delay:
+                    advance.wait(delay)
+                    if stop.is_set():
+                        return
+                connection = self.open_endpoint(self.url)
+                system_service = connection.system_service()
+                vm = self.allocate_vm(system_service, policy, pool_name)
+                if vm and not stop.is_set():
+                    logging.info(f'Pool {pool_name} VM id: {vm.id}')
+                    waiter = vm_waiter.VmWaiter(system_service.vms_service().vm_service(vm.id), policy)
+                    with spans.span('boot', pool=pool_name):
+                        ready_vm = waiter.wait(self.rdp_ready)
+                with lock:
+                    if ready_vm and not winner:
+                        winner.update(vm=ready_vm, pool_name=pool_name)
+                        stop.set()
+                        finished.set()
+                        return
+                if vm:
+                    self.release_vm(system_service.vms_service(), vm, pool_name)
+            except Exception as e:
+                logging.exception(f'Pool {pool_name} error: ')
+                errors.append(e)
+            finally:
+                advance.set()
+                if connection:
+                    connection.close(logout=False)
+                with lock:
+                    remaining[0] -= 1
+                    if not remaining[0]:
+                        finished.set()
+
+        for index, pool_name in enumerate(POOL_NAMES):
+            threading.Thread(target=acquire, args=(pool_name, index * POOL_HEDGE), daemon=True).start()
+        finished.wait()
+
+        if not winner:
+            if errors:
+                raise errors[0]
+            return None
+        logging.info(f'Pool race won by {winner["pool_name"]}')
+        self.pool_name = winner['pool_name']
+        return winner['vm']
+
+    def release_vm(self, vms_service, vm, pool_name):
+        if UNUSED_VM != 'stop':
+            logging.info(f'Pool {pool_name}: unused vm {vm.id} kept')
+            return
         try:
-            ans_del_pass = subprocess.check_output(cmd_del_pass)
-        except subprocess.CalledProcessError:
-            logging.exception('del pass error:')
+            self.policy.once(vms_service.vm_service(vm.id).stop)
+        except sdk.Error:
+            logging.exception(f'Pool {pool_name}: stop unused vm error: ')
         else:
-            logging.info(f'Del pass answer: {ans_del_pass}')
+            logging.info(f'Pool {pool_name}: unused vm {vm.id} stopped')
+
+    def rdp_ready(self, vm):
+        fqdn = vm.fqdn or ''
+        logging.info(f'VM fqdn: {fqdn}')
+        if not re.search(FQDN_PATTERN, fqdn, re.IGNORECASE):
+            logging.info('VM fqdn not valid')
+            return False
 
-        cmd_unmap_folder = ['subst', SHARED_DISK, '/d']
-        logging.info(f'Unmap folder: {cmd_unmap_folder}')
         try:
-            ans_unmap_folder = subprocess.check_output(cmd_unmap_folder)
-        except subprocess.CalledProcessError:
-            logging.exception('unmap folder error:')
-        else:
-            logging.info(f'Unmap folder answer: {ans_unmap_folder}')
+            sockaddr = self.prober.probe(fqdn)
+        except:
+            logging.exception('Unexpected socket error: ')
+            return False
+        if not sockaddr:
+            logging.info('RDP closed')
+            return False
+        logging.info(f'RDP OK: {sockaddr[0]}')
+        return True
 
+    def write_rdp_file(self):
+        with open(RDP_DESTINATION_FILE, 'w') as file:
+            file.write(self.rdp_text)
 
-if __name__ == '__main__':
-    target = input()
-    if target:
-        pass
-        # username = str(input("username : "))
-        # password = str(input("password : "))
+    def add_pass_command(self):
+        return [COMMANDS['cmdkey'], '/add:' + self.fqdn, '/user:' + self.username, '/pass:' + self.password]
+
+    def del_pass_command(self):
+        return [COMMANDS['cmdkey'], '/delete:' + self.fqdn]
 
-    else:
+    def run_rdp_console(self):
+        logging.info('Exec cmd programs')
+        logging.info(f'FQDN: {self.fqdn}')
+
+        # drive mapping, credentials and rdp file do not depend on each other,
+        # credentials are deleted for the fqdn of the last reconnect
+        steps = [
+            pipeline.Step('map_folder', [COMMANDS['subst'], SHARED_DISK, SHARED_FOLDER]),
+            pipeline.Step('add_pass', self.add_pass_command, secret=True),
+            pipeline.Step('rdp_file', function=self.write_rdp_file, critical=True),
+            pipeline.Step('rdp', function=self.run_rdp, requires=('map_folder', 'add_pass', 'rdp_file')),
+            pipeline.Step('del_pass', self.del_pass_command, cleanup=True),
+            pipeline.Step('unmap_folder', [COMMANDS['subst'], SHARED_DISK, '/d'], cleanup=True),
+        ]
+        results = pipeline.Pipeline(steps).run()
+        timings = ' '.join(f'{name}={result.duration:.3f}' for name, result in results.items())
+        logging.info(f'Console steps, sec: {timings}')
+
+    def run_rdp(self):
+        """Run mstsc until the user closes it, reconnect after dropped sessions"""
+        reconnects = 0
+        while True:
+            cmd_rdp = [COMMANDS['mstsc'], RDP_DESTINATION_FILE]
+            logging.info(f'Rdp: {cmd_rdp}')
+            start = time.monotonic()
+            code = subprocess.call(cmd_rdp)
+            logging.info(f'RDP exit code: {code}, {time.monotonic() - start:.0f} s')
+
+            if not RECONNECT or code in USER_EXIT_CODES:
+                return code
+            if reconnects >= MAX_RECONNECTS:
+                logging.error(f'Reconnect limit reached: {MAX_RECONNECTS}')
+                return code
+            reconnects += 1
+            if not self.reconnect():
+                return code
+
+    def reconnect(self):
+        """Quick rdp probe of the last vm, the full connect only when it does not answer"""
+        logging.info(f'Reconnect to {self.fqdn}')
+        start = time.perf_counter()
+        fqdn = self.fqdn
+        try:
+            sockaddr = self.prober.probe(fqdn)
+        except:
+            logging.exception('Unexpected socket error: ')
+            sockaddr = None
+
+        if not sockaddr:
+            logging.info('Last vm does not answer, connect again')
+            self.prober.forget()
+            if self.connect(mode='reconnect') != 1:
+                logging.error('Reconnect failed')
+                return False
+
+            # the session moved to another vm: move credentials and rdp file with it
+            steps = [pipeline.Step('rdp_file', function=self.write_rdp_file, critical=True)]
+            if self.fqdn != fqdn:
+                logging.info(f'VM changed: {fqdn} -> {self.fqdn}')
+                steps += [
+                    pipeline.Step('del_pass', [COMMANDS['cmdkey'], '/delete:' + fqdn]),
+                    pipeline.Step('add_pass', self.add_pass_command, secret=True),
+                ]
+            results = pipeline.Pipeline(steps).run()
+            if not results['rdp_file'].ok:
+                return False
+
+        logging.info(f'Reconnect time: {time.perf_counter() - start:.3f} s')
+        return True
+
+
+def last_login(username):
+    """Time of the last successful login of the user from the sessions log, 0 if none"""
+    last = 0
+    try:
+        with open(SESSIONS_LOG, 'r') as file:
+            for line in file:
+                started, _, fields = line.strip().partition(' ')
+                fields = dict(field.split('=', 1) for field in fields.split() if '=' in field)
+                if fields.get('user') == username and fields.get('status') == '1' \
+                        and fields.get('mode', 'login') == 'login':
+                    last = max(last, time.mktime(time.strptime(started, '%Y-%m-%dT%H:%M:%S')))
+    except FileNotFoundError:
         pass
+    except:
+        logging.exception('Read sessions log error: ')
+    return last
+
+
+def prewarm_allowed(username):
+    hour = time.localtime().tm_hour
+    start, end = PREWARM_HOURS
+    if not (start <= hour < end if start <= end else hour >= start or hour < end):
+        logging.info(f'Prewarm: out of hours {start}-{end}')
+        return False
+
+    login = last_login(username)
+    if time.time() - login > PREWARM_DAYS * 24 * 3600:
+        logging.info('Prewarm: no recent login' if login else 'Prewarm: never logged in')
+        return False
+    return True
+
+
+def prewarm():
+    """Allocate and boot the vm with the stored credentials, the login window then finds it ready"""
+    logging.info('Prewarm')
+    connect = RdpConnect()
+    _, username, password = connect.load_data()
+    if not username or not password:
+        logging.info('Prewarm: no stored credentials')
+        return 0
+    if not prewarm_allowed(username):
+        return 0
+
+    status = connect.connect(mode='prewarm')
+    if status != 1:
+        return status
+
+    try:
+        connect.write_rdp_file()
+    except:
+        logging.exception('Write rdp file error: ')
+    return 0
+
+
+def connect_lock():
+    """The lock of the connect of this user: the open lock file or None when another process connects"""
+    os.makedirs(APP_DATA, exist_ok=True)
+    return utils.try_lock(CONNECT_LOCK)
+
+
+def prewarm_instance():
+    """
+    prewarm() under the connect lock, without Qt: none while a login window runs, it connects itself;
+    a window started meanwhile waits for the lock before it connects.
+    """
+    lock = connect_lock()
+    if not lock:
+        return 0
+    try:
+        init(log_mode='a')      # a window started meanwhile writes the same log
+        return prewarm()
+    finally:
+        lock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pandora engine client')
+    parser.add_argument('--prewarm', action='store_true', dest='prewarm',
+                        help='Start the vm of the user in background, for logon scripts and scheduled jobs')
+    args = parser.parse_args()
+
+    if args.prewarm:
+        sys.exit(prewarm_instance())
+    parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,10 @@ import shutil
 import sys
 from cx_Freeze import setup, Executable
 
+sys.path.insert(0, os.path.dirname(os.getcwd()))
+import check_shared
+
+check_shared.check()
 
 include_res = os.path.join(os.getcwd(), 'res')
 platform_dir = os.path.join(os.getcwd(), 'x32')
@@ -26,7 +30,8 @@ options = {
 }
 
 executables = [
-    Executable('rdp_login.py', base=base, icon=icon)
+    Executable('rdp_login.py', base=base, icon=icon),
+    Executable('sdk_rdp_generate.py', base=base, icon=icon),    # --prewarm at logon
 ]
 
 setup(
@@ -0,0 +1,93 @@
+"""
+One login window per user.
+The first launch takes a lock file and listens on a local socket; later launches send 'show' to it,
+get back the progress text of the running connect and exit instead of connecting again.
+The lock of a crashed instance is taken over: its process is gone, so QLockFile treats the lock as stale.
+sdk_rdp_generate --prewarm runs without Qt, the connect lock of sdk_rdp_generate keeps it apart from the window.
+"""
+
+import os
+import sys
+import getpass
+import logging
+
+from PyQt5 import QtCore, QtNetwork
+
+
+CONNECT_TIMEOUT = 1000      # ms
+ATTACH_ATTEMPTS = 10        # the running instance may not be listening yet
+ATTACH_DELAY = 200          # ms
+
+
+def instance_name():
+    user = ''.join(char for char in getpass.getuser() if char.isalnum()) or 'user'
+    return f'pandora_login_{user}'
+
+
+class SingleInstance(QtCore.QObject):
+    """show is emitted on requests of later launches, progress() gives the text sent back to them"""
+    show = QtCore.pyqtSignal()
+
+    def __init__(self, name=None, parent=None):
+        QtCore.QObject.__init__(self, parent=parent)
+        self.name = name or instance_name()
+        self.lock = QtCore.QLockFile(os.path.join(QtCore.QDir.tempPath(), self.name + '.lock'))
+        self.lock.setStaleLockTime(0)      # stale only when the owner process is gone
+        self.server = None
+        self.progress = lambda: ''
+
+    def acquire(self):
+        """True for the first instance, which then serves the later ones"""
+        if not self.lock.tryLock(0):
+            return False
+        # a crashed instance leaves its socket file behind on Linux
+        QtNetwork.QLocalServer.removeServer(self.name)
+        self.server = QtNetwork.QLocalServer(self)
+        self.server.setSocketOptions(QtNetwork.QLocalServer.UserAccessOption)
+        if not self.server.listen(self.name):
+            logging.error(f'Instance server {self.name} error: {self.server.errorString()}')
+        self.server.newConnection.connect(self.on_connection)
+        return True
+
+    def on_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self.on_request(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def on_request(self, socket):
+        request = bytes(socket.readAll()).decode(errors='replace').strip()
+        logging.info(f'Request from another launch: {request}')
+        if request == 'show':
+            self.show.emit()
+        socket.write((self.progress() + '\n').encode())
+        socket.flush()
+        socket.disconnectFromServer()
+
+    def attach(self):
+        """Ask the running instance to show itself, its progress text or None when it does not answer"""
+        allow_foreground()
+        for _ in range(ATTACH_ATTEMPTS):
+            socket = QtNetwork.QLocalSocket()
+            socket.connectToServer(self.name)
+            if socket.waitForConnected(CONNECT_TIMEOUT):
+                socket.write(b'show\n')
+                socket.waitForBytesWritten(CONNECT_TIMEOUT)
+                answer = b''
+                while socket.waitForReadyRead(CONNECT_TIMEOUT):
+                    answer += bytes(socket.readAll())
+                return answer.decode(errors='replace').strip()
+            QtCore.QThread.msleep(ATTACH_DELAY)
+        return None
+
+    def release(self):
+        if self.server:
+            self.server.close()
+        self.lock.unlock()
+
+
+def allow_foreground():
+    """Windows lets only the foreground process give the focus away: pass it to the running instance"""
+    if sys.platform == 'win32':
+        import ctypes
+        ctypes.windll.user32.AllowSetForegroundWindow(-1)     # ASFW_ANY
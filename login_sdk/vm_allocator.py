@@ -0,0 +1,104 @@
+import time
+import uuid
+import logging
+
+import ovirtsdk4 as sdk
+
+
+ALLOCATION_TIMEOUT = 60     # wait for a vm of an untracked or finished job before allocating again, sec
+POLL_DELAYS = (1, 5)        # (first, max) delay between checks, sec
+JOB_FAILED = ('failed', 'aborted')
+JOB_RUNNING = ('started',)
+
+
+class VmAllocator:
+    """
+    Take one vm from a pool.
+    allocate_vm is issued once with a correlation id, then the allocation job and the user vms
+    are polled with backoff. The pool is asked again only when the job definitively failed or
+    the allocation request itself failed. While the job runs the allocator keeps waiting; ALLOCATION_TIMEOUT
+    applies only when the job cannot be tracked or has finished and no vm showed up.
+    Delays, jitter, retries and the deadline come from policy (retry.RetryPolicy),
+    waiting ends with None at the deadline or when the policy is stopped.
+    """
+
+    def __init__(self, pool_service, jobs_service, find_vm, policy, timeout=ALLOCATION_TIMEOUT):
+        self.pool_service = pool_service
+        self.jobs_service = jobs_service
+        self.find_vm = find_vm
+        self.policy = policy
+        self.timeout = timeout
+        self.allocations = 0
+        self.requested = 0
+        self.pending = False
+        self.allocated = 0
+        self.correlation_id = ''
+        self.track_jobs = True
+
+    def allocate(self):
+        self.allocations += 1
+        self.allocated = time.monotonic()
+        self.correlation_id = str(uuid.uuid4())
+        logging.info(f'Allocating vm... allocation {self.allocations}, correlation id: {self.correlation_id}')
+        try:
+            # not retried: a lost answer can hide a done allocation
+            self.policy.once(self.pool_service.allocate_vm, query={'correlation_id': self.correlation_id})
+        except sdk.Error:
+            logging.exception('Allocation error: ')
+            self.pending = False
+        else:
+            self.requested += 1
+            self.pending = True
+        return self.pending
+
+    def job_status(self):
+        """'failed', 'running', 'finished' or None when the allocation job cannot be tracked"""
+        if not self.track_jobs:
+            return None
+        try:
+            jobs = self.policy.call(self.jobs_service.list, search=f'correlation_id={self.correlation_id}')
+        except sdk.Error:
+            logging.exception('Job search error, tracking allocation by vm only: ')
+            self.track_jobs = False
+            return None
+
+        statuses = [str(job.status) for job in jobs]
+        if any(status in JOB_FAILED for status in statuses):
+            logging.info(f'Allocation job {", ".join(statuses)}')
+            return 'failed'
+        if any(status in JOB_RUNNING for status in statuses):
+            return 'running'
+        return 'finished' if statuses else None
+
+    def need_allocation(self):
+        if not self.pending:
+            return True
+        status = self.job_status()
+        if status == 'failed':
+            return True
+        if status == 'running':
+            return False
+        if time.monotonic() - self.allocated > self.timeout:
+            logging.info('Allocated vm not found in time' if status else 'Untracked allocation timed out')
+            return True
+        return False
+
+    def wait(self):
+        attempt = 0
+        while True:
+            try:
+                vm = self.policy.call(self.find_vm)
+            except sdk.Error:
+                logging.exception('VM search error: ')
+                vm = None
+            if vm:
+                logging.info(f'Pool vms requested by this login: {self.requested}')
+                return vm
+
+            if self.need_allocation() and self.allocate():
+                attempt = 0
+
+            if not self.policy.sleep(self.policy.delay(attempt, *POLL_DELAYS)):
+                logging.info(f'Pool vms requested by this login: {self.requested}')
+                return None
+            attempt += 1
@@ -0,0 +1,56 @@
+import logging
+
+
+# (first, max) poll delay in seconds for every vm status
+STATUS_DELAYS = {
+    'down': (1, 2),
+    'wait_for_launch': (1, 3),
+    'powering_up': (0.5, 2),
+    'reboot_in_progress': (1, 3),
+    'up': (0.25, 1),
+}
+DEFAULT_DELAY = (1, 5)
+
+
+class VmWaiter:
+    """
+    Wait for a vm to boot.
+    Vm status is polled by id with backoff: the delay is reset on every status transition
+    and grows while the status stays the same. ready(vm) is called only when the vm is up.
+    Delays, jitter, retries and the deadline come from policy (retry.RetryPolicy),
+    waiting ends with None at the deadline or when the policy is stopped.
+    """
+
+    def __init__(self, vm_service, policy):
+        self.vm_service = vm_service
+        self.policy = policy
+        self.status = None
+        self.attempt = 0
+        self.started = False
+
+    def next_delay(self, status):
+        first, maximum = STATUS_DELAYS.get(status, DEFAULT_DELAY)
+        if status != self.status:
+            logging.info(f'VM status: {self.status} -> {status}')
+            self.status = status
+            self.started = False
+            self.attempt = 0
+        else:
+            self.attempt += 1
+        return self.policy.delay(self.attempt, first, maximum)
+
+    def wait(self, ready):
+        while True:
+            vm = self.policy.call(self.vm_service.get)
+            status = str(vm.status)
+            if status == 'up' and ready(vm):
+                return vm
+
+            delay = self.next_delay(status)
+            if status == 'down' and not self.started:
+                logging.info('Starting vm...')
+                self.policy.once(self.vm_service.start)
+                self.started = True
+
+            if not self.policy.sleep(delay):
+                return None
@@ -3,6 +3,8 @@ from win32com.shell import shell, shellcon
 from win32com.client import Dispatch
 import pythoncom
 
+import link_index
+
 
 def link_destination(file_path):
     shortcut = pythoncom.CoCreateInstance(
@@ -46,22 +48,23 @@ def create_link(link_path, destination, icon=None):
     shortcut.save()
 
 
-def safely_create_link(link_name, target_path, icon=None):
+def safely_create_link(link_name, target_path, icon=None, index_file=''):
+    pythoncom.CoInitialize()    # may run in a background thread
     desktop = shell.SHGetFolderPath(0, shellcon.CSIDL_DESKTOP, 0, 0)
 
-    desktop_files = os.listdir(desktop)
-    for file in desktop_files:
-        if file[-4:] == '.lnk':
-            file_path = os.path.join(desktop, file)
-            file_destination = link_destination(file_path)
-            file_destination_norm = os.path.normcase(os.path.normpath(file_destination)).strip(' /\\')
-            target_path_norm = os.path.normcase(os.path.normpath(target_path)).strip(' /\\')
-            if file_destination_norm == target_path_norm:
-                if icon:
-                    link_set_icon(file_path, icon)
-                return
+    index = link_index.LinkIndex(index_file)
+    index.load()
+    file_path = index.find(desktop, target_path, link_destination)
+    if file_path:
+        if icon and index.icon(file_path) != icon:
+            link_set_icon(file_path, icon)
+            index.update(file_path, target_path, icon)
+        index.save()
+        return
 
     if link_name[-4:] != '.lnk':
         link_name += '.lnk'
     link_path = os.path.join(desktop, link_name)
     create_link(link_path, target_path, icon)
+    index.update(link_path, target_path, icon)
+    index.save()
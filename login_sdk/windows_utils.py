@@ -1,4 +1,5 @@
 import os
+import msvcrt
 import win32crypt
 import win32security
 import win32api
@@ -12,8 +13,32 @@ def get_name():
     return fullname, username
 
 
-def encrypt_data(word):
-    entropy = get_entropy()
+def private_folder(folder):
+    # LOCALAPPDATA is readable by the user only, the data in it is protected by DPAPI
+    os.makedirs(folder, exist_ok=True)
+
+
+def write_private(file_name, text):
+    with open(file_name, 'w') as file:
+        file.write(text)
+
+
+def try_lock(file_name):
+    """Lock the file without waiting: the open file, closing it releases the lock; None when another process holds it"""
+    file = open(file_name, 'a+')
+    file.seek(0)
+    try:
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def protect_data(word, entropy=None, name='data'):
+    """DPAPI encrypted word for the current user, name is used by keyring backends only"""
+    if entropy is None:
+        entropy = get_entropy()
     
     word_bytes = win32crypt.CryptProtectData(word.encode(), None, entropy, None, None, 0)
     encrypt_word = base64.b64encode(word_bytes).decode()
@@ -21,8 +46,9 @@ def encrypt_data(word):
     return encrypt_word
 
 
-def decrypt_data(encrypt_word):        
-    entropy = get_entropy()
+def unprotect_data(encrypt_word, entropy=None):
+    if entropy is None:
+        entropy = get_entropy()
     
     word_bytes = base64.b64decode(encrypt_word.encode())
     word = win32crypt.CryptUnprotectData(word_bytes, entropy, None, None, 0)[1].decode()
@@ -30,9 +56,14 @@ def decrypt_data(encrypt_word):
     return word
 
 
-def get_entropy():
+def get_sid():
+    return win32security.ConvertSidToStringSid(win32security.LookupAccountName(None, os.getlogin())[0])
+
+
+def get_entropy(sid=None):
     try:
-        sid = win32security.ConvertSidToStringSid(win32security.LookupAccountName(None, os.getlogin())[0])
+        if sid is None:
+            sid = get_sid()
         entropy = hashlib.md5(sid.encode()).digest()
     except:
         entropy = ''
@@ -0,0 +1,206 @@
+"""
+End-to-end portal login and logoff benchmark with resource use, against fake_portal.
+Every login and logoff runs in a child process (python bench_login.py --child ...), so the numbers cover
+the whole client: wall time, peak RSS of the process tree (python, geckodriver, firefox) sampled from /proc
+and CPU time of the tree from the rusage of the reaped children.
+--baseline compares with a saved --json run and fails on a regression beyond --tolerance.
+
+Usage: python bench_login.py [-n RUNS] [-c browser,http] [--script STATE,STATE] [--latency SEC] [--fail RATE]
+       [--drop RATE] [--json FILE] [--baseline FILE] [--tolerance PART]
+Linux only. The browser client needs selenium, firefox and geckodriver, it is skipped without them.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import fake_portal
+
+
+CLIENTS = ('browser', 'http')
+OPERATIONS = ('login', 'logoff')
+USERNAME = 'user'
+PASSWORD = 'password'
+SAMPLE = 0.05       # process tree sampling, sec
+METRICS = ('p50', 'rss', 'cpu')
+
+
+def child(client, operation, address):
+    if client == 'http':
+        import portal_http
+        login = portal_http.HttpLogin(address, USERNAME, PASSWORD)
+    else:
+        import web_login
+        login = web_login.CPLogin(address=address, username=USERNAME, password=PASSWORD)
+    sys.exit(login.login() if operation == 'login' else login.logoff())
+
+
+def descendants(root):
+    """Pids of the process tree under root"""
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # the command name in parentheses may hold spaces
+        parent = int(stat[stat.rfind(')') + 2:].split()[1])
+        children.setdefault(parent, []).append(int(name))
+    tree = []
+    queue = [root]
+    while queue:
+        pid = queue.pop()
+        tree.append(pid)
+        queue.extend(children.get(pid, []))
+    return tree
+
+
+def rss(pid):
+    """Resident set of a process, bytes"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def run_once(client, operation, address, verbose):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', client, operation, address],
+                               stdout=output, stderr=output)
+    peak = 0
+    while process.poll() is None:
+        peak = max(peak, sum(rss(pid) for pid in descendants(process.pid)))
+        time.sleep(SAMPLE)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = after.ru_utime - before.ru_utime + after.ru_stime - before.ru_stime
+    return {'status': process.returncode, 'time': elapsed, 'rss': peak, 'cpu': cpu}
+
+
+def percentile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(round(part * (len(values) - 1))), len(values) - 1)]
+
+
+def run_client(client, portal, runs, verbose):
+    results = {operation: [] for operation in OPERATIONS}
+    for _ in range(runs):
+        portal.reset()
+        for operation in OPERATIONS:
+            result = run_once(client, operation, portal.url, verbose)
+            result['ok'] = result['status'] == 1 and (operation == 'login') == bool(portal.sessions)
+            results[operation].append(result)
+
+    summary = {}
+    for operation, operation_results in results.items():
+        ok = [result for result in operation_results if result['ok']]
+        times = [result['time'] for result in ok]
+        summary[operation] = {
+            'runs': runs,
+            'ok': len(ok),
+            'p50': percentile(times, 0.5),
+            'p95': percentile(times, 0.95),
+            'rss': max((result['rss'] for result in ok), default=0),
+            'cpu': sum(result['cpu'] for result in ok) / len(ok) if ok else 0,
+        }
+    return summary
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for client, client_results in results.items():
+        for operation, result in client_results.items():
+            base = baseline.get(client, {}).get(operation)
+            if not base:
+                continue
+            for metric in METRICS:
+                if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                    found.append(f'{client} {operation} {metric}: {base[metric]:.3f} -> {result[metric]:.3f}')
+    return found
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        child(*sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='End-to-end portal login benchmark')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=5, help='Login and logoff runs')
+    parser.add_argument('-c', action='store', dest='clients', type=str, default=','.join(CLIENTS),
+                        help='Comma separated clients: ' + ', '.join(CLIENTS))
+    parser.add_argument('--script', action='store', dest='script', type=str, default='',
+                        help='Portal states served first: ' + ', '.join(fake_portal.STATES))
+    parser.add_argument('--render-delay', action='store', dest='render_delay', type=float, default=0.5,
+                        help='Delay of the late login form, sec')
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.0,
+                        help='Portal request latency, sec')
+    parser.add_argument('--fail', action='store', dest='fail', type=float, default=0.0, help='Portal 503 rate')
+    parser.add_argument('--drop', action='store', dest='drop', type=float, default=0.0,
+                        help='Portal dropped request rate')
+    parser.add_argument('-v', action='store_true', dest='verbose', help='Show the output of the clients')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    parser.add_argument('--baseline', action='store', dest='baseline', type=str, help='Results of an earlier --json')
+    parser.add_argument('--tolerance', action='store', dest='tolerance', type=float, default=0.2,
+                        help='Allowed growth over the baseline, part')
+    args = parser.parse_args()
+
+    clients = [client.strip() for client in args.clients.split(',') if client.strip()]
+    for client in clients:
+        if client not in CLIENTS:
+            parser.error(f'unknown client: {client}')
+    script = fake_portal.parse_script(args.script)
+    if script is None:
+        parser.error(f'unknown state in script: {args.script}')
+
+    portal = fake_portal.FakePortal(
+        users={USERNAME: PASSWORD}, latency=args.latency, script=script, render_delay=args.render_delay,
+        fail_rate=args.fail, drop_rate=args.drop,
+    ).start()
+    results = {}
+    try:
+        for client in clients:
+            if client == 'browser' and not shutil.which('geckodriver'):
+                print('browser skipped: geckodriver is not in PATH')
+                continue
+            results[client] = run_client(client, portal, args.runs, args.verbose)
+    finally:
+        portal.stop()
+
+    print(f'{"client":9}{"operation":10}{"ok":>7}{"p50 s":>9}{"p95 s":>9}{"peak RSS MB":>13}{"CPU s":>9}')
+    for client, client_results in results.items():
+        for operation, result in client_results.items():
+            print(f'{client:9}{operation:10}{result["ok"]:>4}/{result["runs"]:<2}{result["p50"]:>9.3f}'
+                  f'{result["p95"]:>9.3f}{result["rss"] / (1 << 20):>13.1f}{result["cpu"]:>9.3f}')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    failed = any(result['ok'] < result['runs'] for client_results in results.values()
+                 for result in client_results.values())
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            found = regressions(results, json.load(file)['results'], args.tolerance)
+        for line in found:
+            print(f'Regression: {line}')
+        failed = failed or bool(found)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Portal login and logoff time of the plain HTTP client (portal_http.HttpLogin)
+and of the headless Firefox one (web_login.CPLogin) against fake_portal, for every portal state.
+
+Scenarios (the expected status):
+    login     - login form, right credentials (1)
+    bad       - login form, wrong password (2)
+    logged_in - the address is logged in already (1)
+    regain    - "regain access" page, then the login form (1)
+    unknown   - a page without portal elements (http 0: left to the browser; browser 3 after its deadlines)
+    logoff    - log off of a logged in address (1)
+
+Usage: python bench_portal.py [-n RUNS] [-c http,browser] [-s login,bad,...] [--latency SEC] [--json FILE]
+The browser client needs selenium, firefox and geckodriver, it is skipped without them.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import fake_portal
+
+
+CLIENTS = ('http', 'browser')
+SCENARIOS = ('login', 'bad', 'logged_in', 'regain', 'unknown', 'logoff')
+EXPECTED = {'bad': 2, 'unknown': 3}
+EXPECTED_HTTP = {'unknown': 0}
+USERNAME = 'user'
+PASSWORD = 'password'
+CLIENT_ADDRESS = '127.0.0.1'
+
+
+def new_client(client, address, password):
+    if client == 'http':
+        import portal_http
+        return portal_http.HttpLogin(address, USERNAME, password)
+    import web_login
+    return web_login.CPLogin(address=address, username=USERNAME, password=password)
+
+
+def run_once(client, portal, scenario):
+    portal.reset()
+    portal.regain = scenario == 'regain'
+    portal.script = ['blank'] * 20 if scenario == 'unknown' else []
+    if scenario in ('logged_in', 'logoff'):
+        portal.sessions[CLIENT_ADDRESS] = USERNAME
+    address = portal.url
+    password = 'wrong' if scenario == 'bad' else PASSWORD
+
+    start = time.perf_counter()
+    login = new_client(client, address, password)
+    status = login.logoff() if scenario == 'logoff' else login.login()
+    elapsed = time.perf_counter() - start
+    if scenario == 'logoff' and portal.sessions:
+        status = 0
+    expected = EXPECTED_HTTP.get(scenario) if client == 'http' else None
+    if expected is None:
+        expected = EXPECTED.get(scenario, 1)
+    return {'time': elapsed, 'ok': status == expected}
+
+
+def percentile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(round(part * (len(values) - 1))), len(values) - 1)]
+
+
+def run_scenario(client, portal, scenario, runs):
+    results = [run_once(client, portal, scenario) for _ in range(runs)]
+    times = [result['time'] for result in results if result['ok']]
+    return {
+        'runs': runs,
+        'ok': len(times),
+        'p50': percentile(times, 0.5),
+        'p95': percentile(times, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Portal login benchmark')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=10, help='Runs per scenario')
+    parser.add_argument('-c', action='store', dest='clients', type=str, default=','.join(CLIENTS),
+                        help='Comma separated clients: ' + ', '.join(CLIENTS))
+    parser.add_argument('-s', action='store', dest='scenarios', type=str, default=','.join(SCENARIOS),
+                        help='Comma separated scenarios: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.0,
+                        help='Portal request latency, sec')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    clients = [client.strip() for client in args.clients.split(',') if client.strip()]
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    for client in clients:
+        if client not in CLIENTS:
+            parser.error(f'unknown client: {client}')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'unknown scenario: {scenario}')
+
+    portal = fake_portal.FakePortal(users={USERNAME: PASSWORD}, latency=args.latency).start()
+    results = {}
+    try:
+        for client in clients:
+            try:
+                results[client] = {scenario: run_scenario(client, portal, scenario, args.runs)
+                                   for scenario in scenarios}
+            except Exception as e:     # no selenium, firefox or geckodriver
+                print(f'{client} skipped: {e.__class__.__name__}: {e}')
+    finally:
+        portal.stop()
+
+    print(f'{"client":10}{"scenario":12}{"ok":>7}{"p50 s":>9}{"p95 s":>9}')
+    for client, client_results in results.items():
+        for scenario, result in client_results.items():
+            print(f'{client:10}{scenario:12}{result["ok"]:>4}/{result["runs"]:<2}'
+                  f'{result["p50"]:>9.3f}{result["p95"]:>9.3f}')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    if any(result['ok'] < result['runs'] for client_results in results.values() for result in client_results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Latency and classification accuracy of the connectivity probe (portal_http.probe) against fake_portal.
+
+Cases (the expected answer):
+    authenticated - the address is logged in (authenticated)
+    portal        - not logged in (portal)
+    regain        - not logged in, "regain access" page (portal)
+    refused       - nothing listens on the port (unreachable)
+    silent        - the connection is accepted, no answer comes (unreachable after the timeout)
+    intercept     - not logged in, the check address gets a 200 meta refresh/script page without portal elements
+                    (portal via the page, unknown via the check address: never a skipped login)
+    body          - logged in, the check address answers 200 with the expected body (authenticated)
+    page200       - logged in, the check address answers 200 with a body the probe does not expect
+                    (authenticated via the page, unknown via the check address)
+Every case is probed via the portal page and via the connectivity check address.
+
+Usage: python bench_probe.py [-n RUNS] [--timeout SEC] [--latency SEC] [--json FILE]
+"""
+
+import argparse
+import json
+import socket
+import sys
+import time
+
+import fake_portal
+import portal_http
+
+
+CASES = ('authenticated', 'portal', 'regain', 'refused', 'silent', 'intercept', 'body', 'page200')
+EXPECTED = {
+    'authenticated': portal_http.AUTHENTICATED,
+    'portal': portal_http.PORTAL,
+    'regain': portal_http.PORTAL,
+    'refused': portal_http.UNREACHABLE,
+    'silent': portal_http.UNREACHABLE,
+    'intercept': portal_http.PORTAL,
+    'body': portal_http.AUTHENTICATED,
+    'page200': portal_http.AUTHENTICATED,
+}
+# answers via the connectivity check address where they differ
+EXPECTED_CONNECTIVITY = {
+    'intercept': portal_http.UNKNOWN,
+    'page200': portal_http.UNKNOWN,
+}
+CONNECTIVITY = {'intercept': 'intercept', 'body': 'body', 'page200': 'body'}
+LOGGED_IN = ('authenticated', 'body', 'page200')
+MODES = ('page', 'connectivity')
+CLIENT_ADDRESS = '127.0.0.1'
+
+
+def addresses(portal, case, silent, refused):
+    """(portal address, connectivity address) of the case"""
+    if case == 'refused':
+        return f'http://127.0.0.1:{refused}/', f'http://127.0.0.1:{refused}/generate_204'
+    if case == 'silent':
+        port = silent.getsockname()[1]
+        return f'http://127.0.0.1:{port}/', f'http://127.0.0.1:{port}/generate_204'
+    return portal.url, portal.address(fake_portal.CONNECTIVITY_PATH)
+
+
+def run_once(portal, case, mode, timeout, silent, refused):
+    portal.reset()
+    portal.regain = case == 'regain'
+    portal.connectivity = CONNECTIVITY.get(case, '204')
+    if case in LOGGED_IN:
+        portal.sessions[CLIENT_ADDRESS] = 'user'
+    address, url = addresses(portal, case, silent, refused)
+    body = fake_portal.CONNECTIVITY_BODY if case == 'body' else None
+    expected = EXPECTED[case]
+    if mode == 'connectivity':
+        expected = EXPECTED_CONNECTIVITY.get(case, expected)
+
+    start = time.perf_counter()
+    state = portal_http.probe(address, url if mode == 'connectivity' else '', timeout, body=body)
+    return {'time': time.perf_counter() - start, 'ok': state == expected}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, part):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(int(round(part * (len(values) - 1))), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Connectivity probe benchmark')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=20, help='Runs per case')
+    parser.add_argument('--timeout', action='store', dest='timeout', type=float, default=portal_http.PROBE_TIMEOUT,
+                        help='Probe timeout, sec')
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.0,
+                        help='Portal request latency, sec')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    portal = fake_portal.FakePortal(latency=args.latency).start()
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen(64)
+    refused = free_port()
+    results = {}
+    try:
+        for mode in MODES:
+            for case in CASES:
+                runs = [run_once(portal, case, mode, args.timeout, silent, refused) for _ in range(args.runs)]
+                times = [run['time'] for run in runs]
+                results[f'{mode}/{case}'] = {
+                    'runs': args.runs,
+                    'ok': sum(run['ok'] for run in runs),
+                    'p50': percentile(times, 0.5),
+                    'p95': percentile(times, 0.95),
+                }
+    finally:
+        silent.close()
+        portal.stop()
+
+    print(f'{"mode/case":28}{"correct":>9}{"p50 s":>9}{"p95 s":>9}')
+    for name, result in results.items():
+        print(f'{name:28}{result["ok"]:>5}/{result["runs"]:<3}{result["p50"]:>9.3f}{result["p95"]:>9.3f}')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    if any(result['ok'] < result['runs'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Cost of the portal browser profile before Firefox starts: the profile copy of selenium and the zip
+sent to geckodriver (FirefoxProfile.encoded), for the whole user profile and for the lean one.
+Time and this process I/O from /proc/self/io: read/written bytes and the part that went to disk.
+
+Usage: python bench_profile.py [-f PROFILE_DIR | --size MB] [-n RUNS] [--json FILE]
+Without -f a synthetic profile of --size MB is made: cache, storage, places and the portal files.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import web_login
+
+
+MODES = ('full', 'lean')
+
+
+def io_counters():
+    counters = {}
+    try:
+        with open('/proc/self/io', 'r') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def synthetic_profile(folder, size):
+    """size MB like a synced profile: mostly cache entries and site storage"""
+    chunk = os.urandom(1 << 20)
+    parts = [('cache2/entries', 0.6, 64 * 1024), ('storage/default', 0.3, 256 * 1024), ('', 0.1, 1 << 20)]
+    for sub_folder, share, file_size in parts:
+        path = os.path.join(folder, sub_folder)
+        os.makedirs(path, exist_ok=True)
+        left = int(size * share * (1 << 20))
+        index = 0
+        while left > 0:
+            with open(os.path.join(path, f'places{index}.sqlite' if not sub_folder else f'{index:08X}'), 'wb') as file:
+                file.write(chunk[:min(file_size, left)])
+            left -= file_size
+            index += 1
+    for name in web_login.PORTAL_FILES:
+        with open(os.path.join(folder, name), 'wb') as file:
+            file.write(chunk[:64 * 1024])
+
+
+def run_once(profile_dir, mode):
+    before = io_counters()
+    start = time.perf_counter()
+    profile = web_login.new_profile(profile_dir, lean=mode == 'lean')
+    encoded = len(profile.encoded)
+    elapsed = time.perf_counter() - start
+    after = io_counters()
+    shutil.rmtree(profile.path, ignore_errors=True)
+    if profile.tempfolder:
+        shutil.rmtree(profile.tempfolder, ignore_errors=True)
+    return {
+        'time': elapsed,
+        'encoded': encoded,
+        'read': after.get('rchar', 0) - before.get('rchar', 0),
+        'written': after.get('wchar', 0) - before.get('wchar', 0),
+        'disk_write': after.get('write_bytes', 0) - before.get('write_bytes', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Portal browser profile benchmark')
+    parser.add_argument('-f', action='store', dest='profile', type=str, help='Firefox profile directory')
+    parser.add_argument('--size', action='store', dest='size', type=int, default=300, help='Synthetic profile, MB')
+    parser.add_argument('-n', action='store', dest='runs', type=int, default=3, help='Runs per mode')
+    parser.add_argument('--json', action='store', dest='json', type=str, help='Save results to file')
+    args = parser.parse_args()
+
+    work_dir = None
+    profile_dir = args.profile
+    if not profile_dir:
+        work_dir = tempfile.mkdtemp(prefix='bench_profile_')
+        profile_dir = os.path.join(work_dir, 'profile')
+        synthetic_profile(profile_dir, args.size)
+
+    results = {}
+    try:
+        for mode in MODES:
+            runs = [run_once(profile_dir, mode) for _ in range(args.runs)]
+            results[mode] = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    mb = 1 << 20
+    print(f'{"mode":6}{"time s":>9}{"zip MB":>9}{"read MB":>9}{"written MB":>12}{"disk MB":>9}')
+    for mode, result in results.items():
+        print(f'{mode:6}{result["time"]:>9.3f}{result["encoded"] / mb:>9.1f}{result["read"] / mb:>9.1f}'
+              f'{result["written"] / mb:>12.1f}{result["disk_write"] / mb:>9.1f}')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+Local stand-in for the Check Point UserCheck portal used by web_login.CPLogin and portal_http.HttpLogin.
+Pages carry the element ids the clients look for: login button, user name and password fields, error span,
+logoff button and the "regain access" portal_link. Like the gateway, access is given per client address,
+CONNECTIVITY_PATH answers like a connectivity check address behind the gateway, by connectivity:
+    204       - 204 when logged in, a redirect to the portal otherwise
+    body      - 200 with CONNECTIVITY_BODY when logged in, a redirect otherwise
+    intercept - 204 when logged in, otherwise a 200 page sending the browser to the portal by meta refresh
+                and script, without portal elements, like a gateway rewriting the answer
+The buttons are spans submitting their form from onclick, so a browser and a plain HTTP client both work.
+
+Scripted states: the portal page requests of a client first get the states of script in turn, then the real one:
+    login     - the login form
+    logged_in - the logoff button
+    regain    - the "regain access" link
+    late      - the login form put in by a script after render_delay, like a portal rendered in the browser
+    blank     - a page without portal elements
+    error     - 500
+Failures: fail_rate of the requests get 503, drop_rate are closed without an answer.
+
+Usage: python fake_portal.py [-p PORT] [--latency SEC] [--regain] [--script STATE,STATE] [--render-delay SEC]
+       [--fail RATE] [--drop RATE] [--connectivity 204|body|intercept] [-u USER:PASSWORD ...]
+"""
+
+import argparse
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+PORTAL_PATH = '/connect/PortalMain'
+LOGIN_PATH = '/connect/login'
+LOGOFF_PATH = '/connect/logoff'
+REGAIN_PATH = '/connect/regain'
+CONNECTIVITY_PATH = '/generate_204'     # 204 for logged in addresses, a redirect to the portal otherwise
+BAD_CREDENTIALS = 'Bad credentials, please try again'
+CONNECTIVITY_BODY = 'success\n'
+CONNECTIVITY_MODES = ('204', 'body', 'intercept')
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>UserCheck Portal</title></head>
+<body><div id="UserCheck_Portal">{}</div></body></html>'''
+LOGIN_FORM = '''
+<form id="LoginUserPassword_form" method="post" action="{action}">
+  <input type="hidden" name="realm" value="passwordLogin">
+  <span id="LoginUserPassword_error_message">{error}</span>
+  <input type="text" id="LoginUserPassword_auth_username" name="userName" value="">
+  <input type="password" id="LoginUserPassword_auth_password" name="userPass" value="">
+  <span id="UserCheck_Login_Button_span" onclick="this.closest('form').submit()">Log In</span>
+</form>'''
+LOGOFF_FORM = '''
+<p>You are logged in as {user}</p>
+<form id="UserCheck_Logoff_form" method="post" action="{action}">
+  <span id="UserCheck_Logoff_Button_span" onclick="this.closest('form').submit()">Log Off</span>
+</form>'''
+REGAIN_PAGE = '''
+<p>Access to the network is blocked.</p>
+<a class="portal_link" href="{href}">Click here to regain access</a>'''
+LATE_PAGE = '''
+<p id="loading">Loading...</p>
+<template id="late_form">{form}</template>
+<script>setTimeout(function () {{
+  document.getElementById('loading').replaceWith(document.getElementById('late_form').content);
+}}, {delay});</script>'''
+BLANK_PAGE = '<p>Loading...</p>'
+INTERCEPT_PAGE = '''<!DOCTYPE html>
+<html><head><meta http-equiv="refresh" content="0; url={href}"><title>Redirect</title></head>
+<body><script>window.location.replace('{href}');</script></body></html>'''
+STATES = ('login', 'logged_in', 'regain', 'late', 'blank', 'error')
+
+
+class FakePortal:
+    def __init__(self, users=None, latency=0.0, regain=False, script=(), render_delay=0.5, fail_rate=0.0,
+                 drop_rate=0.0, connectivity='204', host='127.0.0.1', port=0):
+        self.users = users          # {username: password}, None accepts everybody
+        self.latency = latency
+        self.regain = regain        # unknown clients get the "regain access" page first
+        self.script = list(script)  # STATES served before the real page
+        self.render_delay = render_delay
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.connectivity = connectivity    # how CONNECTIVITY_PATH answers: CONNECTIVITY_MODES
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), PortalHandler)
+        self.server.daemon_threads = True
+        self.server.portal = self
+        self.thread = None
+        self.reset()
+
+    @property
+    def url(self):
+        return self.address(PORTAL_PATH)
+
+    def address(self, path):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{path}'
+
+    def reset(self):
+        with self.lock:
+            self.sessions = {}      # client address: user
+            self.seen = set()       # client addresses past the regain page
+            self.steps = {}         # client address: states of the script served
+            self.requests = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': sum(self.requests.values()), 'by_kind': dict(self.requests)}
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def scripted(self, client):
+        """Next state of the script for the client, None when it is played"""
+        with self.lock:
+            step = self.steps.get(client, 0)
+            if step >= len(self.script):
+                return None
+            self.steps[client] = step + 1
+            return self.script[step]
+
+    def check(self, username, password):
+        return bool(username) and (self.users is None or self.users.get(username) == password)
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def portal(self):
+        return self.server.portal
+
+    def send(self, code, body, kind, headers=(), content_type='text/html; charset=utf-8'):
+        self.portal.count(kind)
+        data = body.encode()
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def redirect(self, path, kind):
+        self.send(302, '', kind, [('Location', path)])
+
+    def read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        return {key: values[0] for key, values in urllib.parse.parse_qs(body).items()}
+
+    def page(self, error='', state=None):
+        portal = self.portal
+        client = self.client_address[0]
+        with portal.lock:
+            user = portal.sessions.get(client)
+            regain = portal.regain and user is None and client not in portal.seen
+        if state is None:
+            state = 'logged_in' if user is not None else 'regain' if regain else 'login'
+        if state == 'logged_in':
+            return PAGE.format(LOGOFF_FORM.format(user=escape(user or 'user'), action=LOGOFF_PATH))
+        if state == 'regain':
+            return PAGE.format(REGAIN_PAGE.format(href=REGAIN_PATH))
+        if state == 'late':
+            form = LOGIN_FORM.format(action=LOGIN_PATH, error='')
+            return PAGE.format(LATE_PAGE.format(form=form, delay=int(portal.render_delay * 1000)))
+        if state == 'blank':
+            return PAGE.format(BLANK_PAGE)
+        return PAGE.format(LOGIN_FORM.format(action=LOGIN_PATH, error=escape(error)))
+
+    def injected(self):
+        """Answer with an injected failure, True when done"""
+        portal = self.portal
+        if portal.drop_rate and random.random() < portal.drop_rate:
+            portal.count('dropped')
+            self.close_connection = True
+            return True
+        if portal.fail_rate and random.random() < portal.fail_rate:
+            self.send(503, PAGE.format('Service Unavailable'), 'failed')
+            return True
+        return False
+
+    def do_GET(self):
+        time.sleep(self.portal.latency)
+        if self.injected():
+            return
+        path = urllib.parse.urlsplit(self.path).path
+        if path in ('/', PORTAL_PATH):
+            state = self.portal.scripted(self.client_address[0])
+            if state == 'error':
+                self.send(500, PAGE.format('Internal Server Error'), 'portal')
+            else:
+                self.send(200, self.page(state=state), 'portal')
+        elif path == CONNECTIVITY_PATH:
+            with self.portal.lock:
+                logged_in = self.client_address[0] in self.portal.sessions
+            mode = self.portal.connectivity
+            if logged_in and mode == 'body':
+                self.send(200, CONNECTIVITY_BODY, 'connectivity', content_type='text/plain; charset=utf-8')
+            elif logged_in:
+                self.send(204, '', 'connectivity')
+            elif mode == 'intercept':
+                self.send(200, INTERCEPT_PAGE.format(href=PORTAL_PATH), 'connectivity')
+            else:
+                self.redirect(PORTAL_PATH, 'connectivity')
+        elif path == REGAIN_PATH:
+            with self.portal.lock:
+                self.portal.seen.add(self.client_address[0])
+            self.redirect(PORTAL_PATH, 'regain')
+        else:
+            self.send(404, PAGE.format('Not Found'), 'unknown')
+
+    def do_POST(self):
+        time.sleep(self.portal.latency)
+        portal = self.portal
+        path = urllib.parse.urlsplit(self.path).path
+        form = self.read_form()
+        if self.injected():
+            return
+        client = self.client_address[0]
+        if path == LOGIN_PATH:
+            username = form.get('userName', '')
+            if not portal.check(username, form.get('userPass', '')):
+                return self.send(200, self.page(BAD_CREDENTIALS), 'login')
+            with portal.lock:
+                portal.sessions[client] = username
+                portal.seen.add(client)
+            self.redirect(PORTAL_PATH, 'login')
+        elif path == LOGOFF_PATH:
+            with portal.lock:
+                portal.sessions.pop(client, None)
+            self.redirect(PORTAL_PATH, 'logoff')
+        else:
+            self.send(404, PAGE.format('Not Found'), 'unknown')
+
+
+def parse_script(text):
+    """States of a comma separated script, None when one is unknown"""
+    script = [state.strip() for state in text.split(',') if state.strip()]
+    return script if all(state in STATES for state in script) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Check Point UserCheck portal')
+    parser.add_argument('-p', action='store', dest='port', type=int, default=8081, help='Http port')
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0.0,
+                        help='Request latency, sec')
+    parser.add_argument('--regain', action='store_true', dest='regain', help='Show "regain access" to new clients')
+    parser.add_argument('--script', action='store', dest='script', type=str, default='',
+                        help='Comma separated states served first: ' + ', '.join(STATES))
+    parser.add_argument('--render-delay', action='store', dest='render_delay', type=float, default=0.5,
+                        help='Delay of the late login form, sec')
+    parser.add_argument('--fail', action='store', dest='fail', type=float, default=0.0, help='503 rate')
+    parser.add_argument('--drop', action='store', dest='drop', type=float, default=0.0, help='Dropped request rate')
+    parser.add_argument('--connectivity', action='store', dest='connectivity', type=str, default='204',
+                        choices=CONNECTIVITY_MODES, help='Answer of the connectivity check address')
+    parser.add_argument('-u', action='append', dest='users', type=str, help='USER:PASSWORD, anybody without it')
+    args = parser.parse_args()
+
+    script = parse_script(args.script)
+    if script is None:
+        parser.error(f'unknown state in script: {args.script}')
+    users = dict(user.split(':', 1) for user in args.users) if args.users else None
+    portal = FakePortal(
+        users=users, latency=args.latency, regain=args.regain, script=script, render_delay=args.render_delay,
+        fail_rate=args.fail, drop_rate=args.drop, connectivity=args.connectivity, port=args.port,
+    ).start()
+    print(f'Portal: {portal.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        portal.stop()
+
+
+if __name__ == '__main__':
+    main()
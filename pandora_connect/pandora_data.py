@@ -2,6 +2,8 @@ import subprocess
 import os
 import json
 
+import spans
+
 
 CURRENT = os.getcwd()
 CONFIG_FILE = CURRENT + '/config.json'
@@ -24,19 +26,33 @@ ICON = CURRENT + '/' + MAIN_CONFIG['icon']
 INC_LIST = CURRENT + '/' + MAIN_CONFIG['include_list']
 CP_ADDRESS = MAIN_CONFIG['cp_address']
 FIREFOX_PROFILE = MAIN_CONFIG['firefox_profile']
+PORTAL_HTTP = bool(MAIN_CONFIG.get('portal_http', True))    # plain HTTP portal login, the browser as fallback
+CP_CA_FILE = MAIN_CONFIG.get('cp_ca_file', '')
+CONNECTIVITY_CHECK = bool(MAIN_CONFIG.get('connectivity_check', True))   # no login when let through already
+CONNECTIVITY_URL = MAIN_CONFIG.get('connectivity_url', '')     # the portal page is asked without it
+CONNECTIVITY_BODY = MAIN_CONFIG.get('connectivity_body')   # exact 200 body when let through, only 204 without it
+PROBE_TIMEOUT = float(MAIN_CONFIG.get('probe_timeout', 2))
+LEAN_PROFILE = bool(MAIN_CONFIG.get('lean_profile', True))  # portal cookies and certificates, not the whole profile
 PROFILE_LOCAL = MAIN_CONFIG['profile_local']
 DOWNLOADS_LOCAL = MAIN_CONFIG['downloads_local']
 PROFILE_SERVER = MAIN_CONFIG['profile_server']
 DOWNLOADS_SERVER = MAIN_CONFIG['downloads_server']
 PRE_SHUTDOWN_FILE = MAIN_CONFIG['pre_shutdown_file']
 PRE_SHUTDOWN_SERVICE = MAIN_CONFIG['pre_shutdown_service']
+TRACE = bool(MAIN_CONFIG.get('trace', True))
+TRACE_FILE = MAIN_CONFIG.get('trace_file', '/tmp/pandora_trace.json')
+SESSIONS_LOG = CURRENT + '/' + MAIN_CONFIG.get('sessions_log', 'sessions.log')
+
+spans.TRACER.enabled = TRACE
 
 
 def own_sync(username, password):
     cmd_own_profile = ['owncloudcmd', '-s', '-u', username, '-p', password, PROFILE_LOCAL, PROFILE_SERVER]
-    code_own = subprocess.call(cmd_own_profile)
+    with spans.span('owncloudcmd'):
+        code_own = subprocess.call(cmd_own_profile)
     cmd_rsync_in = ['rsync', '-qlpgor', PROFILE_LOCAL, FIREFOX_PROFILE]
-    code_rsync = subprocess.call(cmd_rsync_in)
+    with spans.span('rsync'):
+        code_rsync = subprocess.call(cmd_rsync_in)
     if code_own == 0 and code_rsync == 0:
         return 1
     else:
@@ -71,10 +87,23 @@ def start_files_create(username, password):
 def stop():
     cmd_cron_del = 'systemctl --user stop "*.timer"'
     subprocess.call(cmd_cron_del, shell=True)
-    subprocess.call(CRON_SYNC)
+    with spans.span('stop_sync'):
+        subprocess.call(CRON_SYNC)
     return 1
 
 
+def finish_trace(session, status):
+    if not spans.TRACER.enabled:
+        return
+    try:
+        spans.TRACER.write_trace(TRACE_FILE)
+        line = spans.TRACER.write_summary(SESSIONS_LOG, session=session, status=status)
+    except OSError as error:
+        print(f'Write trace error: {error}')
+    else:
+        print(line)
+
+
 def shutdown():
     cmd = 'sleep 1 && sudo shutdown'
     subprocess.Popen(cmd, shell=True)
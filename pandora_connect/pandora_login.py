@@ -2,7 +2,9 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from functools import partial
 
 from web_login import CPLogin
+from portal_http import HttpLogin, probe, AUTHENTICATED
 import pandora_data as data
+import spans
 
 
 CONNECTION_STATUS = {
@@ -24,15 +26,34 @@ class ThreadConnect(QtCore.QThread):
         self.status = 0
 
     def run(self):
+        self.status = 0
+        if self.target and data.CONNECTIVITY_CHECK:
+            state = probe(
+                data.CP_ADDRESS, data.CONNECTIVITY_URL, data.PROBE_TIMEOUT, data.CP_CA_FILE, data.CONNECTIVITY_BODY)
+            if state == AUTHENTICATED:
+                self.status = 1     # the gateway session of this machine is still valid
+        if not self.status and data.PORTAL_HTTP:
+            http_login = HttpLogin(
+                address=data.CP_ADDRESS,
+                username=self.username,
+                password=self.password,
+                ca_file=data.CP_CA_FILE)
+            self.status = http_login.login() if self.target else http_login.logoff()
+        if self.status:
+            self.signal.emit(self.status)
+            return
+
+        # the page needs a browser or the portal did not answer over http
         if self.target:
             login = CPLogin(
                 address=data.CP_ADDRESS,
                 username=self.username,
                 password=self.password,
-                profile_dir=data.FIREFOX_PROFILE)
+                profile_dir=data.FIREFOX_PROFILE,
+                lean=data.LEAN_PROFILE)
             self.status = login.login()
         else:
-            logoff = CPLogin(address=data.CP_ADDRESS, profile_dir=data.FIREFOX_PROFILE)
+            logoff = CPLogin(address=data.CP_ADDRESS, profile_dir=data.FIREFOX_PROFILE, lean=data.LEAN_PROFILE)
             self.status = logoff.logoff()
         self.signal.emit(self.status)
 
@@ -183,6 +204,7 @@ class LoginWindow(QtWidgets.QWidget):
         if self.username:
             if self.password:
                 self.display_waiting()
+                spans.TRACER.reset()
 
                 self.thread_login.username = self.username
                 self.thread_login.password = self.password
@@ -218,6 +240,7 @@ class LoginWindow(QtWidgets.QWidget):
             self.run_browser()
 
     def run_browser(self):
+        data.finish_trace('login', self.status_login)
         if self.status_login == 1:
             data.start_files_create(self.username, self.password)
             data.before_shutdown()
@@ -242,6 +265,7 @@ class LoginWindow(QtWidgets.QWidget):
         self.waiting_text.setText(data.QT_CONF['wait_logoff_text'])
         self.waiting_cancel.setDisabled(True)
         self.display_waiting()
+        spans.TRACER.reset()
 
         self.thread_sync.partial_function = partial(data.stop)
 
@@ -256,6 +280,7 @@ class LoginWindow(QtWidgets.QWidget):
         if signal:
             self.status_login = signal
         if self.status_sync:
+            data.finish_trace('logoff', self.status_login)
             self.on_cancel_clicked()
 
     @QtCore.pyqtSlot(int)
@@ -263,6 +288,7 @@ class LoginWindow(QtWidgets.QWidget):
         if signal:
             self.status_sync = signal
         if self.status_login:
+            data.finish_trace('logoff', self.status_login)
             self.on_cancel_clicked()
 
     def event(self, e):
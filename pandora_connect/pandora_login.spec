@@ -1,5 +1,13 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(SPECPATH))
+import check_shared
+
+check_shared.check()
+
 block_cipher = None
 
 
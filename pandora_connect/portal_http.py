@@ -0,0 +1,276 @@
+"""
+Check Point UserCheck portal login over plain HTTP, without a browser.
+The portal page is parsed for the elements web_login.CPLogin looks for; the login form is posted with
+the credentials and the answer page tells the state: logged in (logoff button), bad credentials (error span
+next to the login button) or "regain access" (portal_link). Status as CPLogin: 1 ok, 2 bad credentials;
+0 - the page could not be handled without a browser (no form, script only pages, certificate not trusted)
+or the portal did not answer after RETRIES more attempts, the caller falls back to CPLogin, which gives 3
+when the portal is unreachable.
+probe() tells with one request whether the machine is let through already, then no login is needed;
+only a clear answer counts: a 204 or the exact expected body of the connectivity check address.
+"""
+
+import re
+import ssl
+import time
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+import spans
+
+
+TIMEOUT = 10        # one request, sec
+STEPS = 6           # pages per login, like CPLogin
+RETRIES = 2         # more attempts after a transport error or a 5xx answer
+RETRY_DELAY = 1     # sec
+LOGIN_BUTTON = 'UserCheck_Login_Button_span'
+LOGOFF_BUTTON = 'UserCheck_Logoff_Button_span'
+USERNAME_FIELD = 'LoginUserPassword_auth_username'
+PASSWORD_FIELD = 'LoginUserPassword_auth_password'
+ERROR_SPAN = 'LoginUserPassword_error_message'
+PORTAL_LINK = 'portal_link'
+PROBE_TIMEOUT = 2    # sec
+PROBE_BYTES = 65536
+# probe answers
+AUTHENTICATED = 'authenticated'
+PORTAL = 'portal'
+UNREACHABLE = 'unreachable'
+UNKNOWN = 'unknown'     # an answer that proves nothing (intercept pages, errors), the login goes on
+VOID_TAGS = ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr')
+
+
+class PortalPage(HTMLParser):
+    """Forms, the portal elements by id with their form or link, texts of the error span and portal links"""
+
+    def __init__(self, url, html):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.url = url
+        self.forms = []         # {'action', 'method', 'inputs': {name: value}}
+        self.elements = {}      # id: {'tag', 'name', 'form': form index, 'link': href, 'text'}
+        self.links = []         # portal links: {'href', 'text'}
+        self.form = None
+        self.stack = []         # open tags: (tag, element id, portal link index, href)
+        self.feed(html)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or '' for key, value in attrs}
+        if tag == 'form':
+            self.forms.append({
+                'action': urllib.parse.urljoin(self.url, attrs.get('action') or self.url),
+                'method': attrs.get('method', 'get').lower(),
+                'inputs': {},
+            })
+            self.form = len(self.forms) - 1
+        if tag == 'input' and self.form is not None and attrs.get('name'):
+            self.forms[self.form]['inputs'][attrs['name']] = attrs.get('value', '')
+
+        href = urllib.parse.urljoin(self.url, attrs['href']) if tag == 'a' and attrs.get('href') else None
+        link = None
+        if PORTAL_LINK in attrs.get('class', '').split():
+            self.links.append({'href': href or self.open_link(), 'text': ''})
+            link = len(self.links) - 1
+        element_id = attrs.get('id')
+        if element_id:
+            self.elements[element_id] = {
+                'tag': tag, 'name': attrs.get('name') or element_id, 'form': self.form,
+                'link': href or self.open_link(), 'text': '',
+            }
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, element_id, link, href))
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self.form = None
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                del self.stack[index:]
+                break
+
+    def handle_data(self, data):
+        for _, element_id, link, _ in self.stack:
+            if element_id:
+                self.elements[element_id]['text'] += data
+            if link is not None:
+                self.links[link]['text'] += data
+
+    def open_link(self):
+        for _, _, _, href in reversed(self.stack):
+            if href:
+                return href
+        return None
+
+    def has(self, element_id):
+        return element_id in self.elements
+
+    def text(self, element_id):
+        return self.elements.get(element_id, {}).get('text', '').strip()
+
+
+class HttpLogin:
+    def __init__(self, address, username='', password='', ca_file='', timeout=TIMEOUT):
+        self.address = address
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.status = 0
+        handlers = [urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())]
+        if address.startswith('https:'):
+            # loading the system certificates takes tens of ms, only for https portals
+            handlers.append(urllib.request.HTTPSHandler(context=ssl.create_default_context(cafile=ca_file or None)))
+        self.opener = urllib.request.build_opener(*handlers)
+
+    def open(self, url, data=None):
+        request = urllib.request.Request(url, data=urllib.parse.urlencode(data).encode() if data is not None else None)
+        with self.opener.open(request, timeout=self.timeout) as answer:
+            charset = answer.headers.get_content_charset() or 'utf-8'
+            return PortalPage(answer.geturl(), answer.read().decode(charset, errors='replace'))
+
+    def submit(self, page, element_id, fields=None):
+        """What a click on the element does without scripts: post its form or follow its link"""
+        element = page.elements[element_id]
+        if element['form'] is not None:
+            form = page.forms[element['form']]
+            data = dict(form['inputs'], **(fields or {}))
+            if form['method'] == 'post':
+                return self.open(form['action'], data)
+            return self.open(form['action'] + '?' + urllib.parse.urlencode(data))
+        if element['link']:
+            return self.open(element['link'])
+        return None
+
+    def login(self, username='', password=''):
+        with spans.span('portal_login', client='http'):
+            self.status = self.request(self.portal_login, username, password)
+        return self.status
+
+    def logoff(self):
+        with spans.span('portal_logoff', client='http'):
+            self.status = self.request(self.portal_logoff)
+        return self.status
+
+    def request(self, function, *args):
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_DELAY)
+            try:
+                return function(*args)
+            except ssl.SSLError as e:
+                print(f'Portal certificate error, trying the browser: {e}')
+                return 0
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    print(f'Portal error, trying the browser: {e}')
+                    return 0
+                print(f'Portal error, attempt {attempt + 1}: {e}')
+            except urllib.error.URLError as e:
+                if isinstance(e.reason, ssl.SSLError):
+                    print(f'Portal certificate error, trying the browser: {e.reason}')
+                    return 0
+                print(f'Portal error, attempt {attempt + 1}: {e}')
+            except OSError as e:
+                print(f'Portal error, attempt {attempt + 1}: {e}')
+        print('Portal does not answer, trying the browser')
+        return 0
+
+    def portal_login(self, username, password):
+        if username:
+            self.username = username
+        if password:
+            self.password = password
+        if not self.username or not self.password:
+            return 2
+
+        with spans.span('open_page', client='http'):
+            page = self.open(self.address)
+        submitted = False
+        for _ in range(STEPS):
+            if page is None:
+                return 0
+            if page.has(LOGIN_BUTTON):     # before the logoff button, like CPLogin.read_state
+                if re.search('bad.*credential', page.text(ERROR_SPAN), re.IGNORECASE):
+                    return 2
+                if submitted or not page.has(USERNAME_FIELD) or not page.has(PASSWORD_FIELD):
+                    return 0    # the form does not work without scripts
+                fields = {
+                    page.elements[USERNAME_FIELD]['name']: self.username,
+                    page.elements[PASSWORD_FIELD]['name']: self.password,
+                }
+                page = self.submit(page, LOGIN_BUTTON, fields)
+                submitted = True
+                continue
+            if page.has(LOGOFF_BUTTON):
+                return 1
+            links = [link for link in page.links if re.search('regain.*access', link['text'], re.IGNORECASE)]
+            if links and links[0]['href']:
+                page = self.open(links[0]['href'])
+                submitted = False
+                continue
+            return 0
+        return 0
+
+    def portal_logoff(self):
+        page = self.open(self.address)
+        if page.has(LOGOFF_BUTTON):
+            page = self.submit(page, LOGOFF_BUTTON)
+            if page is None or page.has(LOGOFF_BUTTON):
+                return 0
+        elif not page.has(LOGIN_BUTTON):
+            return 0
+        return 1
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """A redirect is the answer of the probe, not something to follow"""
+
+    def redirect_request(self, request, fp, code, msg, headers, new_url):
+        return None
+
+
+def probe(address, url='', timeout=PROBE_TIMEOUT, ca_file='', body=None):
+    """
+    One request with a short timeout: is this machine let through the gateway already.
+    url - a connectivity check address: AUTHENTICATED only for a 204 or, when body is given, a 200 with exactly
+    this body; a redirect is the portal. Captive and intercept pages (meta refresh, script or renamed pages)
+    are UNKNOWN, never a reason to skip the login.
+    Without url the portal page at address is asked: the logoff button without the login button is AUTHENTICATED.
+    """
+    target = url or address
+    handlers = [NoRedirect()]
+    if target.startswith('https:'):
+        handlers.append(urllib.request.HTTPSHandler(context=ssl.create_default_context(cafile=ca_file or None)))
+    opener = urllib.request.build_opener(*handlers)
+
+    with spans.span('probe'):
+        try:
+            with opener.open(target, timeout=timeout) as answer:
+                code = answer.status
+                charset = answer.headers.get_content_charset() or 'utf-8'
+                text = answer.read(PROBE_BYTES).decode(charset, errors='replace')
+        except urllib.error.HTTPError as e:
+            code, text = e.code, ''     # a redirect to the portal or an error page of the gateway
+        except (OSError, ssl.SSLError) as e:
+            print(f'Probe {target} error: {e}')
+            return UNREACHABLE
+
+    if 300 <= code < 400:
+        state = PORTAL
+    elif code == 204 and url:
+        state = AUTHENTICATED
+    elif code == 200 and url and body is not None and text == body:
+        state = AUTHENTICATED
+    elif code == 200:
+        page = PortalPage(target, text)
+        if page.has(LOGIN_BUTTON) or page.links:
+            state = PORTAL
+        elif page.has(LOGOFF_BUTTON) and not url:
+            state = AUTHENTICATED
+        else:
+            state = UNKNOWN
+    else:
+        state = UNKNOWN
+    print(f'Probe {target}: {code} {state}')
+    return state
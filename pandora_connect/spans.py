@@ -0,0 +1,106 @@
+"""
+Stage timing spans. The same file is in login_sdk and pandora_connect, check_shared.py keeps the copies equal.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """
+    Stage timings of one session.
+    Spans are saved as chrome trace events (chrome://tracing, ui.perfetto.dev)
+    and as a one-line summary with the total duration of every stage.
+    A disabled tracer hands out one shared no-op span.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.events = []
+            self.durations = {}
+            self.origin = time.perf_counter()
+            self.started = time.time()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def add(self, name, start, end, args):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': round((start - self.origin) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            self.durations[name] = self.durations.get(name, 0) + end - start
+
+    def summary(self, **fields):
+        started = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))
+        items = [f'{key}={value}' for key, value in fields.items()]
+        with self.lock:
+            items += [f'{name}={duration:.3f}' for name, duration in self.durations.items()]
+        return f'{started} ' + ' '.join(items)
+
+    def write_trace(self, file_name):
+        with self.lock:
+            trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+        with open(file_name, 'w') as file:
+            json.dump(trace, file)
+
+    def write_summary(self, file_name, **fields):
+        line = self.summary(**fields)
+        with open(file_name, 'a') as file:
+            file.write(line + '\n')
+        return line
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.add(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+TRACER = Tracer(enabled=False)
+
+
+def span(name, **args):
+    return TRACER.span(name, **args)
@@ -2,45 +2,175 @@
 
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support.expected_conditions import element_to_be_clickable, staleness_of
 from selenium.common.exceptions import \
     NoSuchElementException, \
     InvalidElementStateException,\
     NoSuchWindowException, \
     WebDriverException, \
-    ElementNotInteractableException
-import time
+    ElementNotInteractableException, \
+    StaleElementReferenceException, \
+    TimeoutException
 import re
+import os
 import sys
+import shutil
 import argparse
 
+import spans
+
+
+# all the portal needs from the user profile: its session cookies and the accepted gateway certificate
+PORTAL_FILES = ('cookies.sqlite', 'cookies.sqlite-wal', 'cert_override.txt', 'cert9.db')
+# the portal page is a form: no images, fonts, media, prefetch or background services
+LEAN_PREFERENCES = {
+    'permissions.default.image': 2,
+    'gfx.downloadable_fonts.enabled': False,
+    'browser.display.use_document_fonts': 0,
+    'media.autoplay.default': 5,
+    'media.autoplay.blocking_policy': 2,
+    'browser.cache.disk.enable': False,
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'browser.shell.checkDefaultBrowser': False,
+    'app.update.enabled': False,
+    'extensions.update.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'toolkit.telemetry.enabled': False,
+}
+
+
+def new_profile(profile_dir='', lean=True):
+    """
+    Profile of the portal session.
+    lean - a fresh profile with PORTAL_FILES of profile_dir and LEAN_PREFERENCES,
+    otherwise selenium copies (and zips for geckodriver) the whole profile_dir; None - the geckodriver default
+    """
+    if not lean:
+        return webdriver.FirefoxProfile(profile_directory=profile_dir) if profile_dir else None
+    profile = webdriver.FirefoxProfile()
+    if profile_dir:
+        for name in PORTAL_FILES:
+            source = os.path.join(profile_dir, name)
+            if os.path.isfile(source):
+                shutil.copy2(source, profile.path)
+    for key, value in LEAN_PREFERENCES.items():
+        profile.set_preference(key, value)
+    return profile
+
+
+# portal states, one css query finds the elements of all of them
+LOGIN_FORM = 'login_form'
+BAD_CREDENTIALS = 'bad_credentials'
+LOGGED_IN = 'logged_in'
+REGAIN_ACCESS = 'regain_access'
+UNKNOWN = 'unknown'
+
+LOGIN_BUTTON = 'UserCheck_Login_Button_span'
+LOGOFF_BUTTON = 'UserCheck_Logoff_Button_span'
+USERNAME_FIELD = 'LoginUserPassword_auth_username'
+PASSWORD_FIELD = 'LoginUserPassword_auth_password'
+ERROR_SPAN = 'LoginUserPassword_error_message'
+PORTAL_LINK = 'portal_link'
+STATE_QUERY = f'#{LOGIN_BUTTON}, #{LOGOFF_BUTTON}, #{ERROR_SPAN}, .{PORTAL_LINK}'
+STATE_SCRIPT = f"return Array.from(document.querySelectorAll('{STATE_QUERY}')).map(e => [e, e.id, e.innerText]);"
+
+# how long a state may take to show up, sec
+STATE_TIMEOUTS = {
+    'page': 5,          # a loaded page shows its state
+    LOGIN_FORM: 10,     # the answer to the credentials
+    REGAIN_ACCESS: 5,   # the login form after the portal link
+    LOGGED_IN: 5,       # the login form after log off
+}
+POLL = 0.1              # sec
+STEPS = 6
+
 
 class CPLogin(webdriver.Firefox):
-    def __init__(self, address, username='', password='', profile_dir=''):
+    """
+    The portal flow as a state machine: login form, bad credentials, logged in, regain access, unknown.
+    The state is read with one script query of the DOM, without implicit waits; every action waits for its page
+    to change (WebDriverWait) up to the deadline of the state it leaves.
+    """
+
+    def __init__(self, address, username='', password='', profile_dir='', lean=True):
         options = Options()
         options.headless = True
-        if profile_dir:
-            profile = webdriver.FirefoxProfile(profile_directory=profile_dir)
-            webdriver.Firefox.__init__(self, firefox_profile=profile, options=options)
-        else:
-            webdriver.Firefox.__init__(self, options=options)
+        with spans.span('browser_start', lean=lean):
+            profile = new_profile(profile_dir, lean)
+            if profile:
+                webdriver.Firefox.__init__(self, firefox_profile=profile, options=options)
+            else:
+                webdriver.Firefox.__init__(self, options=options)
+        self.implicitly_wait(0)
         self.status = 0
         self.address = address
         self.username = username
         self.password = password
-        self.login_button = None
-        self.logoff_button = None
-        self.username_field = None
-        self.password_field = None
-        self.error_span = None
-        self.error_text = ''
-        self.re_access_span = None
+        self.state = UNKNOWN
+        self.elements = {}      # id or class of the state elements: element
 
     def open_page(self):
         print(self.address)
-        self.get(self.address)
-        self.implicitly_wait(5)
+        with spans.span('open_page'):
+            self.get(self.address)
+
+    def read_state(self):
+        """Current state from one query of the state elements"""
+        self.elements = {}
+        texts = {}
+        try:
+            found = self.execute_script(STATE_SCRIPT)
+        except WebDriverException:
+            return UNKNOWN      # the page is being replaced
+        for element, element_id, text in found or []:
+            key = element_id if element_id in (LOGIN_BUTTON, LOGOFF_BUTTON, ERROR_SPAN) else PORTAL_LINK
+            if key == PORTAL_LINK and not re.search('regain.*access', text or '', re.IGNORECASE):
+                continue
+            self.elements.setdefault(key, element)
+            texts.setdefault(key, text or '')
+        # the login button first, like the portal flow always did: a page may keep a hidden logoff button
+        if LOGIN_BUTTON in self.elements:
+            if re.search('bad.*credential', texts.get(ERROR_SPAN, ''), re.IGNORECASE):
+                return BAD_CREDENTIALS
+            return LOGIN_FORM
+        if LOGOFF_BUTTON in self.elements:
+            return LOGGED_IN
+        if PORTAL_LINK in self.elements:
+            return REGAIN_ACCESS
+        return UNKNOWN
+
+    def wait_state(self, timeout, changed=None):
+        """
+        Wait for a known state, or with changed (an element of the page left) for the next page:
+        the element gone or another known state. UNKNOWN at the deadline.
+        """
+        def ready(driver):
+            state = self.read_state()
+            if state == UNKNOWN:
+                return False
+            if changed is not None and state == self.state and not staleness_of(changed)(driver):
+                return False
+            return state
+
+        with spans.span('wait_state', after=self.state):
+            try:
+                self.state = WebDriverWait(self, timeout, poll_frequency=POLL).until(ready)
+            except TimeoutException:
+                self.state = UNKNOWN
+        print(f'Portal state: {self.state}')
+        return self.state
 
     def login(self, username='', password=''):
+        with spans.span('portal_login'):
+            return self.portal_login(username, password)
+
+    def portal_login(self, username, password):
         self.open_page()
         if username:
             self.username = username
@@ -51,106 +181,58 @@ class CPLogin(webdriver.Firefox):
             self.quit()
             return self.status
 
-        for i in range(6):
-            self.find_logoff_button()
-            self.find_login_button()
-
-            if self.login_button:
-                self.find_error_span()
-                if re.search('bad.*credential', self.error_text, re.IGNORECASE):
-                    self.status = 2
-                    self.quit()
-                    return self.status
-                self.connect()
-            elif self.logoff_button:
-                self.status = 1
-                self.quit()
-                return self.status
-            else:
-                self.status = 3
-                unknown = True
-                self.find_re_access_span()
-                if self.re_access_span:
-                    for span in self.re_access_span:
-                        if re.search('regain.*access', span.text, re.IGNORECASE):
-                            unknown = False
-                            self.re_access_span.click()
-                if unknown:
+        self.wait_state(STATE_TIMEOUTS['page'])
+        for _ in range(STEPS):
+            if self.state in (LOGGED_IN, BAD_CREDENTIALS):
+                break
+            if self.state == LOGIN_FORM:
+                button = self.elements[LOGIN_BUTTON]
+                if self.connect():
+                    self.wait_state(STATE_TIMEOUTS[LOGIN_FORM], changed=button)
+                else:
                     self.open_page()
+                    self.wait_state(STATE_TIMEOUTS['page'])
+            elif self.state == REGAIN_ACCESS:
+                link = self.elements[PORTAL_LINK]
+                link.click()
+                self.wait_state(STATE_TIMEOUTS[REGAIN_ACCESS], changed=link)
+            else:
+                self.open_page()
+                self.wait_state(STATE_TIMEOUTS['page'])
 
+        # from the state, also when the last step reached it
+        self.status = {LOGGED_IN: 1, BAD_CREDENTIALS: 2}.get(self.state, 3)
         self.quit()
         return self.status
 
-    def find_login_button(self):
-        try:
-            self.login_button = self.find_element_by_id('UserCheck_Login_Button_span')
-        except NoSuchElementException:
-            self.login_button = None
-
-    def find_logoff_button(self):
-        try:
-            self.logoff_button = self.find_element_by_id('UserCheck_Logoff_Button_span')
-        except NoSuchElementException:
-            self.logoff_button = None
-
-    def find_username_field(self):
+    def fill(self, field_id, text):
+        field = self.find_element_by_id(field_id)
         try:
-            self.username_field = self.find_element_by_id('LoginUserPassword_auth_username')
-            try:
-                self.username_field.clear()
-            except InvalidElementStateException:
-                pass
-        except NoSuchElementException:
-            self.username_field = None
-
-    def find_password_field(self):
-        try:
-            self.password_field = self.find_element_by_id('LoginUserPassword_auth_password')
-            try:
-                self.password_field.clear()
-            except InvalidElementStateException:
-                pass
-        except NoSuchElementException:
-            self.password_field = None
-
-    def find_error_span(self):
-        try:
-            self.error_span = self.find_element_by_id('LoginUserPassword_error_message')
-        except NoSuchElementException:
-            self.error_span = None
-        if self.error_span:
-            self.error_text = self.error_span.text.strip()
-        else:
-            self.error_text = ''
-
-    def find_re_access_span(self):
-        try:
-            self.re_access_span = self.find_element_by_class_name('portal_link')
-        except NoSuchElementException:
-            self.re_access_span = None
+            field.clear()
+        except InvalidElementStateException:
+            pass
+        field.send_keys(text)
 
     def connect(self):
-        self.find_username_field()
-        self.find_password_field()
+        """Fill the form and click the login button once it can be clicked, False when the form does not work"""
         try:
-            self.username_field.send_keys(self.username)
-            self.password_field.send_keys(self.password)
-        except ElementNotInteractableException:
-            self.open_page()
-        else:
-            time.sleep(1)
-            self.login_button.click()
+            self.fill(USERNAME_FIELD, self.username)
+            self.fill(PASSWORD_FIELD, self.password)
+            WebDriverWait(self, STATE_TIMEOUTS['page'], poll_frequency=POLL).until(
+                element_to_be_clickable((By.ID, LOGIN_BUTTON))).click()
+        except (NoSuchElementException, ElementNotInteractableException, StaleElementReferenceException,
+                TimeoutException):
+            return False
+        return True
 
     def logoff(self):
-        self.get(self.address)
-        self.implicitly_wait(5)
-
-        self.find_logoff_button()
-        if self.logoff_button:
-            self.logoff_button.click()
-        time.sleep(1)
-        self.quit()
-        time.sleep(1)
+        with spans.span('portal_logoff'):
+            self.open_page()
+            if self.wait_state(STATE_TIMEOUTS['page']) == LOGGED_IN:
+                button = self.elements[LOGOFF_BUTTON]
+                button.click()
+                self.wait_state(STATE_TIMEOUTS[LOGGED_IN], changed=button)
+            self.quit()
         return 1
 
 
@@ -162,20 +244,23 @@ def main():
     parser.add_argument('-p', action='store', dest='password', type=str, help='Domain password')
     parser.add_argument('-d', action='store_true', dest='disconnect', help='Disconnect')
     parser.add_argument('-f', action='store', dest='profile', type=str, help='Firefox profile directory')
+    parser.add_argument('--full-profile', action='store_true', dest='full_profile',
+                        help='Copy the whole profile, not only the portal cookies and certificates')
     args = parser.parse_args()
 
     profile_dir = ''
     if args.profile:
         profile_dir = args.profile
     if args.address and args.connect and args.name and args.password and not args.disconnect:
-        login = CPLogin(address=args.address, username=args.name, password=args.password, profile_dir=profile_dir)
+        login = CPLogin(address=args.address, username=args.name, password=args.password, profile_dir=profile_dir,
+                        lean=not args.full_profile)
         try:
             status = login.login()
         except (NoSuchWindowException, WebDriverException):
             status = 3
         sys.exit(status)
     elif args.address and args.disconnect:
-        logoff = CPLogin(address=args.address, profile_dir=profile_dir)
+        logoff = CPLogin(address=args.address, profile_dir=profile_dir, lean=not args.full_profile)
         logoff.logoff()
     else:
         parser.print_help()